@@ -28,6 +28,7 @@ import webob.exc
 
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
+from nova.db import query_stats
 from nova import exception
 from nova import notifications
 from nova.openstack.common import gettextutils
@@ -117,10 +118,11 @@ class FaultWrapper(base_wsgi.Middleware):
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
-        try:
-            return req.get_response(self.application)
-        except Exception as ex:
-            return self._error(ex, req)
+        with query_stats.scope('api %s %s' % (req.method, req.path)):
+            try:
+                return req.get_response(self.application)
+            except Exception as ex:
+                return self._error(ex, req)
 
 
 class APIMapper(routes.Mapper):
@@ -22,6 +22,7 @@ from webob import exc
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import flavors
 from nova import db
 from nova import exception
 from nova.openstack.common.gettextutils import _
@@ -76,6 +77,8 @@ class FlavorExtraSpecsController(object):
                                                               specs)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.notify_flavor_change(context, 'extra_specs.update',
+                                     {'flavorid': flavor_id})
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -95,6 +98,8 @@ class FlavorExtraSpecsController(object):
                                                                body)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.notify_flavor_change(context, 'extra_specs.update',
+                                     {'flavorid': flavor_id})
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -117,6 +122,8 @@ class FlavorExtraSpecsController(object):
             db.flavor_extra_specs_delete(context, flavor_id, id)
         except exception.FlavorExtraSpecsNotFound as e:
             raise exc.HTTPNotFound(explanation=e.format_message())
+        flavors.notify_flavor_change(context, 'extra_specs.delete',
+                                     {'flavorid': flavor_id})
 
 
 class Flavorextraspecs(extensions.ExtensionDescriptor):
@@ -20,6 +20,7 @@ import webob
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import flavors
 from nova import db
 from nova import exception
 from nova.openstack.common.db import exception as db_exc
@@ -85,6 +86,8 @@ class FlavorExtraSpecsController(object):
             raise webob.exc.HTTPConflict(explanation=msg)
         except exception.FlavorNotFound as e:
             raise webob.exc.HTTPNotFound(explanation=e.format_message())
+        flavors.notify_flavor_change(context, 'extra_specs.update',
+                                     {'flavorid': flavor_id})
         return body
 
     @extensions.expected_errors((400, 404, 409))
@@ -107,6 +110,8 @@ class FlavorExtraSpecsController(object):
             raise webob.exc.HTTPConflict(explanation=msg)
         except exception.FlavorNotFound as e:
             raise webob.exc.HTTPNotFound(explanation=e.format_message())
+        flavors.notify_flavor_change(context, 'extra_specs.update',
+                                     {'flavorid': flavor_id})
         return body
 
     @extensions.expected_errors(404)
@@ -132,6 +137,8 @@ class FlavorExtraSpecsController(object):
             db.flavor_extra_specs_delete(context, flavor_id, id)
         except exception.FlavorExtraSpecsNotFound as e:
             raise webob.exc.HTTPNotFound(explanation=e.format_message())
+        flavors.notify_flavor_change(context, 'extra_specs.delete',
+                                     {'flavorid': flavor_id})
 
 
 class FlavorsExtraSpecs(extensions.V3APIExtensionBase):
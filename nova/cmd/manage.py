@@ -69,6 +69,7 @@ from nova.compute import flavors
 from nova import config
 from nova import context
 from nova import db
+from nova.db import archiver as db_archiver
 from nova.db import migration
 from nova import exception
 from nova.openstack.common import cliutils
@@ -903,6 +904,38 @@ class DbCommands(object):
         admin_context = context.get_admin_context()
         db.archive_deleted_rows(admin_context, max_rows)
 
+    @args('--rows_per_second', metavar='<number>',
+            help='Maximum number of deleted rows to archive per second')
+    @args('--chunk_size', metavar='<number>',
+            help='Number of deleted rows to archive per transaction')
+    @args('--once', action='store_true', dest='once', default=False,
+            help='Stop after one pass over all tables')
+    def online_archive(self, rows_per_second=None, chunk_size=None,
+                       once=False):
+        """Move deleted rows to shadow tables in small chunks, checkpointing
+        progress, for use against a live database.
+        """
+        try:
+            if rows_per_second is not None:
+                rows_per_second = int(rows_per_second)
+            if chunk_size is not None:
+                chunk_size = int(chunk_size)
+        except ValueError:
+            print(_("Must supply integer values"))
+            return(1)
+        if ((rows_per_second is not None and rows_per_second < 0) or
+                (chunk_size is not None and chunk_size < 1)):
+            print(_("Must supply positive values"))
+            return(1)
+        admin_context = context.get_admin_context()
+        archiver = db_archiver.OnlineArchiver(admin_context,
+                                              rows_per_second=rows_per_second,
+                                              chunk_size=chunk_size)
+        if once:
+            archiver.run_once()
+        else:
+            archiver.run_forever()
+
 
 class FlavorCommands(object):
     """Class for managing flavors.
@@ -1007,6 +1040,8 @@ class FlavorCommands(object):
                             ctxt,
                             inst_type["flavorid"],
                             ext_spec)
+            flavors.notify_flavor_change(ctxt, 'extra_specs.update',
+                                         {'flavorid': inst_type["flavorid"]})
             print((_("Key %(key)s set to %(value)s on instance "
                      "type %(name)s") %
                    {'key': key, 'value': value, 'name': name}))
@@ -1029,6 +1064,8 @@ class FlavorCommands(object):
                         ctxt,
                         inst_type["flavorid"],
                         key)
+            flavors.notify_flavor_change(ctxt, 'extra_specs.delete',
+                                         {'flavorid': inst_type["flavorid"]})
 
             print((_("Key %(key)s on flavor %(name)s unset") %
                    {'key': key, 'name': name}))
@@ -1805,9 +1805,11 @@ class API(base.Base):
 
         fields = ['metadata', 'system_metadata', 'info_cache',
                   'security_groups']
-        return instance_obj.InstanceList.get_by_filters(
-            context, filters=filters, sort_key=sort_key, sort_dir=sort_dir,
-            limit=limit, marker=marker, expected_attrs=fields)
+        with self.db.stale_reads_allowed():
+            return instance_obj.InstanceList.get_by_filters(
+                context, filters=filters, sort_key=sort_key,
+                sort_dir=sort_dir, limit=limit, marker=marker,
+                expected_attrs=fields)
 
     @wrap_check_policy
     @check_instance_cell
@@ -2943,7 +2945,9 @@ class API(base.Base):
 
     def get_migrations(self, context, filters):
         """Get all migrations for the given filters."""
-        return migration_obj.MigrationList.get_by_filters(context, filters)
+        with self.db.stale_reads_allowed():
+            return migration_obj.MigrationList.get_by_filters(context,
+                                                              filters)
 
     @wrap_check_policy
     def volume_snapshot_create(self, context, volume_id, create_info):
@@ -3098,7 +3102,8 @@ class HostAPI(base.Base):
         return self.db.compute_node_get(context, int(compute_id))
 
     def compute_node_get_all(self, context):
-        return self.db.compute_node_get_all(context)
+        with self.db.stale_reads_allowed():
+            return self.db.compute_node_get_all(context)
 
     def compute_node_search_by_hypervisor(self, context, hypervisor_match):
         return self.db.compute_node_search_by_hypervisor(context,
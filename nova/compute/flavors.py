@@ -20,8 +20,10 @@
 
 """Built-in instance properties."""
 
+import copy
 import re
 import sys
+import time
 import uuid
 
 from oslo.config import cfg
@@ -30,6 +32,7 @@ import six
 from nova import context
 from nova import db
 from nova import exception
+from nova import notifier
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
@@ -44,6 +47,16 @@ flavor_opts = [
                default='m1.small',
                help='default flavor to use for the EC2 API only. The Nova API '
                'does not support a default flavor.'),
+    cfg.IntOpt('flavor_cache_ttl',
+               default=0,
+               help='Seconds flavors, their extra specs and access lists are '
+                    'cached in every process, 0 to disable the cache.  '
+                    'The cache is emptied when a flavor changes'),
+    cfg.IntOpt('flavor_cache_check_interval',
+               default=5,
+               help='Seconds between two checks of the database for flavor '
+                    'changes made by other processes, which empty the '
+                    'flavor cache.  Such changes may be seen that late'),
 ]
 
 CONF = cfg.CONF
@@ -63,6 +76,91 @@ def _int_or_none(val):
         return int(val)
 
 
+class FlavorCache(object):
+    """Process-local cache of flavor lookups, expired after flavor_cache_ttl
+    seconds.
+
+    It is emptied whenever this process changes a flavor, and when the
+    flavor generation in the database shows that another process did.  The
+    generation is read at most every flavor_cache_check_interval seconds,
+    so that cache hits do not query the database.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generation = None
+        self._checked_at = None
+        self._pruned_at = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_generation(self, ctxt, now):
+        if (self._checked_at is not None and
+                now - self._checked_at < CONF.flavor_cache_check_interval):
+            return
+        self._checked_at = now
+        generation = db.flavor_generation_get(ctxt)
+        if generation != self._generation:
+            if self._entries:
+                self.invalidate()
+            self._generation = generation
+
+    def _prune(self, now, ttl):
+        if self._pruned_at is not None and now - self._pruned_at < ttl:
+            return
+        for cache_key, entry in self._entries.items():
+            if now - entry[0] >= ttl:
+                del self._entries[cache_key]
+        self._pruned_at = now
+
+    def get(self, ctxt, kind, key, fetch):
+        ttl = CONF.flavor_cache_ttl
+        if not ttl:
+            return fetch()
+        now = time.time()
+        self._check_generation(ctxt, now)
+        self._prune(now, ttl)
+        # NOTE: Non-admin contexts only see the private flavors their
+        # project has access to, so they get their own entries.
+        cache_key = (kind, key, ctxt.read_deleted,
+                     None if ctxt.is_admin else ctxt.project_id)
+        entry = self._entries.get(cache_key)
+        if entry is not None and time.time() - entry[0] < ttl:
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+        self.misses += 1
+        value = fetch()
+        self._entries[cache_key] = (time.time(), copy.deepcopy(value))
+        return value
+
+    def invalidate(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries)}
+
+
+_CACHE = FlavorCache()
+
+
+def cache_stats():
+    """Return the hit, miss and invalidation counts of the flavor cache."""
+    return _CACHE.stats()
+
+
+def notify_flavor_change(ctxt, event_suffix, payload):
+    """Empty the flavor cache of this process after a flavor change, and
+    send a flavor.<event_suffix> notification about it.
+    """
+    _CACHE.invalidate()
+    notify = notifier.get_notifier(service='api')
+    notify.info(ctxt, 'flavor.%s' % event_suffix, payload)
+
+
 system_metadata_flavor_props = {
     'id': int,
     'name': str,
@@ -152,22 +250,27 @@ def create(name, memory, vcpus, root_gb, ephemeral_gb=0, flavorid=None,
     except ValueError:
         raise exception.InvalidInput(reason=_("is_public must be a boolean"))
 
+    ctxt = context.get_admin_context()
     try:
-        return db.flavor_create(context.get_admin_context(), kwargs)
+        flavor = db.flavor_create(ctxt, kwargs)
     except db_exc.DBError as e:
         LOG.exception(_('DB error: %s') % e)
         raise exception.FlavorCreateFailed()
+    notify_flavor_change(ctxt, 'create', {'flavorid': flavor['flavorid']})
+    return flavor
 
 
 def destroy(name):
     """Marks flavor as deleted."""
+    ctxt = context.get_admin_context()
     try:
         if not name:
             raise ValueError()
-        db.flavor_destroy(context.get_admin_context(), name)
+        db.flavor_destroy(ctxt, name)
     except (ValueError, exception.NotFound):
         LOG.exception(_('Instance type %s not found for deletion') % name)
         raise exception.FlavorNotFoundByName(flavor_name=name)
+    notify_flavor_change(ctxt, 'delete', {'name': name})
 
 
 def get_all_flavors(ctxt=None, inactive=False, filters=None):
@@ -218,7 +321,8 @@ def get_flavor(instance_type_id, ctxt=None, inactive=False):
     if inactive:
         ctxt = ctxt.elevated(read_deleted="yes")
 
-    return db.flavor_get(ctxt, instance_type_id)
+    return _CACHE.get(ctxt, 'id', instance_type_id,
+                      lambda: db.flavor_get(ctxt, instance_type_id))
 
 
 def get_flavor_by_name(name, ctxt=None):
@@ -229,7 +333,8 @@ def get_flavor_by_name(name, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.flavor_get_by_name(ctxt, name)
+    return _CACHE.get(ctxt, 'name', name,
+                      lambda: db.flavor_get_by_name(ctxt, name))
 
 
 # TODO(termie): flavor-specific code should probably be in the API that uses
@@ -242,7 +347,18 @@ def get_flavor_by_flavor_id(flavorid, ctxt=None, read_deleted="yes"):
     if ctxt is None:
         ctxt = context.get_admin_context(read_deleted=read_deleted)
 
-    return db.flavor_get_by_flavor_id(ctxt, flavorid, read_deleted)
+    return _CACHE.get(ctxt, 'flavorid', (flavorid, read_deleted),
+                      lambda: db.flavor_get_by_flavor_id(ctxt, flavorid,
+                                                         read_deleted))
+
+
+def get_flavor_extra_specs(flavorid, ctxt=None):
+    """Retrieve the extra specs of a flavor by flavorid."""
+    if ctxt is None:
+        ctxt = context.get_admin_context()
+
+    return _CACHE.get(ctxt, 'extra_specs', flavorid,
+                      lambda: db.flavor_extra_specs_get(ctxt, flavorid))
 
 
 def get_flavor_access_by_flavor_id(flavorid, ctxt=None):
@@ -250,7 +366,11 @@ def get_flavor_access_by_flavor_id(flavorid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.flavor_access_get_by_flavor_id(ctxt, flavorid)
+    def fetch():
+        return [dict(access.iteritems()) for access in
+                db.flavor_access_get_by_flavor_id(ctxt, flavorid)]
+
+    return _CACHE.get(ctxt, 'access', flavorid, fetch)
 
 
 def add_flavor_access(flavorid, projectid, ctxt=None):
@@ -258,7 +378,10 @@ def add_flavor_access(flavorid, projectid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.flavor_access_add(ctxt, flavorid, projectid)
+    access = db.flavor_access_add(ctxt, flavorid, projectid)
+    notify_flavor_change(ctxt, 'access.add',
+                         {'flavorid': flavorid, 'project_id': projectid})
+    return access
 
 
 def remove_flavor_access(flavorid, projectid, ctxt=None):
@@ -266,7 +389,9 @@ def remove_flavor_access(flavorid, projectid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.flavor_access_remove(ctxt, flavorid, projectid)
+    db.flavor_access_remove(ctxt, flavorid, projectid)
+    notify_flavor_change(ctxt, 'access.remove',
+                         {'flavorid': flavorid, 'project_id': projectid})
 
 
 def extract_flavor(instance, prefix=''):
@@ -0,0 +1,224 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Locks of the compute host, with metrics.
+
+Locks are taken by name, like 'compute_resources', and optionally by a key
+within the name, like the uuid of an instance for the 'instance' locks.  A
+lock only takes memory while it is held or waited for, so the locks of
+instances do not pile up.  A lock is either held exclusively or shared by
+any number of holders.  Waiters are served in order, so that holders of a
+shared lock do not starve those waiting for it exclusively.
+
+The wait and hold times of the locks are kept as histograms per name.
+report() returns them together with the holders and waiters of every lock,
+for debugging a stuck host, e.g. through the eventlet backdoor:
+
+    >>> from nova.compute import locks
+    >>> pprint(locks.report())
+"""
+
+import bisect
+import collections
+import contextlib
+import functools
+import time
+import traceback
+
+from eventlet import event
+from eventlet import greenthread
+from eventlet import timeout
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+
+
+lock_opts = [
+    cfg.IntOpt('lock_wait_warning',
+               default=60,
+               help='Seconds waited for a lock of the compute host after '
+                    'which its holders are logged, 0 to never log them'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(lock_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the buckets of the wait and hold time
+# histograms, the last bucket has none.
+HISTOGRAM_BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60, 600)
+
+
+class Histogram(object):
+    """Counts of durations by bucket of HISTOGRAM_BUCKETS."""
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.counts[bisect.bisect_left(HISTOGRAM_BUCKETS, duration)] += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def to_dict(self):
+        buckets = ['<=%s' % bound for bound in HISTOGRAM_BUCKETS]
+        buckets.append('>%s' % HISTOGRAM_BUCKETS[-1])
+        return {'count': sum(self.counts),
+                'total': self.total,
+                'max': self.max,
+                'buckets': dict(zip(buckets, self.counts))}
+
+
+class _Lock(object):
+    """The holders and waiters of the lock of one name and key."""
+
+    def __init__(self):
+        # token: (shared, since, greenthread)
+        self.holders = {}
+        # (token, shared, since, greenthread, event)
+        self.waiters = collections.deque()
+
+    def grantable(self, shared):
+        if not self.holders:
+            return True
+        return shared and all(holder[0] for holder in self.holders.values())
+
+    def grant(self, token, shared, thread):
+        self.holders[token] = (shared, time.time(), thread)
+
+    def grant_waiters(self):
+        while self.waiters and self.grantable(self.waiters[0][1]):
+            token, shared, since, thread, granted = self.waiters.popleft()
+            self.grant(token, shared, thread)
+            granted.send()
+
+    def describe(self, with_stacks=False):
+        now = time.time()
+
+        def _describe(shared, since, thread):
+            info = {'shared': shared,
+                    'seconds': now - since,
+                    'thread': repr(thread)}
+            if with_stacks and getattr(thread, 'gr_frame', None):
+                info['stack'] = traceback.format_stack(thread.gr_frame)
+            return info
+
+        return {'holders': [_describe(*holder)
+                            for holder in self.holders.values()],
+                'waiters': [_describe(shared, since, thread)
+                            for token, shared, since, thread, granted
+                            in self.waiters]}
+
+
+class LockManager(object):
+    """Named locks with wait and hold time histograms per name."""
+
+    def __init__(self):
+        # (name, key): _Lock
+        self._locks = {}
+        self.wait_times = collections.defaultdict(Histogram)
+        self.hold_times = collections.defaultdict(Histogram)
+
+    @contextlib.contextmanager
+    def lock(self, name, key=None, shared=False):
+        """Hold the lock of name and key while running the block."""
+        lock = self._locks.get((name, key))
+        if lock is None:
+            lock = self._locks[(name, key)] = _Lock()
+
+        token = object()
+        thread = greenthread.getcurrent()
+        start = time.time()
+        if not lock.waiters and lock.grantable(shared):
+            lock.grant(token, shared, thread)
+        else:
+            granted = event.Event()
+            waiter = (token, shared, start, thread, granted)
+            lock.waiters.append(waiter)
+            waited = False
+            try:
+                self._wait(name, key, lock, granted)
+                waited = True
+            finally:
+                if not waited:
+                    # NOTE: killed while waiting, maybe after the grant
+                    if waiter in lock.waiters:
+                        lock.waiters.remove(waiter)
+                    self._release(name, key, lock, token)
+
+        acquired = time.time()
+        self.wait_times[name].add(acquired - start)
+        try:
+            yield
+        finally:
+            self.hold_times[name].add(time.time() - acquired)
+            self._release(name, key, lock, token)
+
+    def _wait(self, name, key, lock, granted):
+        while True:
+            with timeout.Timeout(CONF.lock_wait_warning or None, False):
+                granted.wait()
+                return
+            LOG.warn(_('Still waiting for lock %(name)s %(key)s: %(lock)s'),
+                     {'name': name, 'key': key, 'lock': lock.describe()})
+
+    def _release(self, name, key, lock, token):
+        lock.holders.pop(token, None)
+        lock.grant_waiters()
+        if not lock.holders and not lock.waiters:
+            del self._locks[(name, key)]
+
+    def report(self, with_stacks=True):
+        """Return the locks held or waited for and the histograms."""
+        return {'locks': [dict(lock.describe(with_stacks), name=name, key=key)
+                          for (name, key), lock in self._locks.items()],
+                'wait_times': dict((name, histogram.to_dict())
+                                   for name, histogram
+                                   in self.wait_times.items()),
+                'hold_times': dict((name, histogram.to_dict())
+                                   for name, histogram
+                                   in self.hold_times.items())}
+
+
+_manager = LockManager()
+
+
+def lock(name, key=None, shared=False):
+    """Hold the lock of name and key of the compute host."""
+    return _manager.lock(name, key, shared)
+
+
+def synchronized(name, key=None, shared=False):
+    """Decorator holding the lock of name and key around a function."""
+
+    def wrap(function):
+        @functools.wraps(function)
+        def inner(*args, **kwargs):
+            with lock(name, key, shared):
+                return function(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def report(with_stacks=True):
+    """Return the locks of the compute host held or waited for, with the
+    stacks of their holders and waiters, and the histograms of their wait
+    and hold times by name.
+    """
+    return _manager.report(with_stacks)
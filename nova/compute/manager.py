@@ -30,12 +30,14 @@ terminating it.
 import base64
 import contextlib
 import functools
+import itertools
 import socket
 import sys
 import time
 import traceback
 import uuid
 
+from eventlet import greenpool
 from eventlet import greenthread
 from oslo.config import cfg
 
@@ -44,6 +46,7 @@ from nova.cells import rpcapi as cells_rpcapi
 from nova.cloudpipe import pipelib
 from nova import compute
 from nova.compute import flavors
+from nova.compute import locks
 from nova.compute import power_state
 from nova.compute import resource_tracker
 from nova.compute import rpcapi as compute_rpcapi
@@ -99,6 +102,23 @@ compute_opts = [
                 help='Whether to batch up the application of IPTables rules'
                      ' during a host restart and apply all at the end of the'
                      ' init phase'),
+    cfg.IntOpt('init_instance_concurrency',
+               default=1,
+               help='Number of instances initialized at once during a host '
+                    'restart.  Above 1 the application of IPTables rules is '
+                    'always batched up until the end of the init phase'),
+    cfg.IntOpt('max_concurrent_image_downloads',
+               default=0,
+               help='Number of builds fetching their image at once, further '
+                    'builds queue for it.  0 means no limit'),
+    cfg.IntOpt('max_concurrent_block_device_setups',
+               default=0,
+               help='Number of builds setting up their block devices at '
+                    'once, further builds queue for it.  0 means no limit'),
+    cfg.IntOpt('max_concurrent_spawns',
+               default=0,
+               help='Number of builds spawning their instance at once, '
+                    'further builds queue for it.  0 means no limit'),
     cfg.StrOpt('instances_path',
                default=paths.state_path_def('instances'),
                help='where instances are stored on disk'),
@@ -121,6 +141,16 @@ compute_opts = [
     cfg.IntOpt('network_allocate_retries',
                default=0,
                help="Number of times to retry network allocation on failures"),
+    cfg.FloatOpt('audit_record_flush_delay',
+                 default=0.0,
+                 help='Maximum seconds the writer of an instance fault or '
+                      'action event waits for others to write them in '
+                      'bulk, 0 to write each one immediately'),
+    cfg.IntOpt('audit_record_batch_size',
+               default=100,
+               help='Number of waiting instance faults and action events '
+                    'which are written at once without waiting for '
+                    'audit_record_flush_delay'),
     ]
 
 interval_opts = [
@@ -131,10 +161,28 @@ interval_opts = [
                default=600,
                help='interval to sync power states between '
                     'the database and the hypervisor'),
+    cfg.BoolOpt('sync_power_state_from_events',
+                default=False,
+                help='Track power states from the lifecycle events of the '
+                     'hypervisor; every sync_power_state_interval only the '
+                     'instances whose power state on the hypervisor is not '
+                     'the last one reported are synced, and all of them '
+                     'only every sync_power_state_full_interval'),
+    cfg.IntOpt('sync_power_state_full_interval',
+               default=3600,
+               help='Interval in seconds between syncs of the power states '
+                    'of all instances when sync_power_state_from_events is '
+                    'set'),
     cfg.IntOpt("heal_instance_info_cache_interval",
                default=60,
                help="Number of seconds between instance info_cache self "
                         "healing updates"),
+    cfg.IntOpt("heal_instance_info_cache_per_minute",
+               default=0,
+               help="Number of instances per minute whose info_cache is "
+                    "healed, in one batch every "
+                    "heal_instance_info_cache_interval.  0 heals one "
+                    "instance per interval"),
     cfg.IntOpt("image_cache_manager_interval",
                default=2400,
                help='Number of seconds to wait between runs of the image '
@@ -224,6 +272,11 @@ get_notifier = functools.partial(notifier.get_notifier, service='compute')
 wrap_exception = functools.partial(exception.wrap_exception,
                                    get_notifier=get_notifier)
 
+# Instance fields loaded by the periodic tasks which scan every instance on
+# the host; anything else is lazy-loaded only for instances acted upon.
+_SYNC_POWER_STATE_COLUMNS = ['vm_state', 'power_state', 'task_state', 'host']
+_RUNNING_DELETED_COLUMNS = ['deleted_at', 'host']
+
 
 def reverts_task_state(function):
     """Decorator to revert task_state on failure."""
@@ -272,7 +325,7 @@ def wrap_instance_fault(function):
 
             with excutils.save_and_reraise_exception():
                 compute_utils.add_instance_fault_from_exc(context,
-                        self.conductor_api, kwargs['instance'],
+                        self.audit_records, kwargs['instance'],
                         e, sys.exc_info())
 
     return decorated_function
@@ -293,7 +346,7 @@ def wrap_instance_event(function):
         instance_uuid = keyed_args['instance']['uuid']
 
         event_name = 'compute_{0}'.format(function.func_name)
-        with compute_utils.EventReporter(context, self.conductor_api,
+        with compute_utils.EventReporter(context, self.audit_records,
                                          event_name, instance_uuid):
 
             function(self, context, *args, **kwargs)
@@ -432,9 +485,16 @@ class ComputeManager(manager.Manager):
         self._last_vol_usage_poll = 0
         self._last_info_cache_heal = 0
         self._last_bw_usage_cell_update = 0
+        self._last_full_power_state_sync = 0
+        # uuid: (sequence, power_state) last reported by the hypervisor
+        self._known_power_states = {}
+        self._power_state_sequence = itertools.count(1)
         self.compute_api = compute.API()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.conductor_api = conductor.API()
+        self.audit_records = compute_utils.AuditRecordBuffer(
+            self.conductor_api, CONF.audit_record_batch_size,
+            CONF.audit_record_flush_delay)
         self.compute_task_api = conductor.ComputeTaskAPI()
         self.is_neutron_security_groups = (
             openstack_driver.is_neutron_security_groups())
@@ -442,6 +502,11 @@ class ComputeManager(manager.Manager):
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         self._resource_tracker_dict = {}
+        self._build_admission = compute_utils.BuildAdmission(
+            {'prefetch_image': CONF.max_concurrent_image_downloads,
+             'prep_block_device': CONF.max_concurrent_block_device_setups,
+             'spawn': CONF.max_concurrent_spawns},
+            self._update_build_queue_stats)
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -464,9 +529,18 @@ class ComputeManager(manager.Manager):
             rt = resource_tracker.ResourceTracker(self.host,
                                                   self.driver,
                                                   nodename)
+            rt.stats.update_stats_for_build_queue(
+                    self._build_admission.num_queued)
             self._resource_tracker_dict[nodename] = rt
         return rt
 
+    def _update_build_queue_stats(self):
+        # NOTE: the scheduler gets them with the next update of the
+        # resources of the node.
+        for rt in self._resource_tracker_dict.values():
+            rt.stats.update_stats_for_build_queue(
+                    self._build_admission.num_queued)
+
     def _instance_update(self, context, instance_uuid, **kwargs):
         """Update an instance in the database using kwargs as value."""
 
@@ -498,11 +572,12 @@ class ComputeManager(manager.Manager):
                         'trying to set it to ERROR'),
                       instance_uuid=instance.uuid)
 
-    def _get_instances_on_driver(self, context, filters=None):
+    def _get_instances_on_driver(self, context, filters=None, columns=None):
         """Return a list of instance records for the instances found
         on the hypervisor which satisfy the specified filters. If filters=None
         return a list of instance records for all the instances found on the
-        hypervisor.
+        hypervisor. If columns is given, only those fields are loaded up
+        front and the rest are lazy-loaded on access.
         """
         if not filters:
             filters = {}
@@ -510,7 +585,7 @@ class ComputeManager(manager.Manager):
             driver_uuids = self.driver.list_instance_uuids()
             filters['uuid'] = driver_uuids
             local_instances = instance_obj.InstanceList.get_by_filters(
-                context, filters)
+                context, filters, columns=columns)
             return local_instances
         except NotImplementedError:
             pass
@@ -518,7 +593,8 @@ class ComputeManager(manager.Manager):
         # The driver doesn't support uuids listing, so we'll have
         # to brute force.
         driver_instances = self.driver.list_instances()
-        instances = instance_obj.InstanceList.get_by_filters(context, filters)
+        instances = instance_obj.InstanceList.get_by_filters(context, filters,
+                                                             columns=columns)
         name_map = dict((instance.name, instance) for instance in instances)
         local_instances = []
         for driver_instance in driver_instances:
@@ -773,9 +849,12 @@ class ComputeManager(manager.Manager):
                         event.get_transition())
 
         if vm_power_state is not None:
-            self._sync_instance_power_state(context,
-                                            instance,
-                                            vm_power_state)
+            sequence = next(self._power_state_sequence)
+            if self._sync_instance_power_state(context,
+                                               instance,
+                                               vm_power_state):
+                self._note_power_state(event.get_instance_uuid(),
+                                       vm_power_state, sequence)
 
     def handle_events(self, event):
         if isinstance(event, virtevent.LifecycleEvent):
@@ -797,7 +876,11 @@ class ComputeManager(manager.Manager):
         instances = instance_obj.InstanceList.get_by_host(
             context, self.host, expected_attrs=['info_cache'])
 
-        if CONF.defer_iptables_apply:
+        # NOTE: Instances initialized at once would otherwise apply the
+        # rules of the whole host over and over again.
+        defer_iptables_apply = (CONF.defer_iptables_apply or
+                                CONF.init_instance_concurrency > 1)
+        if defer_iptables_apply:
             self.driver.filter_defer_apply_on()
 
         self.init_virt_events()
@@ -805,12 +888,60 @@ class ComputeManager(manager.Manager):
         try:
             # checking that instance was not already evacuated to other host
             self._destroy_evacuated_instances(context)
-            for instance in instances:
-                self._init_instance(context, instance)
+            self._init_instances(context, instances)
         finally:
-            if CONF.defer_iptables_apply:
+            if defer_iptables_apply:
                 self.driver.filter_defer_apply_off()
 
+    def _init_instances(self, context, instances):
+        """Initialize the instances, init_instance_concurrency at a time.
+
+        Progress is logged every tenth of the instances.  As when they are
+        initialized one at a time, the first error initializing an instance
+        stops the initialization of the instances not started yet, and is
+        raised once the instances being initialized are done.
+        """
+        total = len(instances)
+        step = max(1, total // 10)
+        done = itertools.count(1)
+
+        def init_instance(instance):
+            self._init_instance(context, instance)
+            count = next(done)
+            if count % step == 0 or count == total:
+                LOG.info(_("Initialized %(count)d of %(total)d instances"),
+                         {'count': count, 'total': total})
+
+        if CONF.init_instance_concurrency <= 1:
+            for instance in instances:
+                init_instance(instance)
+            return
+
+        pool = greenpool.GreenPool(CONF.init_instance_concurrency)
+        failures = []
+
+        def init_instance_unless_failed(instance):
+            # NOTE: An instance may get its green thread just as another
+            # one fails.
+            if failures:
+                return
+            try:
+                init_instance(instance)
+            except Exception:
+                failures.append(sys.exc_info())
+
+        for instance in instances:
+            if failures:
+                break
+            pool.spawn(init_instance_unless_failed, instance)
+        pool.waitall()
+        if failures:
+            exc_info = failures[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def cleanup_host(self):
+        self.audit_records.flush()
+
     def pre_start_hook(self):
         """After the service is initialized, but before we fully bring
         the service up by listening on RPC queues, make sure to update
@@ -868,7 +999,7 @@ class ComputeManager(manager.Manager):
         Synchronise the call because we may still be in the middle of
         creating the instance.
         """
-        @utils.synchronized(instance['uuid'])
+        @locks.synchronized('instance', instance['uuid'])
         def _sync_refresh():
             return self.driver.refresh_instance_security_rules(instance)
         return _sync_refresh()
@@ -1045,8 +1176,15 @@ class ComputeManager(manager.Manager):
                 self._default_block_device_names(context, instance, image_meta,
                                                  bdms)
 
-                block_device_info = self._prep_block_device(
-                        context, instance, bdms)
+                # NOTE: The image is fetched while the networks are
+                # allocated asynchronously.
+                if self._boots_from_image(instance, bdms):
+                    self._prefetch_image(context, instance, image_meta)
+
+                with self._build_admission.admit('prep_block_device',
+                                                 instance):
+                    block_device_info = self._prep_block_device(
+                            context, instance, bdms)
 
                 set_access_ip = (is_first_time and
                                  not instance['access_ip_v4'] and
@@ -1116,7 +1254,7 @@ class ComputeManager(manager.Manager):
         instance_uuid = instance['uuid']
         rescheduled = False
 
-        compute_utils.add_instance_fault_from_exc(context, self.conductor_api,
+        compute_utils.add_instance_fault_from_exc(context, self.audit_records,
                 instance, exc_info[1], exc_info=exc_info)
 
         try:
@@ -1453,10 +1591,11 @@ class ComputeManager(manager.Manager):
                 task_state=task_states.SPAWNING,
                 expected_task_state=task_states.BLOCK_DEVICE_MAPPING)
         try:
-            self.driver.spawn(context, instance, image_meta,
-                              injected_files, admin_password,
-                              network_info,
-                              block_device_info)
+            with self._build_admission.admit('spawn', instance):
+                self.driver.spawn(context, instance, image_meta,
+                                  injected_files, admin_password,
+                                  network_info,
+                                  block_device_info)
         except Exception:
             with excutils.save_and_reraise_exception():
                 LOG.exception(_('Instance failed to spawn'), instance=instance)
@@ -1581,7 +1720,7 @@ class ComputeManager(manager.Manager):
                      security_groups=None, block_device_mapping=None,
                      node=None, limits=None):
 
-        @utils.synchronized(instance['uuid'])
+        @locks.synchronized('instance', instance['uuid'])
         def do_build_and_run_instance(context, instance, image, request_spec,
                 filter_properties, admin_password, injected_files,
                 requested_networks, security_groups, block_device_mapping,
@@ -1675,10 +1814,14 @@ class ComputeManager(manager.Manager):
                             task_states.BLOCK_DEVICE_MAPPING)
                     block_device_info = resources['block_device_info']
                     network_info = resources['network_info']
-                    self.driver.spawn(context, instance, image,
-                                      injected_files, admin_password,
-                                      network_info=network_info,
-                                      block_device_info=block_device_info)
+                    with compute_utils.EventReporter(context,
+                            self.audit_records, 'compute_spawn',
+                            instance['uuid']):
+                        with self._build_admission.admit('spawn', instance):
+                            self.driver.spawn(context, instance, image,
+                                    injected_files, admin_password,
+                                    network_info=network_info,
+                                    block_device_info=block_device_info)
                     self._notify_about_instance_usage(context, instance,
                             'create.end',
                             extra_usage_info={'message': _('Success')},
@@ -1741,51 +1884,108 @@ class ComputeManager(manager.Manager):
         self._default_block_device_names(context, instance, image,
                 block_device_mapping)
 
-        try:
-            network_info = self._build_networks_for_instance(context, instance,
-                    requested_networks, security_groups)
-            resources['network_info'] = network_info
-        except Exception:
-            # Because this allocation is async any failures are likely to occur
-            # when the driver accesses network_info during spawn().
-            LOG.exception('Failed to allocate network(s)', instance=instance)
-            msg = _('Failed to allocate the network(s), not rescheduling.')
-            raise exception.BuildAbortException(instance_uuid=instance['uuid'],
-                    reason=msg)
+        def allocate_network():
+            try:
+                resources['network_info'] = self._build_networks_for_instance(
+                        context, instance, requested_networks,
+                        security_groups)
+            except Exception:
+                LOG.exception('Failed to allocate network(s)',
+                              instance=instance)
+                msg = _('Failed to allocate the network(s), not '
+                        'rescheduling.')
+                raise exception.BuildAbortException(
+                        instance_uuid=instance['uuid'], reason=msg)
+
+        def wait_for_network():
+            # Make sure the async call finishes before cleaning up
+            network_info = resources.get('network_info')
+            if isinstance(network_info, network_model.NetworkInfoAsyncWrapper):
+                network_info.wait(do_raise=False)
 
-        self._instance_update(
-                context, instance['uuid'],
-                vm_state=vm_states.BUILDING,
-                task_state=task_states.BLOCK_DEVICE_MAPPING)
+        def prep_block_device():
+            self._instance_update(
+                    context, instance['uuid'],
+                    vm_state=vm_states.BUILDING,
+                    task_state=task_states.BLOCK_DEVICE_MAPPING)
+            try:
+                with self._build_admission.admit('prep_block_device',
+                                                 instance):
+                    resources['block_device_info'] = self._prep_block_device(
+                            context, instance, block_device_mapping)
+            except Exception:
+                LOG.exception(_('Failure prepping block device'),
+                        instance=instance)
+                msg = _('Failure prepping block device.')
+                raise exception.BuildAbortException(
+                        instance_uuid=instance['uuid'], reason=msg)
+
+        def prefetch_image():
+            self._prefetch_image(context, instance, image)
+
+        # The block devices are set up and the image is fetched while the
+        # networks are allocated.  Setting up the block devices only waits
+        # for the allocation to start, as both update the task state.  The
+        # allocation itself goes on during spawn(); its failures are raised
+        # when the driver accesses network_info.  As the stage only starts
+        # the allocation, it does not report its timing.
+        stages = compute_utils.StageGraph(context, self.audit_records,
+                                          instance['uuid'])
+        stages.add('allocate_network', allocate_network, report=False)
+        stages.add('prep_block_device', prep_block_device,
+                   requires=['allocate_network'])
+        if self._boots_from_image(instance, block_device_mapping):
+            stages.add('prefetch_image', prefetch_image)
 
         try:
-            block_device_info = self._prep_block_device(context, instance,
-                    block_device_mapping)
-            resources['block_device_info'] = block_device_info
+            stages.run()
         except Exception:
-            LOG.exception(_('Failure prepping block device'),
-                    instance=instance)
-            msg = _('Failure prepping block device.')
-            raise exception.BuildAbortException(instance_uuid=instance['uuid'],
-                    reason=msg)
+            with excutils.save_and_reraise_exception() as ctxt:
+                wait_for_network()
+                if 'block_device_info' in resources:
+                    self._cleanup_failed_build_resources(ctxt, context,
+                            instance, block_device_mapping)
 
         try:
             yield resources
         except Exception:
             with excutils.save_and_reraise_exception() as ctxt:
                 LOG.exception(_('Instance failed to spawn'), instance=instance)
-                # Make sure the async call finishes
-                if network_info is not None:
-                    network_info.wait(do_raise=False)
-                try:
-                    self._cleanup_build_resources(context, instance,
-                            block_device_mapping)
-                except Exception:
-                    ctxt.reraise = False
-                    msg = _('Could not clean up failed build,'
-                            ' not rescheduling')
-                    raise exception.BuildAbortException(
-                            instance_uuid=instance['uuid'], reason=msg)
+                wait_for_network()
+                self._cleanup_failed_build_resources(ctxt, context, instance,
+                        block_device_mapping)
+
+    @staticmethod
+    def _boots_from_image(instance, bdms):
+        """Whether the root disk of instance is created from its image on
+        the host, rather than being a volume.
+        """
+        root_bdm = block_device.get_root_bdm(bdms)
+        return bool(instance['image_ref'] and
+                    (not root_bdm or root_bdm['destination_type'] != 'volume'))
+
+    def _prefetch_image(self, context, instance, image_meta):
+        """Fetch the image of an instance ahead of spawn() if the driver
+        can, as admitted by max_concurrent_image_downloads.
+        """
+        # spawn() fetches the image itself if this did not work out.
+        try:
+            with self._build_admission.admit('prefetch_image', instance):
+                self.driver.prefetch_image(context, instance, image_meta)
+        except Exception:
+            LOG.warn(_('Failed to prefetch image'), instance=instance,
+                     exc_info=True)
+
+    def _cleanup_failed_build_resources(self, ctxt, context, instance,
+            block_device_mapping):
+        try:
+            self._cleanup_build_resources(context, instance,
+                    block_device_mapping)
+        except Exception:
+            ctxt.reraise = False
+            msg = _('Could not clean up failed build, not rescheduling')
+            raise exception.BuildAbortException(
+                    instance_uuid=instance['uuid'], reason=msg)
 
     def _cleanup_allocated_networks(self, context, instance,
             requested_networks):
@@ -1819,7 +2019,7 @@ class ComputeManager(manager.Manager):
         if filter_properties is None:
             filter_properties = {}
 
-        @utils.synchronized(instance['uuid'])
+        @locks.synchronized('instance', instance['uuid'])
         def do_run_instance():
             self._run_instance(context, request_spec,
                     filter_properties, requested_networks, injected_files,
@@ -1989,7 +2189,7 @@ class ComputeManager(manager.Manager):
     def terminate_instance(self, context, instance, bdms, reservations):
         """Terminate an instance on this host."""
 
-        @utils.synchronized(instance['uuid'])
+        @locks.synchronized('instance', instance['uuid'])
         def do_terminate_instance(instance, bdms):
             try:
                 self._delete_instance(context, instance, bdms,
@@ -2347,7 +2547,7 @@ class ComputeManager(manager.Manager):
             type_, value, tb = sys.exc_info()
 
             compute_utils.add_instance_fault_from_exc(context,
-                            self.conductor_api, instance, error,
+                            self.audit_records, instance, error,
                             sys.exc_info())
 
             # if the reboot failed but the VM is running don't
@@ -2744,7 +2944,7 @@ class ComputeManager(manager.Manager):
     @wrap_instance_fault
     def confirm_resize(self, context, instance, reservations, migration):
 
-        @utils.synchronized(instance['uuid'])
+        @locks.synchronized('instance', instance['uuid'])
         def do_confirm_resize(context, instance, migration_id):
             # NOTE(wangpan): Get the migration status from db, if it has been
             #                confirmed, we do nothing and return here
@@ -3067,7 +3267,7 @@ class ComputeManager(manager.Manager):
         rescheduled = False
         instance_uuid = instance['uuid']
 
-        compute_utils.add_instance_fault_from_exc(context, self.conductor_api,
+        compute_utils.add_instance_fault_from_exc(context, self.audit_records,
                 instance, exc_info[0], exc_info=exc_info)
 
         try:
@@ -3518,7 +3718,7 @@ class ComputeManager(manager.Manager):
         :param image: an image to build from.  If None we assume a
             volume backed instance.
         """
-        @utils.synchronized(instance['uuid'])
+        @locks.synchronized('instance', instance['uuid'])
         def do_unshelve_instance():
             self._unshelve_instance(context, instance, image)
         do_unshelve_instance()
@@ -3712,7 +3912,7 @@ class ComputeManager(manager.Manager):
     def reserve_block_device_name(self, context, instance, device,
                                   volume_id):
 
-        @utils.synchronized(instance['uuid'])
+        @locks.synchronized('instance', instance['uuid'])
         def do_reserve():
             bdms = self.conductor_api.block_device_mapping_get_all_by_instance(
                 context, instance)
@@ -4408,6 +4608,9 @@ class ComputeManager(manager.Manager):
         list, pull the DB record, and try the call to the network API.
         If anything errors don't fail, as it's possible the instance
         has been deleted, etc.
+
+        With heal_instance_info_cache_per_minute, a batch of instances is
+        healed on every call instead, see _heal_instance_info_caches().
         """
         heal_interval = CONF.heal_instance_info_cache_interval
         if not heal_interval:
@@ -4417,6 +4620,10 @@ class ComputeManager(manager.Manager):
             return
         self._last_info_cache_heal = curr_time
 
+        if CONF.heal_instance_info_cache_per_minute:
+            self._heal_instance_info_caches(context, heal_interval)
+            return
+
         instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
         instance = None
 
@@ -4451,6 +4658,44 @@ class ComputeManager(manager.Manager):
         except Exception:
             LOG.debug(_("An error occurred"), exc_info=True)
 
+    def _heal_instance_info_caches(self, context, heal_interval):
+        """Update the info_cache of a batch of instances at once.
+
+        The batch is as large as heal_instance_info_cache_per_minute allows
+        every heal_interval.  Its instances are pulled from the DB with one
+        query, and their network info is asked for and saved with a single
+        call to the network API.
+        """
+        batch_size = max(1, int(round(
+            CONF.heal_instance_info_cache_per_minute * heal_interval / 60.0)))
+
+        instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
+        if not instance_uuids:
+            db_instances = instance_obj.InstanceList.get_by_host(
+                context, self.host, expected_attrs=[], use_slave=True)
+            instance_uuids = [inst['uuid'] for inst in db_instances]
+            self._instance_uuids_to_heal = instance_uuids
+        batch = instance_uuids[:batch_size]
+        del instance_uuids[:batch_size]
+        if not batch:
+            return
+
+        # NOTE: Instances which are gone, or which have moved to another
+        # host, are not returned.
+        instances = instance_obj.InstanceList.get_by_filters(
+            context, {'uuid': batch, 'host': self.host, 'deleted': False},
+            expected_attrs=['system_metadata', 'info_cache'])
+        if not instances:
+            return
+        try:
+            nw_infos = self.network_api.get_instances_nw_info(context,
+                                                              instances)
+            LOG.debug(_('Updated the info_cache for %(updated)d of '
+                        '%(count)d instances'),
+                      {'updated': len(nw_infos), 'count': len(instances)})
+        except Exception:
+            LOG.debug(_("An error occurred"), exc_info=True)
+
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
         if CONF.reboot_timeout > 0:
@@ -4627,6 +4872,25 @@ class ComputeManager(manager.Manager):
                                       num_instances,
                                       time.time() - start_time))
 
+    def _bw_usage_getter(self, context, uuids, start_period):
+        """Return a function looking up the bandwidth usage of a uuid and
+        mac in the period, from the usages of all uuids fetched at once.
+        """
+        usages = self.conductor_api.bw_usage_get_by_uuids(context, uuids,
+                                                          start_period)
+        if usages is None:
+            # NOTE: The conductor is too old, look them up one by one.
+            def get_usage(uuid, mac):
+                # Allow switching of greenthreads between queries.
+                greenthread.sleep(0)
+                return self.conductor_api.bw_usage_get(context, uuid,
+                                                       start_period, mac)
+            return get_usage
+
+        usages = dict(((usage['uuid'], usage['mac']), usage)
+                      for usage in usages)
+        return lambda uuid, mac: usages.get((uuid, mac))
+
     @periodic_task.periodic_task
     def _poll_bandwidth_usage(self, context):
         prev_time, start_time = utils.last_completed_audit_period()
@@ -4656,26 +4920,27 @@ class ComputeManager(manager.Manager):
                 return
 
             refreshed = timeutils.utcnow()
+            uuids = sorted(set(bw_ctr['uuid'] for bw_ctr in bw_counters))
+            get_current_usage = self._bw_usage_getter(context, uuids,
+                                                      start_time)
+            get_previous_usage = self._bw_usage_getter(context, uuids,
+                                                       prev_time)
+            usages = []
             for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
                 bw_in = 0
                 bw_out = 0
                 last_ctr_in = None
                 last_ctr_out = None
-                usage = self.conductor_api.bw_usage_get(context,
-                                                        bw_ctr['uuid'],
-                                                        start_time,
-                                                        bw_ctr['mac_address'])
+                usage = get_current_usage(bw_ctr['uuid'],
+                                          bw_ctr['mac_address'])
                 if usage:
                     bw_in = usage['bw_in']
                     bw_out = usage['bw_out']
                     last_ctr_in = usage['last_ctr_in']
                     last_ctr_out = usage['last_ctr_out']
                 else:
-                    usage = self.conductor_api.bw_usage_get(
-                        context, bw_ctr['uuid'], prev_time,
-                        bw_ctr['mac_address'])
+                    usage = get_previous_usage(bw_ctr['uuid'],
+                                               bw_ctr['mac_address'])
                     if usage:
                         last_ctr_in = usage['last_ctr_in']
                         last_ctr_out = usage['last_ctr_out']
@@ -4694,16 +4959,19 @@ class ComputeManager(manager.Manager):
                     else:
                         bw_out += (bw_ctr['bw_out'] - last_ctr_out)
 
-                self.conductor_api.bw_usage_update(context,
-                                                   bw_ctr['uuid'],
-                                                   bw_ctr['mac_address'],
-                                                   start_time,
-                                                   bw_in,
-                                                   bw_out,
-                                                   bw_ctr['bw_in'],
-                                                   bw_ctr['bw_out'],
-                                                   last_refreshed=refreshed,
-                                                   update_cells=update_cells)
+                usages.append({'uuid': bw_ctr['uuid'],
+                               'mac': bw_ctr['mac_address'],
+                               'start_period': start_time,
+                               'bw_in': bw_in,
+                               'bw_out': bw_out,
+                               'last_ctr_in': bw_ctr['bw_in'],
+                               'last_ctr_out': bw_ctr['bw_out']})
+
+            # Write all counters of the host in one call and transaction.
+            if usages:
+                self.conductor_api.bw_usage_update_many(
+                    context, usages, last_refreshed=refreshed,
+                    update_cells=update_cells)
 
     def _get_host_volume_bdms(self, context, host):
         """Return all block device mappings on a compute host."""
@@ -4761,17 +5029,43 @@ class ComputeManager(manager.Manager):
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
-        To sync power state data we make a DB call to get the number of
-        virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        To sync power state data we make a DB call to get the virtual
+        machines known by the database and, if the driver supports it, a
+        single call to the hypervisor for the power states of all of its
+        virtual machines.  Only the instances whose power state does not
+        match the database are then synced, one database record at a time.
+        Drivers without get_power_states() are asked for the power state of
+        every instance in turn.
+
+        With sync_power_state_from_events, lifecycle events keep the power
+        states up to date, and this only resyncs the instances an event was
+        missed for, see _sync_missed_power_states(), but for a full sync
+        every sync_power_state_full_interval.
         """
-        db_instances = instance_obj.InstanceList.get_by_host(context,
-                                                             self.host,
-                                                             use_slave=True)
+        if (CONF.sync_power_state_from_events and
+                time.time() - self._last_full_power_state_sync <
+                CONF.sync_power_state_full_interval):
+            try:
+                self._sync_missed_power_states(context)
+                return
+            except NotImplementedError:
+                pass
+        self._last_full_power_state_sync = time.time()
+
+        # NOTE: Only load what the loop below needs; anything else is
+        # lazy-loaded for the few instances that need to be acted upon.
+        db_instances = instance_obj.InstanceList.get_by_host(
+            context, self.host, use_slave=True,
+            columns=_SYNC_POWER_STATE_COLUMNS)
 
-        num_vm_instances = self.driver.get_num_instances()
+        listed = next(self._power_state_sequence)
+        try:
+            vm_power_states = self.driver.get_power_states()
+        except NotImplementedError:
+            vm_power_states = None
+            num_vm_instances = self.driver.get_num_instances()
+        else:
+            num_vm_instances = len(vm_power_states)
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
@@ -4787,18 +5081,28 @@ class ComputeManager(manager.Manager):
                 continue
             # No pending tasks. Now try to figure out the real vm_power_state.
             try:
-                try:
-                    vm_instance = self.driver.get_info(db_instance)
-                    vm_power_state = vm_instance['state']
-                except exception.InstanceNotFound:
-                    vm_power_state = power_state.NOSTATE
+                if vm_power_states is not None:
+                    vm_power_state = vm_power_states.get(db_instance.uuid,
+                                                         power_state.NOSTATE)
+                else:
+                    try:
+                        vm_instance = self.driver.get_info(db_instance)
+                        vm_power_state = vm_instance['state']
+                    except exception.InstanceNotFound:
+                        vm_power_state = power_state.NOSTATE
+                if self._power_state_in_sync(db_instance, vm_power_state):
+                    self._note_power_state(db_instance.uuid, vm_power_state,
+                                           listed)
+                    continue
                 # Note(maoy): the above get_info call might take a long time,
                 # for example, because of a broken libvirt driver.
                 try:
-                    self._sync_instance_power_state(context,
-                                                    db_instance,
-                                                    vm_power_state,
-                                                    use_slave=True)
+                    if self._sync_instance_power_state(context,
+                                                       db_instance,
+                                                       vm_power_state,
+                                                       use_slave=True):
+                        self._note_power_state(db_instance.uuid,
+                                               vm_power_state, listed)
                 except exception.InstanceNotFound:
                     # NOTE(hanlind): If the instance gets deleted during sync,
                     # silently ignore and move on to next instance.
@@ -4808,12 +5112,106 @@ class ComputeManager(manager.Manager):
                                 "while processing an instance."),
                                 instance=db_instance)
 
+        # Forget the instances which are no longer on this host
+        for uuid, (sequence, state) in self._known_power_states.items():
+            if sequence < listed:
+                del self._known_power_states[uuid]
+
+    def _note_power_state(self, uuid, vm_power_state, sequence=None):
+        """Remember the power state the hypervisor reported for an instance,
+        once the database was reconciled with it.
+
+        sequence orders the reports; it is the one of the listing the power
+        state comes from, or the one taken when an event arrived.  A report
+        older than the one remembered is ignored.
+        """
+        if not CONF.sync_power_state_from_events:
+            return
+        if sequence is None:
+            sequence = next(self._power_state_sequence)
+        known = self._known_power_states.get(uuid)
+        if known is None or known[0] <= sequence:
+            self._known_power_states[uuid] = (sequence, vm_power_state)
+
+    def _sync_missed_power_states(self, context):
+        """Sync the instances whose power state an event was missed for.
+
+        Those are the instances whose power state on the hypervisor is not
+        the one last reported for them, or which are new to it, or whose
+        last sync did not reconcile the database; they are synced one at a
+        time, without looking at the other instances in the database.
+        """
+        listed = next(self._power_state_sequence)
+        vm_power_states = self.driver.get_power_states()
+        for uuid in self._known_power_states:
+            vm_power_states.setdefault(uuid, power_state.NOSTATE)
+
+        for uuid, vm_power_state in vm_power_states.iteritems():
+            known = self._known_power_states.get(uuid)
+            # NOTE: An event reported since the listing is more recent.
+            if known is not None and (known[0] > listed or
+                                      known[1] == vm_power_state):
+                continue
+            LOG.debug(_("Syncing power state %(state)s, last reported as "
+                        "%(known)s"),
+                      {'state': vm_power_state, 'known': known and known[1]},
+                      instance_uuid=uuid)
+            try:
+                instance = instance_obj.Instance.get_by_uuid(
+                    context, uuid, expected_attrs=[], use_slave=True)
+                if instance.task_state is not None:
+                    # Leave it to a later run, once the task is done
+                    continue
+                if not self._sync_instance_power_state(context, instance,
+                                                       vm_power_state,
+                                                       use_slave=True):
+                    continue
+            except exception.InstanceNotFound:
+                # Not a nova instance, or deleted since; either way there
+                # is nothing to sync until its power state changes.
+                pass
+            except Exception:
+                LOG.exception(_("Periodic sync_power_state task had an error "
+                                "while processing an instance."),
+                              instance_uuid=uuid)
+                continue
+            self._note_power_state(uuid, vm_power_state, listed)
+
+    @staticmethod
+    def _power_state_in_sync(db_instance, vm_power_state):
+        """Whether _sync_instance_power_state() would have nothing to do.
+
+        That is when the power state in the database is the one of the
+        hypervisor and the vm_state does not call for action or a warning
+        about it; see _sync_instance_power_state() for the cases.
+        """
+        if db_instance.power_state != vm_power_state:
+            return False
+        vm_state = db_instance.vm_state
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state not in (power_state.SHUTDOWN,
+                                          power_state.CRASHED,
+                                          power_state.SUSPENDED,
+                                          power_state.PAUSED,
+                                          power_state.NOSTATE)
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+        elif vm_state in (vm_states.SOFT_DELETED, vm_states.DELETED):
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN)
+        return True
+
     def _sync_instance_power_state(self, context, db_instance, vm_power_state,
                                    use_slave=False):
         """Align instance power state between the database and hypervisor.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
+
+        :returns: whether the database was reconciled with vm_power_state,
+                  rather than left for a later sync
         """
 
         # We re-query the DB to get the latest instance info to minimize
@@ -4836,7 +5234,7 @@ class ComputeManager(manager.Manager):
                        {'src': self.host,
                         'dst': db_instance.host},
                      instance=db_instance)
-            return
+            return False
         elif db_instance.task_state is not None:
             # on the receiving end of nova-compute, it could happen
             # that the DB instance already report the new resident
@@ -4845,7 +5243,7 @@ class ComputeManager(manager.Manager):
             # and run the state sync in a later round
             LOG.info(_("During sync_power_state the instance has a "
                        "pending task. Skip."), instance=db_instance)
-            return
+            return False
 
         if vm_power_state != db_power_state:
             # power_state is always updated from hypervisor to db
@@ -4882,6 +5280,7 @@ class ComputeManager(manager.Manager):
                     LOG.exception(_("error during stop() in "
                                     "sync_power_state."),
                                   instance=db_instance)
+                    return False
             elif vm_power_state == power_state.SUSPENDED:
                 LOG.warn(_("Instance is suspended unexpectedly. Calling "
                            "the stop API."), instance=db_instance)
@@ -4891,6 +5290,7 @@ class ComputeManager(manager.Manager):
                     LOG.exception(_("error during stop() in "
                                     "sync_power_state."),
                                   instance=db_instance)
+                    return False
             elif vm_power_state == power_state.PAUSED:
                 # Note(maoy): a VM may get into the paused state not only
                 # because the user request via API calls, but also
@@ -4922,6 +5322,7 @@ class ComputeManager(manager.Manager):
                     LOG.exception(_("error during stop() in "
                                     "sync_power_state."),
                                   instance=db_instance)
+                    return False
         elif vm_state in (vm_states.SOFT_DELETED,
                           vm_states.DELETED):
             if vm_power_state not in (power_state.NOSTATE,
@@ -4930,6 +5331,7 @@ class ComputeManager(manager.Manager):
                 # _cleanup_running_deleted_instances().
                 LOG.warn(_("Instance is not (soft-)deleted."),
                          instance=db_instance)
+        return True
 
     @periodic_task.periodic_task
     def _reclaim_queued_deletes(self, context):
@@ -5084,7 +5486,8 @@ class ComputeManager(manager.Manager):
         filters = {'deleted': True,
                    'soft_deleted': False,
                    'host': self.host}
-        instances = self._get_instances_on_driver(context, filters)
+        instances = self._get_instances_on_driver(
+            context, filters, columns=_RUNNING_DELETED_COLUMNS)
         return [i for i in instances if self._deleted_old_enough(i, timeout)]
 
     def _deleted_old_enough(self, instance, timeout):
@@ -19,10 +19,13 @@ scheduler with useful information about availability through the ComputeNode
 model.
 """
 
+import time
+
 from oslo.config import cfg
 
 from nova.compute import claims
 from nova.compute import flavors
+from nova.compute import locks
 from nova.compute import monitors
 from nova.compute import task_states
 from nova.compute import vm_states
@@ -38,7 +41,6 @@ from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier
 from nova.pci import pci_manager
-from nova import utils
 
 resource_tracker_opts = [
     cfg.IntOpt('reserved_host_disk_mb', default=0,
@@ -47,7 +49,14 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.IntOpt('full_resource_audit_interval', default=1,
+               help='Number of resource audits between which the usage of '
+                    'a compute node is recomputed from all its instances '
+                    'and migrations. The other audits only refresh the '
+                    'view of the hypervisor and keep the usage tracked by '
+                    'claims, unless the hypervisor has instances which are '
+                    'not tracked. 1 recomputes it on every audit'),
 ]
 
 CONF = cfg.CONF
@@ -73,11 +82,12 @@ class ResourceTracker(object):
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
         self.tracked_migrations = {}
+        self.audits_since_full = 0
         self.conductor_api = conductor.API()
         monitor_handler = monitors.ResourceMonitorHandler()
         self.monitors = monitor_handler.choose_monitors(self)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @locks.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def instance_claim(self, context, instance_ref, limits=None):
         """Indicate that some resources are needed for an upcoming compute
         instance build operation.
@@ -134,7 +144,7 @@ class ResourceTracker(object):
         else:
             raise exception.ComputeResourcesUnavailable()
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @locks.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def resize_claim(self, context, instance, instance_type, limits=None):
         """Indicate that resources are needed for a resize operation to this
         compute host.
@@ -214,7 +224,7 @@ class ResourceTracker(object):
         instance_ref['launched_on'] = self.host
         instance_ref['node'] = self.nodename
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @locks.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def abort_instance_claim(self, instance):
         """Remove usage from the given instance."""
         # flag the instance as deleted to revert the resource usage
@@ -225,7 +235,7 @@ class ResourceTracker(object):
         ctxt = context.get_admin_context()
         self._update(ctxt, self.compute_node)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @locks.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def drop_resize_claim(self, instance, instance_type=None, prefix='new_'):
         """Remove usage for an incoming/outgoing migration."""
         if instance['uuid'] in self.tracked_migrations:
@@ -246,7 +256,7 @@ class ResourceTracker(object):
                 ctxt = context.get_admin_context()
                 self._update(ctxt, self.compute_node)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @locks.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def update_usage(self, context, instance):
         """Update the resource usage and stats after a change in an
         instance
@@ -287,7 +297,6 @@ class ResourceTracker(object):
                             metrics_info)
         return metrics
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def update_available_resource(self, context):
         """Override in-memory calculations of compute node resource usage based
         on data audited from the hypervisor layer.
@@ -297,8 +306,14 @@ class ResourceTracker(object):
         the hypervisor layer yet.
         """
         LOG.audit(_("Auditing locally available compute resources"))
+        # The hypervisor view is replaced by what is tracked where it
+        # matters, so claims need not wait for it.
         resources = self.driver.get_available_resource(self.nodename)
+        self._update_available_resource(context, resources)
 
+    @locks.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    def _update_available_resource(self, context, resources):
+        start = time.time()
         if not resources:
             # The virt driver does not support this function
             LOG.audit(_("Virt driver does not support "
@@ -317,6 +332,59 @@ class ResourceTracker(object):
             self.pci_tracker.set_hvdevs(jsonutils.loads(resources.pop(
                 'pci_passthrough_devices')))
 
+        full = self._needs_full_audit()
+        if full:
+            self._update_usage_from_db(context, resources)
+        else:
+            self._update_usage_from_tracked(resources)
+
+        self._report_final_resource_view(resources)
+
+        metrics = self._get_host_metrics(context, self.nodename)
+        resources['metrics'] = jsonutils.dumps(metrics)
+        self._sync_compute_node(context, resources)
+        LOG.debug(_("%(kind)s resource audit held the %(lock)s lock for "
+                    "%(time).3f seconds"),
+                  {'kind': _('Full') if full else _('Incremental'),
+                   'lock': COMPUTE_RESOURCE_SEMAPHORE,
+                   'time': time.time() - start})
+
+    def _needs_full_audit(self):
+        """Whether to recompute usage from all instances and migrations
+        rather than to keep what claims tracked.
+        """
+        if (self.compute_node is None or
+                self.audits_since_full + 1 >=
+                CONF.full_resource_audit_interval):
+            self.audits_since_full = 0
+            return True
+        if self._find_untracked_instances() or self._find_orphaned_instances():
+            LOG.info(_("Hypervisor has instances which are not tracked, "
+                       "recomputing usage"))
+            self.audits_since_full = 0
+            return True
+        self.audits_since_full += 1
+        return False
+
+    def _update_usage_from_tracked(self, resources):
+        """Take the usage tracked by claims since the last full audit."""
+        for key in ('memory_mb_used', 'local_gb_used'):
+            resources[key] = self.compute_node[key]
+        resources['free_ram_mb'] = (resources['memory_mb'] -
+                                    resources['memory_mb_used'])
+        resources['free_disk_gb'] = (resources['local_gb'] -
+                                     resources['local_gb_used'])
+        resources['running_vms'] = self.stats.num_instances
+        resources['vcpus_used'] = self.stats.num_vcpus_used
+        resources['current_workload'] = self.stats.calculate_workload()
+        resources['stats'] = self.stats
+        if self.pci_tracker:
+            resources['pci_stats'] = jsonutils.dumps(self.pci_tracker.stats)
+        else:
+            resources['pci_stats'] = jsonutils.dumps({})
+
+    def _update_usage_from_db(self, context, resources):
+        """Recompute usage from all instances and migrations of the node."""
         # Grab all instances assigned to this node:
         instances = instance_obj.InstanceList.get_by_host_and_node(
             context, self.host, self.nodename)
@@ -346,12 +414,6 @@ class ResourceTracker(object):
         else:
             resources['pci_stats'] = jsonutils.dumps({})
 
-        self._report_final_resource_view(resources)
-
-        metrics = self._get_host_metrics(context, self.nodename)
-        resources['metrics'] = jsonutils.dumps(metrics)
-        self._sync_compute_node(context, resources)
-
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
         if not self.compute_node:
@@ -628,6 +690,23 @@ class ResourceTracker(object):
             else:
                 self._update_usage_from_instance(resources, instance)
 
+    def _find_untracked_instances(self):
+        """Return the uuids of the instances on the hypervisor which are
+        neither tracked as instances nor as migrations.
+
+        Unlike orphans, these are found with any virt driver which can
+        list the uuids of its instances.
+        """
+        try:
+            vuuids = set(self.driver.list_instance_uuids())
+        except NotImplementedError:
+            return set()
+        if vuuids and len(self.driver.get_available_nodes()) > 1:
+            # NOTE: The instances of the other nodes are not tracked here.
+            return set()
+        return (vuuids - set(self.tracked_instances) -
+                set(self.tracked_migrations))
+
     def _find_orphaned_instances(self):
         """Given the set of instances and migrations already account for
         by resource tracker, sanity check the hypervisor to determine
@@ -15,6 +15,18 @@
 
 from nova.compute import task_states
 from nova.compute import vm_states
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+from nova import utils
+
+LOG = logging.getLogger(__name__)
+
+# Version of the compact encoding of the stats of a compute node, stored in
+# the compact_stats column of compute_nodes instead of compute_node_stats
+# rows.  Bump it when changing the encoding, and keep from_compact() able to
+# read the previous versions.
+COMPACT_VERSION = 1
 
 
 class Stats(dict):
@@ -26,10 +38,15 @@ class Stats(dict):
         # Track instance states for compute node workload calculations:
         self.states = {}
 
+        # Not derived from the instances, so it survives clear():
+        self._num_builds_queued = 0
+
     def clear(self):
         super(Stats, self).clear()
 
         self.states.clear()
+        if self._num_builds_queued:
+            self["num_builds_queued"] = self._num_builds_queued
 
     @property
     def io_workload(self):
@@ -114,6 +131,13 @@ class Stats(dict):
         # save updated I/O workload in stats:
         self["io_workload"] = self.io_workload
 
+    def update_stats_for_build_queue(self, num_queued):
+        """Update stats after builds were queued for or admitted to one of
+        their stages.
+        """
+        self._num_builds_queued = num_queued
+        self["num_builds_queued"] = num_queued
+
     def update_stats_for_migration(self, instance_type, sign=1):
         x = self.get("num_vcpus_used", 0)
         self["num_vcpus_used"] = x + (sign * instance_type['vcpus'])
@@ -141,3 +165,43 @@ class Stats(dict):
                                  vcpus=vcpus)
 
         return (vm_state, task_state, os_type, project_id, vcpus)
+
+
+def to_compact(stats):
+    """Encode a dict of stats for the compact_stats column.
+
+    Values are stored as strings, like in compute_node_stats rows.
+    """
+    stats = dict((key, unicode(value)) for key, value in stats.iteritems())
+    return jsonutils.dumps({'version': COMPACT_VERSION, 'stats': stats})
+
+
+def from_compact(blob):
+    """Decode the compact_stats column of a compute node.
+
+    :returns: the dict of stats, or None if the node has no compact stats
+              or they are in an encoding this code does not know
+    """
+    if blob is None:
+        return None
+    try:
+        encoded = jsonutils.loads(blob)
+        version = encoded['version']
+    except (ValueError, TypeError, KeyError):
+        LOG.warn(_("Ignoring malformed compact compute node stats"))
+        return None
+    if version != COMPACT_VERSION:
+        LOG.warn(_("Ignoring compact compute node stats of unknown "
+                   "version %s"), version)
+        return None
+    return encoded['stats']
+
+
+def stats_to_dict(compute_node):
+    """Return the stats of a compute node as a dict, whether they are stored
+    compact or as compute_node_stats rows.
+    """
+    stats = from_compact(compute_node.get('compact_stats'))
+    if stats is not None:
+        return stats
+    return utils.metadata_to_dict(compute_node.get('stats') or [])
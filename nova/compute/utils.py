@@ -16,11 +16,16 @@
 
 """Compute-related Utilities and helpers."""
 
+import contextlib
 import itertools
 import re
 import string
+import sys
 import traceback
 
+from eventlet import event
+from eventlet import greenthread
+from eventlet import semaphore
 from oslo.config import cfg
 
 from nova import block_device
@@ -455,3 +460,232 @@ class EventReporter(object):
                                              self.event_name, exc_val, exc_tb)
             self.conductor.action_event_finish(self.context, event)
         return False
+
+
+class StageGraph(object):
+    """Runs the stages of an operation on an instance concurrently where they
+    do not depend on each other.
+
+    Every stage runs in its own greenthread once the stages it requires have
+    finished, and reports an instance action event named after it, so that
+    its timing is recorded.  A stage whose requirements failed or did not
+    run does not run either.
+    """
+
+    def __init__(self, context, conductor, instance_uuid):
+        self.context = context
+        self.conductor = conductor
+        self.instance_uuid = instance_uuid
+        self._stages = []
+        # Names of the stages which failed or did not run, with the
+        # exc_info of their failure, or None
+        self._failed = {}
+
+    def add(self, name, function, requires=(), report=True):
+        """Add a stage calling function() as the event compute_<name>.
+
+        The stages named in requires have to be added first.  A stage added
+        with report=False does not report an event.
+        """
+        added = [stage[0] for stage in self._stages]
+        for required in requires:
+            if required not in added:
+                raise ValueError(_('Stage %(name)s requires unknown stage '
+                                   '%(required)s') %
+                                 {'name': name, 'required': required})
+        self._stages.append((name, function, requires, report))
+
+    def _run_stage(self, name, function, requires, report, threads):
+        for required in requires:
+            threads[required].wait()
+        if any(required in self._failed for required in requires):
+            self._failed[name] = None
+            return
+        try:
+            if report:
+                with EventReporter(self.context, self.conductor,
+                                   'compute_' + name, self.instance_uuid):
+                    function()
+            else:
+                function()
+        except Exception:
+            self._failed[name] = sys.exc_info()
+
+    def run(self):
+        """Run all stages and wait for them to finish.
+
+        If any stage failed, the failure of the first one added is re-raised
+        once all of them finished.
+        """
+        self._failed = {}
+        threads = {}
+        for name, function, requires, report in self._stages:
+            threads[name] = greenthread.spawn(self._run_stage, name, function,
+                                              requires, report, threads)
+        for thread in threads.values():
+            thread.wait()
+
+        for stage in self._stages:
+            exc_info = self._failed.get(stage[0])
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+
+class BuildAdmission(object):
+    """Limits how many builds run each of their stages at once.
+
+    Builds over the limit of a stage queue for it.  queue_changed() is
+    called whenever builds were queued or admitted.
+    """
+
+    def __init__(self, limits, queue_changed=None):
+        """:param limits: dict of stage name: limit, 0 meaning no limit."""
+        self._semaphores = dict((stage, semaphore.Semaphore(limit))
+                                for stage, limit in limits.iteritems()
+                                if limit > 0)
+        self._queue_changed = queue_changed
+        self.queued = dict((stage, 0) for stage in self._semaphores)
+
+    @property
+    def num_queued(self):
+        return sum(self.queued.itervalues())
+
+    def _change_queue(self, stage, delta):
+        self.queued[stage] += delta
+        if self._queue_changed is not None:
+            self._queue_changed()
+
+    @contextlib.contextmanager
+    def admit(self, stage, instance):
+        """Run the block once the build of instance is admitted to stage."""
+        sem = self._semaphores.get(stage)
+        if sem is None:
+            yield
+            return
+
+        if not sem.acquire(blocking=False):
+            LOG.info(_('Build queued for %(stage)s behind %(queued)d other '
+                       'builds'),
+                     {'stage': stage, 'queued': self.queued[stage]},
+                     instance=instance)
+            self._change_queue(stage, 1)
+            try:
+                sem.acquire()
+            finally:
+                self._change_queue(stage, -1)
+        try:
+            yield
+        finally:
+            sem.release()
+
+
+class AuditRecordBuffer(object):
+    """Writes the instance faults and action events of concurrent callers
+    in bulk.
+
+    It has the instance_fault_create(), action_event_start() and
+    action_event_finish() methods of the conductor API, so it can be used
+    in place of the conductor by add_instance_fault_from_exc() and
+    EventReporter.  Like the conductor's, these methods return once the
+    record is written: the records of all callers within max_delay seconds
+    of the first one, or of the first max_records callers, are written
+    together with one conductor call per kind and per user and project of
+    the callers, using the context of one of them.  If such a call fails,
+    its records are written one by one, so that a failure is only raised
+    to the callers whose records it concerns.
+
+    With a max_delay of 0 every record is written on its own.
+    """
+
+    def __init__(self, conductor, max_records, max_delay):
+        self.conductor = conductor
+        self.max_records = max_records
+        self.max_delay = max_delay
+        # (kind, context, values, event sent once written)
+        self.records = []
+        self._timer = None
+
+    def _add(self, kind, context, values):
+        written = event.Event()
+        self.records.append((kind, context, values, written))
+        if len(self.records) >= self.max_records:
+            self.flush()
+        elif self._timer is None:
+            self._timer = greenthread.spawn_after(self.max_delay,
+                                                  self._flush_due)
+        written.wait()
+
+    def _flush_due(self):
+        self._timer = None
+        self.flush()
+
+    def instance_fault_create(self, context, values):
+        if not self.max_delay:
+            return self.conductor.instance_fault_create(context, values)
+        self._add('fault', context, values)
+
+    def action_event_start(self, context, values):
+        if not self.max_delay:
+            return self.conductor.action_event_start(context, values)
+        self._add('start', context, values)
+
+    def action_event_finish(self, context, values):
+        if not self.max_delay:
+            return self.conductor.action_event_finish(context, values)
+        self._add('finish', context, values)
+
+    def flush(self):
+        """Write all buffered records and return to their callers.
+
+        A failure is raised to the callers, not to the caller of flush().
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        records, self.records = self.records, []
+
+        # NOTE: The events of a batch keep the order they were started and
+        # finished in.
+        keys = []
+        batches = {}
+        for record in records:
+            kind, ctxt = record[:2]
+            key = (kind == 'fault', ctxt.user_id, ctxt.project_id,
+                   ctxt.is_admin)
+            if key not in batches:
+                keys.append(key)
+                batches[key] = []
+            batches[key].append(record)
+        for key in keys:
+            self._write(batches[key])
+
+    def _write(self, batch):
+        ctxt = batch[0][1]
+        try:
+            if batch[0][0] == 'fault':
+                self.conductor.instance_fault_create_many(
+                    ctxt, [values for kind, c, values, w in batch])
+            else:
+                self.conductor.action_event_record_many(
+                    ctxt, [(kind, values) for kind, c, values, w in batch])
+        except Exception:
+            LOG.warn(_("Failed to write %d instance faults or action events "
+                       "at once, writing them one by one"), len(batch),
+                     exc_info=True)
+        else:
+            for kind, c, values, written in batch:
+                written.send()
+            return
+
+        write_one = {'fault': self.conductor.instance_fault_create,
+                     'start': self.conductor.action_event_start,
+                     'finish': self.conductor.action_event_finish}
+        for kind, ctxt, values, written in batch:
+            try:
+                write_one[kind](ctxt, values)
+            except Exception:
+                LOG.exception(_("Failed to write an instance fault or "
+                                "action event"))
+                written.send_exception(*sys.exc_info())
+            else:
+                written.send()
@@ -35,7 +35,21 @@ conductor_opts = [
                default='nova.conductor.manager.ConductorManager',
                help='full class name for the Manager for conductor'),
     cfg.IntOpt('workers',
-               help='Number of workers for OpenStack Conductor service')
+               help='Number of workers for OpenStack Conductor service'),
+    cfg.BoolOpt('send_object_changes',
+                default=False,
+                help='Send only the changes to objects which conductor '
+                     'has seen before on remotable calls. Objects are '
+                     'sent whole again whenever the conductor worker a '
+                     'call goes to has not seen them, so unless the '
+                     'conductors set memcached_servers to share the '
+                     'objects they have seen, this is only worth it with '
+                     'a single conductor worker'),
+    cfg.IntOpt('object_base_cache_size',
+               default=1000,
+               help='Number of objects each conductor worker keeps for '
+                    'their changes to be applied to, unless they are kept '
+                    'in memcached_servers. 0 disables it'),
 ]
 conductor_group = cfg.OptGroup(name='conductor',
                                title='Conductor Options')
@@ -107,6 +121,9 @@ class LocalAPI(object):
     def instance_fault_create(self, context, values):
         return self._manager.instance_fault_create(context, values)
 
+    def instance_fault_create_many(self, context, values_list):
+        return self._manager.instance_fault_create_many(context, values_list)
+
     def migration_get_in_progress_by_host_and_node(self, context, host, node):
         return self._manager.migration_get_in_progress_by_host_and_node(
             context, host, node)
@@ -135,6 +152,10 @@ class LocalAPI(object):
     def bw_usage_get(self, context, uuid, start_period, mac):
         return self._manager.bw_usage_update(context, uuid, mac, start_period)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        return self._manager.bw_usage_get_by_uuids(context, uuids,
+                                                   start_period)
+
     def bw_usage_update(self, context, uuid, mac, start_period,
                         bw_in, bw_out, last_ctr_in, last_ctr_out,
                         last_refreshed=None, update_cells=True):
@@ -144,6 +165,12 @@ class LocalAPI(object):
                                              last_refreshed,
                                              update_cells=update_cells)
 
+    def bw_usage_update_many(self, context, usages, last_refreshed=None,
+                             update_cells=True):
+        return self._manager.bw_usage_update_many(
+            context, usages, last_refreshed=last_refreshed,
+            update_cells=update_cells)
+
     def provider_fw_rule_get_all(self, context):
         return self._manager.provider_fw_rule_get_all(context)
 
@@ -226,6 +253,9 @@ class LocalAPI(object):
     def action_event_finish(self, context, values):
         return self._manager.action_event_finish(context, values)
 
+    def action_event_record_many(self, context, events):
+        return self._manager.action_event_record_many(context, events)
+
     def service_create(self, context, values):
         return self._manager.service_create(context, values)
 
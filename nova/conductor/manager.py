@@ -14,6 +14,7 @@
 
 """Handles database requests from other nova services."""
 
+from oslo.config import cfg
 import six
 
 from nova.api.ec2 import ec2utils
@@ -47,6 +48,8 @@ from nova.scheduler import utils as scheduler_utils
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+
 # Instead of having a huge list of arguments to instance_update(), we just
 # accept a dict of fields to update and use this whitelist to validate it.
 allowed_updates = ['task_state', 'vm_state', 'expected_task_state',
@@ -76,7 +79,7 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    RPC_API_VERSION = '1.62'
+    RPC_API_VERSION = '1.66'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -88,6 +91,8 @@ class ConductorManager(manager.Manager):
         self.compute_task_mgr = ComputeTaskManager()
         self.quotas = quota.QUOTAS
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
+        self.object_bases = nova_object.ObjectBaseCache(
+            CONF.conductor.object_base_cache_size)
 
     def create_rpc_dispatcher(self, *args, **kwargs):
         kwargs['additional_apis'] = [self.compute_task_mgr]
@@ -254,6 +259,16 @@ class ConductorManager(manager.Manager):
         usage = self.db.bw_usage_get(context, uuid, start_period, mac)
         return jsonutils.to_primitive(usage)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        usages = self.db.bw_usage_get_by_uuids(context, uuids, start_period)
+        return jsonutils.to_primitive(usages)
+
+    def bw_usage_update_many(self, context, usages, last_refreshed=None,
+                             update_cells=True):
+        self.db.bw_usage_update_many(context, usages,
+                                     last_refreshed=last_refreshed,
+                                     update_cells=update_cells)
+
     # NOTE(russellb) This method can be removed in 2.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
@@ -391,6 +406,9 @@ class ConductorManager(manager.Manager):
         result = self.db.instance_fault_create(context, values)
         return jsonutils.to_primitive(result)
 
+    def instance_fault_create_many(self, context, values_list):
+        self.db.instance_fault_create_many(context, values_list)
+
     # NOTE(kerrin): This method can be removed in v2.0 of the RPC API.
     def vol_get_usage_by_time(self, context, start_time):
         result = self.db.vol_get_usage_by_time(context, start_time)
@@ -444,6 +462,9 @@ class ConductorManager(manager.Manager):
         evt = self.db.action_event_finish(context, values)
         return jsonutils.to_primitive(evt)
 
+    def action_event_record_many(self, context, events):
+        self.db.action_event_record_many(context, events)
+
     def service_create(self, context, values):
         svc = self.db.service_create(context, values)
         return jsonutils.to_primitive(svc)
@@ -611,6 +632,19 @@ class ConductorManager(manager.Manager):
         updates['obj_what_changed'] = objinst.obj_what_changed()
         return updates, result
 
+    @rpc_common.client_exceptions(exception.ObjectBaseNotFound)
+    def object_delta_action(self, context, objinst, objbase, objmethod,
+                            args, kwargs):
+        """Perform an action on an object sent with only its changes
+        since objbase, or whole if objbase is None.
+        """
+        if objbase is not None:
+            self.object_bases.apply(objinst, objbase)
+        updates, result = self.object_action(context, objinst, objmethod,
+                                             args, kwargs)
+        updates['obj_base'] = self.object_bases.add(objinst)
+        return updates, result
+
     # NOTE(danms): This method is now deprecated and can be removed in
     # v2.0 of the RPC API
     def compute_reboot(self, context, instance, reboot_type):
@@ -16,6 +16,7 @@
 
 from oslo.config import cfg
 
+from nova import exception
 from nova.objects import base as objects_base
 from nova.openstack.common import jsonutils
 from nova.openstack.common.rpc import common as rpc_common
@@ -121,6 +122,10 @@ class ConductorAPI(rpcclient.RpcProxy):
            security_group_rule_get_by_security_group()
     1.61 - Return deleted instance from instance_destroy()
     1.62 - Added object_backport()
+    1.63 - Added bw_usage_update_many()
+    1.64 - Added instance_fault_create_many() and action_event_record_many()
+    1.65 - Added object_delta_action()
+    1.66 - Added bw_usage_get_by_uuids()
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -225,6 +230,31 @@ class ConductorAPI(rpcclient.RpcProxy):
         cctxt = self.client.prepare(version=version)
         return cctxt.call(context, 'bw_usage_update', **msg_kwargs)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        """Return the bandwidth usages of the instances in the period, or
+        None if the conductor is too old to look them up at once.
+        """
+        if not self.client.can_send_version('1.66'):
+            return None
+        cctxt = self.client.prepare(version='1.66')
+        return cctxt.call(context, 'bw_usage_get_by_uuids', uuids=uuids,
+                          start_period=start_period)
+
+    def bw_usage_update_many(self, context, usages, last_refreshed=None,
+                             update_cells=True):
+        if not self.client.can_send_version('1.63'):
+            for usage in usages:
+                self.bw_usage_update(context, usage['uuid'], usage['mac'],
+                                     usage['start_period'], usage['bw_in'],
+                                     usage['bw_out'], usage['last_ctr_in'],
+                                     usage['last_ctr_out'],
+                                     last_refreshed=last_refreshed,
+                                     update_cells=update_cells)
+            return
+        cctxt = self.client.prepare(version='1.63')
+        cctxt.call(context, 'bw_usage_update_many', usages=usages,
+                   last_refreshed=last_refreshed, update_cells=update_cells)
+
     def provider_fw_rule_get_all(self, context):
         cctxt = self.client.prepare(version='1.9')
         return cctxt.call(context, 'provider_fw_rule_get_all')
@@ -344,6 +374,28 @@ class ConductorAPI(rpcclient.RpcProxy):
         cctxt = self.client.prepare(version='1.25')
         return cctxt.call(context, 'action_event_finish', values=values_p)
 
+    def instance_fault_create_many(self, context, values_list):
+        if not self.client.can_send_version('1.64'):
+            for values in values_list:
+                self.instance_fault_create(context, values)
+            return
+        values_list_p = jsonutils.to_primitive(values_list)
+        cctxt = self.client.prepare(version='1.64')
+        cctxt.call(context, 'instance_fault_create_many',
+                   values_list=values_list_p)
+
+    def action_event_record_many(self, context, events):
+        if not self.client.can_send_version('1.64'):
+            for kind, values in events:
+                if kind == 'start':
+                    self.action_event_start(context, values)
+                else:
+                    self.action_event_finish(context, values)
+            return
+        events_p = jsonutils.to_primitive(events)
+        cctxt = self.client.prepare(version='1.64')
+        cctxt.call(context, 'action_event_record_many', events=events_p)
+
     def service_create(self, context, values):
         cctxt = self.client.prepare(version='1.27')
         return cctxt.call(context, 'service_create', values=values)
@@ -470,10 +522,33 @@ class ConductorAPI(rpcclient.RpcProxy):
                           objver=objver, args=args, kwargs=kwargs)
 
     def object_action(self, context, objinst, objmethod, args, kwargs):
+        if (CONF.conductor.send_object_changes and
+                objinst.obj_identity_fields and
+                self.client.can_send_version('1.65')):
+            return self._object_delta_action(context, objinst, objmethod,
+                                             args, kwargs)
         cctxt = self.client.prepare(version='1.50')
         return cctxt.call(context, 'object_action', objinst=objinst,
                           objmethod=objmethod, args=args, kwargs=kwargs)
 
+    def _object_delta_action(self, context, objinst, objmethod, args,
+                             kwargs):
+        cctxt = self.client.prepare(version='1.65')
+        delta = objinst.obj_to_delta_primitive()
+        if delta is not None:
+            objbase, primitive = delta
+            try:
+                return cctxt.call(context, 'object_delta_action',
+                                  objinst=primitive, objbase=objbase,
+                                  objmethod=objmethod, args=args,
+                                  kwargs=kwargs)
+            except exception.ObjectBaseNotFound:
+                # Not seen by the conductor worker this went to
+                pass
+        return cctxt.call(context, 'object_delta_action', objinst=objinst,
+                          objbase=None, objmethod=objmethod, args=args,
+                          kwargs=kwargs)
+
     def object_backport(self, context, objinst, target_version):
         cctxt = self.client.prepare(version='1.62')
         return cctxt.call(context, 'object_backport', objinst=objinst,
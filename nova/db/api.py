@@ -29,6 +29,8 @@ these objects be simple dictionaries.
 
 """
 
+import functools
+
 from oslo.config import cfg
 
 from nova.cells import rpcapi as cells_rpcapi
@@ -59,6 +61,53 @@ IMPL = db_api.DBAPI(backend_mapping=_BACKEND_MAPPING)
 LOG = logging.getLogger(__name__)
 
 
+def _read_only(f):
+    """Decorator for listing and reporting DB API calls.
+
+    The backend may serve them from a read replica, see the
+    slave_read_routing option, so their results may be up to slave_max_lag
+    seconds old.  Only calls whose callers tolerate that are tagged: the
+    lookups of single objects and of the objects of one host or instance
+    are not, since another service may just have written them.
+    """
+    name = f.__name__
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        return IMPL.route_read(name, f, *args, **kwargs)
+    return wrapper
+
+
+def _read_only_opt_in(f):
+    """Decorator for listing DB API calls which are also used to look up
+    the objects of one host, like the compute hosts do through the
+    conductor.
+
+    They are routed like the _read_only calls only within
+    stale_reads_allowed(), which the API uses around its listings.
+    """
+    name = f.__name__
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        return IMPL.route_read_opt_in(name, f, *args, **kwargs)
+    return wrapper
+
+
+def stale_reads_allowed():
+    """Context manager allowing the listings of the current thread within
+    it to be served from the slave database, see _read_only_opt_in.
+    """
+    return IMPL.stale_reads_allowed()
+
+
+def read_routing_stats():
+    """Return how many calls of every read-only DB API function were served
+    by the main or the slave database.
+    """
+    return IMPL.read_routing_stats()
+
+
 ###################
 
 
@@ -103,11 +152,13 @@ def service_get_by_host_and_topic(context, host, topic):
     return IMPL.service_get_by_host_and_topic(context, host, topic)
 
 
+@_read_only
 def service_get_all(context, disabled=None):
     """Get all services."""
     return IMPL.service_get_all(context, disabled)
 
 
+@_read_only
 def service_get_all_by_topic(context, topic):
     """Get all services for a given topic."""
     return IMPL.service_get_all_by_topic(context, topic)
@@ -176,6 +227,7 @@ def compute_node_get_by_service_id(context, service_id):
     return IMPL.compute_node_get_by_service_id(context, service_id)
 
 
+@_read_only_opt_in
 def compute_node_get_all(context, no_date_fields=False):
     """Get all computeNodes.
 
@@ -191,6 +243,7 @@ def compute_node_get_all(context, no_date_fields=False):
     return IMPL.compute_node_get_all(context, no_date_fields)
 
 
+@_read_only
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get compute nodes by hypervisor hostname.
 
@@ -245,6 +298,7 @@ def compute_node_delete(context, compute_id):
     return IMPL.compute_node_delete(context, compute_id)
 
 
+@_read_only
 def compute_node_statistics(context):
     """Get aggregate statistics over all compute nodes.
 
@@ -264,16 +318,19 @@ def certificate_create(context, values):
     return IMPL.certificate_create(context, values)
 
 
+@_read_only
 def certificate_get_all_by_project(context, project_id):
     """Get all certificates for a project."""
     return IMPL.certificate_get_all_by_project(context, project_id)
 
 
+@_read_only
 def certificate_get_all_by_user(context, user_id):
     """Get all certificates for a user."""
     return IMPL.certificate_get_all_by_user(context, user_id)
 
 
+@_read_only
 def certificate_get_all_by_user_and_project(context, user_id, project_id):
     """Get all certificates for a user and project."""
     return IMPL.certificate_get_all_by_user_and_project(context,
@@ -352,6 +409,7 @@ def floating_ip_fixed_ip_associate(context, floating_address,
                                                host)
 
 
+@_read_only
 def floating_ip_get_all(context):
     """Get all floating ips."""
     return IMPL.floating_ip_get_all(context)
@@ -362,6 +420,7 @@ def floating_ip_get_all_by_host(context, host):
     return IMPL.floating_ip_get_all_by_host(context, host)
 
 
+@_read_only
 def floating_ip_get_all_by_project(context, project_id):
     """Get all floating ips by project."""
     return IMPL.floating_ip_get_all_by_project(context, project_id)
@@ -392,6 +451,7 @@ def floating_ip_set_auto_assigned(context, address):
     return IMPL.floating_ip_set_auto_assigned(context, address)
 
 
+@_read_only
 def dnsdomain_list(context):
     """Get a list of all zones in our database, public and private."""
     return IMPL.dnsdomain_list(context)
@@ -458,6 +518,7 @@ def migration_get_in_progress_by_host_and_node(context, host, node):
     return IMPL.migration_get_in_progress_by_host_and_node(context, host, node)
 
 
+@_read_only_opt_in
 def migration_get_all_by_filters(context, filters):
     """Finds all migrations in progress."""
     return IMPL.migration_get_all_by_filters(context, filters)
@@ -516,6 +577,7 @@ def fixed_ip_get(context, id, get_network=False):
     return IMPL.fixed_ip_get(context, id, get_network)
 
 
+@_read_only
 def fixed_ip_get_all(context):
     """Get all defined fixed ips."""
     return IMPL.fixed_ip_get_all(context)
@@ -603,6 +665,7 @@ def virtual_interface_delete_by_instance(context, instance_id):
     return IMPL.virtual_interface_delete_by_instance(context, instance_id)
 
 
+@_read_only
 def virtual_interface_get_all(context):
     """Gets all virtual interfaces from the table."""
     return IMPL.virtual_interface_get_all(context)
@@ -640,21 +703,30 @@ def instance_get(context, instance_id, columns_to_join=None):
                              columns_to_join=columns_to_join)
 
 
+@_read_only
 def instance_get_all(context, columns_to_join=None):
     """Get all instances."""
     return IMPL.instance_get_all(context, columns_to_join=columns_to_join)
 
 
+@_read_only_opt_in
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, columns=None):
+    """Get all instances that match all filters.
+
+    If columns is given, only those instance columns (plus id and uuid)
+    are loaded and relationships other than manually-joined metadata are
+    not loaded at all.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
-                                            columns_to_join=columns_to_join)
+                                            columns_to_join=columns_to_join,
+                                            columns=columns)
 
 
+@_read_only
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Get instances and joins active during a certain time window.
@@ -667,9 +739,16 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 def instance_get_all_by_host(context, host,
-                             columns_to_join=None, use_slave=False):
-    """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host, columns_to_join)
+                             columns_to_join=None, use_slave=False,
+                             columns=None):
+    """Get all instances belonging to a host.
+
+    If columns is given, only those instance columns (plus id and uuid)
+    are loaded.
+    """
+    return IMPL.instance_get_all_by_host(context, host, columns_to_join,
+                                         use_slave=use_slave,
+                                         columns=columns)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -693,6 +772,7 @@ def instance_floating_address_get_all(context, instance_uuid):
 
 
 # NOTE(hanlind): This method can be removed as conductor RPC API moves to v2.0.
+@_read_only
 def instance_get_all_hung_in_rebooting(context, reboot_window):
     """Get all instances stuck in a rebooting state."""
     return IMPL.instance_get_all_hung_in_rebooting(context, reboot_window)
@@ -741,6 +821,15 @@ def instance_update_and_get_original(context, instance_uuid, values,
     return rv
 
 
+def instance_update_columns(context, instance_uuid, values):
+    """Set the given scalar columns of an instance with a single UPDATE,
+    without reading the instance.
+
+    :returns: the values written, including updated_at
+    """
+    return IMPL.instance_update_columns(context, instance_uuid, values)
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -782,11 +871,13 @@ def instance_group_delete(context, group_uuid):
     return IMPL.instance_group_delete(context, group_uuid)
 
 
+@_read_only
 def instance_group_get_all(context):
     """Get all groups."""
     return IMPL.instance_group_get_all(context)
 
 
+@_read_only
 def instance_group_get_all_by_project_id(context, project_id):
     """Get all groups for a specific project_id."""
     return IMPL.instance_group_get_all_by_project_id(context, project_id)
@@ -863,6 +954,15 @@ def instance_info_cache_update(context, instance_uuid, values):
     return IMPL.instance_info_cache_update(context, instance_uuid, values)
 
 
+def instance_info_cache_update_many(context, values_by_uuid):
+    """Update the info cache records of many instances at once.
+
+    :param values_by_uuid: = dict of instance uuid to the dict containing
+                             column values to update its info cache with
+    """
+    return IMPL.instance_info_cache_update_many(context, values_by_uuid)
+
+
 def instance_info_cache_delete(context, instance_uuid):
     """Deletes an existing instance_info_cache record
 
@@ -889,6 +989,7 @@ def key_pair_get(context, user_id, name):
     return IMPL.key_pair_get(context, user_id, name)
 
 
+@_read_only
 def key_pair_get_all_by_user(context, user_id):
     """Get all key_pairs by user."""
     return IMPL.key_pair_get_all_by_user(context, user_id)
@@ -946,6 +1047,7 @@ def network_get(context, network_id, project_only="allow_none"):
     return IMPL.network_get(context, network_id, project_only=project_only)
 
 
+@_read_only
 def network_get_all(context, project_only="allow_none"):
     """Return all defined networks."""
     return IMPL.network_get_all(context, project_only)
@@ -1087,6 +1189,11 @@ def quota_usage_update(context, project_id, user_id, resource, **kwargs):
                                    **kwargs)
 
 
+def quota_usage_refresh_all(context):
+    """Set the in_use of all quota usages to the actual usage."""
+    return IMPL.quota_usage_refresh_all(context)
+
+
 ###################
 
 
@@ -1112,6 +1219,34 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
                                      user_id=user_id)
 
 
+def quota_reserve_counted(context, resources, quotas, user_quotas, deltas,
+                          expire, until_refresh, max_age, project_id=None,
+                          user_id=None):
+    """Check quotas and create appropriate reservations, updating usages as
+    counters instead of locking them.
+    """
+    return IMPL.quota_reserve_counted(context, resources, quotas,
+                                      user_quotas, deltas, expire,
+                                      until_refresh, max_age,
+                                      project_id=project_id, user_id=user_id)
+
+
+def reservation_commit_counted(context, reservations, project_id=None,
+                               user_id=None):
+    """Commit quota reservations made by quota_reserve_counted()."""
+    return IMPL.reservation_commit_counted(context, reservations,
+                                           project_id=project_id,
+                                           user_id=user_id)
+
+
+def reservation_rollback_counted(context, reservations, project_id=None,
+                                 user_id=None):
+    """Roll back quota reservations made by quota_reserve_counted()."""
+    return IMPL.reservation_rollback_counted(context, reservations,
+                                             project_id=project_id,
+                                             user_id=user_id)
+
+
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     """Destroy all quotas associated with a given project and user."""
     return IMPL.quota_destroy_all_by_project_and_user(context,
@@ -1211,6 +1346,7 @@ def block_device_mapping_destroy_by_instance_and_volume(context, instance_uuid,
 ####################
 
 
+@_read_only
 def security_group_get_all(context):
     """Get all security groups."""
     return IMPL.security_group_get_all(context)
@@ -1324,6 +1460,7 @@ def security_group_default_rule_create(context, values):
     return IMPL.security_group_default_rule_create(context, values)
 
 
+@_read_only
 def security_group_default_rule_list(context):
     return IMPL.security_group_default_rule_list(context)
 
@@ -1416,6 +1553,7 @@ def flavor_create(context, values, projects=None):
     return IMPL.flavor_create(context, values, projects=projects)
 
 
+@_read_only
 def flavor_get_all(context, inactive=False, filters=None, sort_key='flavorid',
                    sort_dir='asc', limit=None, marker=None):
     """Get all instance flavors."""
@@ -1484,6 +1622,13 @@ def flavor_extra_specs_update_or_create(context, flavor_id,
     IMPL.flavor_extra_specs_update_or_create(context, flavor_id,
                                                     extra_specs)
 
+
+def flavor_generation_get(context):
+    """Return a value which changes whenever a flavor, its extra specs or
+    its access list are changed.
+    """
+    return IMPL.flavor_generation_get(context)
+
 ####################
 
 
@@ -1539,6 +1684,7 @@ def cell_get(context, cell_name):
     return IMPL.cell_get(context, cell_name)
 
 
+@_read_only
 def cell_get_all(context):
     """Get all child Cells."""
     return IMPL.cell_get_all(context)
@@ -1591,6 +1737,7 @@ def agent_build_get_by_triple(context, hypervisor, os, architecture):
             architecture)
 
 
+@_read_only
 def agent_build_get_all(context, hypervisor=None):
     """Get all agent builds."""
     return IMPL.agent_build_get_all(context, hypervisor)
@@ -1637,9 +1784,34 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_many(context, usages, last_refreshed=None,
+                         update_cells=True):
+    """Update cached bandwidth usage for many instance networks at once.
+    Creates new records if needed.
+
+    :param usages: list of dicts with the uuid, mac, start_period, bw_in,
+                   bw_out, last_ctr_in and last_ctr_out of every network
+    """
+    rv = IMPL.bw_usage_update_many(context, usages,
+                                   last_refreshed=last_refreshed)
+    if update_cells:
+        try:
+            cells_api = cells_rpcapi.CellsAPI()
+            for usage in usages:
+                cells_api.bw_usage_update_at_top(context,
+                        usage['uuid'], usage['mac'], usage['start_period'],
+                        usage['bw_in'], usage['bw_out'],
+                        usage['last_ctr_in'], usage['last_ctr_out'],
+                        last_refreshed)
+        except Exception:
+            LOG.exception(_("Failed to notify cells of bw_usage update"))
+    return rv
+
+
 ###################
 
 
+@_read_only
 def vol_get_usage_by_time(context, begin):
     """Return volumes usage that have been updated after a specified time."""
     return IMPL.vol_get_usage_by_time(context, begin)
@@ -1733,6 +1905,7 @@ def aggregate_delete(context, aggregate_id):
     return IMPL.aggregate_delete(context, aggregate_id)
 
 
+@_read_only
 def aggregate_get_all(context):
     """Get all aggregates."""
     return IMPL.aggregate_get_all(context)
@@ -1782,6 +1955,20 @@ def instance_fault_create(context, values, update_cells=True):
     return rv
 
 
+def instance_fault_create_many(context, values_list, update_cells=True):
+    """Create many Instance Faults at once."""
+    rv = IMPL.instance_fault_create_many(context, values_list)
+    if update_cells:
+        try:
+            cells_api = cells_rpcapi.CellsAPI()
+            for fault in rv:
+                cells_api.instance_fault_create_at_top(context, fault)
+        except Exception:
+            LOG.exception(_("Failed to notify cells of instance fault"))
+    return rv
+
+
+@_read_only
 def instance_fault_get_by_instance_uuids(context, instance_uuids):
     """Get all instance faults for the provided instance_uuids."""
     return IMPL.instance_fault_get_by_instance_uuids(context, instance_uuids)
@@ -1820,6 +2007,11 @@ def action_event_finish(context, values):
     return IMPL.action_event_finish(context, values)
 
 
+def action_event_record_many(context, events):
+    """Start and finish many events on instance actions at once."""
+    return IMPL.action_event_record_many(context, events)
+
+
 def action_events_get(context, action_id):
     """Get the events by action id."""
     return IMPL.action_events_get(context, action_id)
@@ -1880,6 +2072,7 @@ def task_log_begin_task(context, task_name,
                                     message)
 
 
+@_read_only
 def task_log_get_all(context, task_name, period_beginning,
                  period_ending, host=None, state=None):
     return IMPL.task_log_get_all(context, task_name, period_beginning,
@@ -1912,3 +2105,21 @@ def archive_deleted_rows_for_table(context, tablename, max_rows=None):
     """
     return IMPL.archive_deleted_rows_for_table(context, tablename,
                                                max_rows=max_rows)
+
+
+def archive_deleted_rows_chunk(context, tablename, max_rows, marker=None):
+    """Move the next max_rows deleted rows after marker from tablename to
+    the corresponding shadow table.
+
+    :returns: tuple of (rows archived, marker for the next chunk). The marker
+              is None once no deleted rows are left after the given marker.
+    """
+    return IMPL.archive_deleted_rows_chunk(context, tablename, max_rows,
+                                           marker=marker)
+
+
+def archive_tablenames(context):
+    """Return the names of the tables that can be archived, with tables
+    holding foreign keys before the tables they reference.
+    """
+    return IMPL.archive_tablenames(context)
@@ -0,0 +1,170 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Online, incremental archiving of soft-deleted rows to shadow tables.
+
+Unlike db.archive_deleted_rows(), which moves rows with a single unbounded
+statement per table, the archiver walks every table in small chunks ordered
+by key, so that it can run against a live database without holding locks
+for long.  Tables are visited children first so that rows referencing
+another table are archived before the rows they reference.  The rate of
+archiving is capped, lock waits are retried with an exponential backoff
+and the position reached in every table is checkpointed to a file, so an
+interrupted archiver picks up where it stopped.
+"""
+
+import json
+import os
+import time
+
+from oslo.config import cfg
+
+from nova import db
+from nova.openstack.common.db import exception as db_exc
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova import paths
+
+archiver_opts = [
+    cfg.IntOpt('archive_rows_per_second',
+               default=100,
+               help='Maximum number of deleted rows per second moved to '
+                    'shadow tables by the online archiver, 0 for no limit'),
+    cfg.IntOpt('archive_chunk_size',
+               default=100,
+               help='Number of deleted rows the online archiver moves in '
+                    'one transaction'),
+    cfg.FloatOpt('archive_lock_backoff',
+                 default=1.0,
+                 help='Seconds the online archiver waits before retrying a '
+                      'chunk whose rows were locked, doubled on every retry'),
+    cfg.FloatOpt('archive_max_lock_backoff',
+                 default=60.0,
+                 help='Maximum seconds the online archiver waits before '
+                      'retrying a chunk whose rows were locked'),
+    cfg.StrOpt('archive_checkpoint_file',
+               default=paths.state_path_def('archive_checkpoint.json'),
+               help='File where the online archiver records how far it got '
+                    'in every table'),
+    cfg.IntOpt('archive_pass_interval',
+               default=600,
+               help='Seconds between two passes of the online archiver over '
+                    'all tables'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(archiver_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+class OnlineArchiver(object):
+    """Moves deleted rows to shadow tables a chunk at a time."""
+
+    def __init__(self, context, rows_per_second=None, chunk_size=None,
+                 checkpoint_file=None):
+        self.context = context
+        if rows_per_second is None:
+            rows_per_second = CONF.archive_rows_per_second
+        self.rows_per_second = rows_per_second
+        self.chunk_size = chunk_size or CONF.archive_chunk_size
+        self.checkpoint_file = (checkpoint_file or
+                                CONF.archive_checkpoint_file)
+        self.markers = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_file):
+            return {}
+        try:
+            with open(self.checkpoint_file) as f:
+                return json.load(f)
+        except (IOError, ValueError) as e:
+            LOG.warn(_("Ignoring unreadable archive checkpoint %(file)s: "
+                       "%(error)s"),
+                     {'file': self.checkpoint_file, 'error': e})
+            return {}
+
+    def _save_checkpoint(self):
+        # Write to a temporary file and rename it over the checkpoint so
+        # that a crash never leaves a truncated checkpoint behind.
+        tmp_file = self.checkpoint_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.markers, f)
+        os.rename(tmp_file, self.checkpoint_file)
+
+    def _throttle(self, rows, elapsed):
+        if not self.rows_per_second or not rows:
+            return
+        delay = float(rows) / self.rows_per_second - elapsed
+        if delay > 0:
+            time.sleep(delay)
+
+    def _archive_chunk(self, tablename, marker):
+        backoff = CONF.archive_lock_backoff
+        while True:
+            try:
+                return db.archive_deleted_rows_chunk(
+                    self.context, tablename, self.chunk_size, marker=marker)
+            except db_exc.DBDeadlock:
+                LOG.info(_("Rows of %(table)s are locked, retrying in "
+                           "%(backoff).1f seconds"),
+                         {'table': tablename, 'backoff': backoff})
+                time.sleep(backoff)
+                backoff = min(backoff * 2, CONF.archive_max_lock_backoff)
+
+    def archive_table(self, tablename):
+        """Archive all deleted rows of one table, starting from the
+        checkpointed position.
+
+        :returns: number of rows archived
+        """
+        rows_archived = 0
+        marker = self.markers.get(tablename)
+        while True:
+            start = time.time()
+            rows, marker = self._archive_chunk(tablename, marker)
+            if marker is None:
+                # The table is done, the next pass starts over since rows
+                # may have been deleted behind us in the meantime.
+                self.markers.pop(tablename, None)
+                self._save_checkpoint()
+                break
+            rows_archived += rows
+            self.markers[tablename] = marker
+            self._save_checkpoint()
+            self._throttle(rows, time.time() - start)
+        if rows_archived:
+            LOG.info(_("Archived %(rows)d deleted rows from %(table)s"),
+                     {'rows': rows_archived, 'table': tablename})
+        return rows_archived
+
+    def run_once(self):
+        """Make one pass over all tables which have shadow tables.
+
+        :returns: dict of table name to number of rows archived
+        """
+        archived = {}
+        for tablename in db.archive_tablenames(self.context):
+            archived[tablename] = self.archive_table(tablename)
+        return archived
+
+    def run_forever(self, interval=None):
+        """Archive continuously, waiting interval seconds between passes."""
+        if interval is None:
+            interval = CONF.archive_pass_interval
+        while True:
+            archived = self.run_once()
+            LOG.info(_("Archive pass moved %(rows)d deleted rows"),
+                     {'rows': sum(archived.values())})
+            time.sleep(interval)
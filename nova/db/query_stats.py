@@ -0,0 +1,184 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Accounting of DB queries to API requests, RPC calls and periodic tasks.
+
+Work which should be accounted runs in a scope(), which is sampled with
+db_query_stats_sample_rate.  The DB backend reports every query it runs to
+record(), which counts it against the scope of the current thread.  When a
+sampled scope ends, its queries, rows and time are logged together with its
+request id, statements repeated more than db_query_stats_repeat_threshold
+times are logged as likely N+1 patterns, and the totals per scope are
+logged every db_query_stats_summary_interval seconds.
+
+Queries slower than db_slow_query_time are passed to the slow query hooks,
+sampled or not.
+"""
+
+import collections
+import contextlib
+import random
+import re
+import threading
+import time
+
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import local
+from nova.openstack.common import log as logging
+
+query_stats_opts = [
+    cfg.FloatOpt('db_query_stats_sample_rate',
+                 default=0.0,
+                 help='Fraction of API requests, RPC calls and periodic '
+                      'tasks whose DB queries are counted and logged, '
+                      'between 0 and 1'),
+    cfg.IntOpt('db_query_stats_repeat_threshold',
+               default=10,
+               help='Number of times the same statement may run within one '
+                    'sampled API request, RPC call or periodic task before '
+                    'it is logged as a likely N+1 query pattern'),
+    cfg.IntOpt('db_query_stats_summary_interval',
+               default=600,
+               help='Seconds between two logged summaries of the DB usage '
+                    'of sampled API requests, RPC calls and periodic tasks'),
+    cfg.FloatOpt('db_slow_query_time',
+                 default=0.0,
+                 help='Seconds above which a DB query is logged as slow, 0 '
+                      'to disable'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(query_stats_opts)
+
+LOG = logging.getLogger(__name__)
+
+_LOCAL = threading.local()
+_TOTALS = collections.defaultdict(collections.Counter)
+_SUMMARY = {'logged_at': time.time()}
+_SLOW_QUERY_HOOKS = []
+
+# Ids in URLs, so that all requests to the same resource add up together.
+_ID_RE = re.compile(r'/([0-9a-fA-F-]{32,36}|\d+)(?=/|$)')
+
+
+class ScopeStats(object):
+    """DB queries run by one API request, RPC call or periodic task."""
+
+    def __init__(self, name, sampled):
+        self.name = name
+        self.sampled = sampled
+        self.queries = 0
+        self.rows = 0
+        self.time = 0.0
+        self.statements = collections.Counter()
+
+
+def enabled():
+    return (CONF.db_query_stats_sample_rate > 0 or
+            CONF.db_slow_query_time > 0)
+
+
+def _current_request_id():
+    ctxt = getattr(local.store, 'context', None)
+    return getattr(ctxt, 'request_id', None)
+
+
+@contextlib.contextmanager
+def scope(name):
+    """Account the DB queries run by this thread within the block to name.
+
+    Nested scopes are accounted to the outermost one.
+    """
+    if getattr(_LOCAL, 'scope', None) is not None:
+        yield
+        return
+    stats = ScopeStats(name,
+                       random.random() < CONF.db_query_stats_sample_rate)
+    _LOCAL.scope = stats
+    try:
+        yield
+    finally:
+        _LOCAL.scope = None
+        if stats.sampled:
+            _finish(stats)
+
+
+def register_slow_query_hook(hook):
+    """Call hook(statement, elapsed, scope_name) for every slow query."""
+    _SLOW_QUERY_HOOKS.append(hook)
+
+
+def _log_slow_query(statement, elapsed, scope_name):
+    LOG.warn(_("Slow DB query (%(elapsed).3f seconds) in %(scope)s: "
+               "%(statement)s"),
+             {'elapsed': elapsed, 'scope': scope_name or 'no scope',
+              'statement': statement})
+
+
+def record(statement, rows, elapsed):
+    """Account one query to the scope of the current thread."""
+    stats = getattr(_LOCAL, 'scope', None)
+    if CONF.db_slow_query_time and elapsed >= CONF.db_slow_query_time:
+        scope_name = getattr(stats, 'name', None)
+        for hook in [_log_slow_query] + _SLOW_QUERY_HOOKS:
+            hook(statement, elapsed, scope_name)
+    if stats is None or not stats.sampled:
+        return
+    stats.queries += 1
+    stats.rows += rows
+    stats.time += elapsed
+    stats.statements[statement] += 1
+
+
+def _finish(stats):
+    values = {'name': stats.name, 'request_id': _current_request_id(),
+              'queries': stats.queries, 'rows': stats.rows,
+              'time': stats.time}
+    LOG.info(_("DB usage of %(name)s (%(request_id)s): %(queries)d queries, "
+               "%(rows)d rows, %(time).3f seconds"), values)
+    for statement, count in stats.statements.iteritems():
+        if count > CONF.db_query_stats_repeat_threshold:
+            LOG.warn(_("%(name)s (%(request_id)s) ran the same DB query "
+                       "%(count)d times, likely an N+1 query pattern: "
+                       "%(statement)s"),
+                     dict(values, count=count, statement=statement))
+
+    totals = _TOTALS[_ID_RE.sub('/*', stats.name)]
+    totals['calls'] += 1
+    totals['queries'] += stats.queries
+    totals['rows'] += stats.rows
+    totals['time'] += stats.time
+    if (time.time() - _SUMMARY['logged_at'] >=
+            CONF.db_query_stats_summary_interval):
+        log_summary()
+
+
+def summary():
+    """Return the DB usage totals per scope since the last summary."""
+    return dict((name, dict(totals)) for name, totals in _TOTALS.items())
+
+
+def log_summary():
+    """Log the DB usage totals per scope, most expensive first, and start
+    over.
+    """
+    _SUMMARY['logged_at'] = time.time()
+    totals = sorted(_TOTALS.items(), key=lambda item: -item[1]['time'])
+    _TOTALS.clear()
+    for name, values in totals:
+        LOG.info(_("DB usage summary of %(name)s: %(calls)d sampled calls, "
+                   "%(queries)d queries, %(rows)d rows, %(time).3f seconds"),
+                 dict(values, name=name))
@@ -20,11 +20,14 @@
 """Implementation of SQLAlchemy backend."""
 
 import collections
+import contextlib
 import copy
 import datetime
 import functools
 import itertools
+import re
 import sys
+import threading
 import time
 import uuid
 
@@ -32,9 +35,12 @@ from oslo.config import cfg
 import six
 from sqlalchemy import and_
 from sqlalchemy import Boolean
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
 from sqlalchemy.exc import DataError
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.exc import OperationalError
 from sqlalchemy import Integer
 from sqlalchemy import MetaData
 from sqlalchemy import or_
@@ -44,15 +50,19 @@ from sqlalchemy.orm import joinedload_all
 from sqlalchemy.orm import noload
 from sqlalchemy.schema import Table
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import desc
+from sqlalchemy.sql.expression import exists
 from sqlalchemy.sql.expression import select
 from sqlalchemy.sql import func
 from sqlalchemy import String
 
 from nova import block_device
+from nova.compute import stats as compute_stats
 from nova.compute import task_states
 from nova.compute import vm_states
 import nova.context
+from nova.db import query_stats
 from nova.db.sqlalchemy import models
 from nova import exception
 from nova.openstack.common.db import exception as db_exc
@@ -70,6 +80,28 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.BoolOpt('slave_read_routing',
+                default=False,
+                help='Serve listing and reporting DB API calls from the '
+                     'slave_connection database, falling back to the main '
+                     'database when the slave lags or fails, or when the '
+                     'caller wrote recently'),
+    cfg.IntOpt('slave_max_lag',
+               default=30,
+               help='Replication lag in seconds above which reads are not '
+                    'sent to the slave database, and time after a write '
+                    'during which reads of the same thread are not either'),
+    cfg.IntOpt('slave_lag_check_interval',
+               default=10,
+               help='Seconds between two checks of the replication lag of '
+                    'the slave database'),
+    cfg.BoolOpt('compact_compute_node_stats',
+                default=False,
+                help='Store the stats of compute nodes in one versioned '
+                     'column of compute_nodes instead of compute_node_stats '
+                     'rows.  The stats of each node are converted by its '
+                     'next update, and written as rows again by its next '
+                     'update once this is unset'),
 ]
 
 CONF = cfg.CONF
@@ -86,7 +118,33 @@ CONF.import_opt('slave_connection',
 LOG = logging.getLogger(__name__)
 
 get_engine = db_session.get_engine
-get_session = db_session.get_session
+
+
+def get_session(**kwargs):
+    if 'slave_session' not in kwargs and _reading_from_slave():
+        kwargs['slave_session'] = True
+    return db_session.get_session(**kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if context is not None and query_stats.enabled():
+        context._query_stats_start = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = getattr(context, '_query_stats_start', None)
+    if start is not None:
+        # NOTE: rowcount is -1 for SELECTs on some drivers, such rows are
+        # not counted.
+        query_stats.record(statement, max(cursor.rowcount, 0),
+                           time.time() - start)
+
+
+# Every query of every engine is reported to query_stats.
+event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
 
 
 _SHADOW_TABLE_PREFIX = 'shadow_'
@@ -177,6 +235,143 @@ def _retry_on_deadlock(f):
     return wrapped
 
 
+# NOTE: Read routing state.  The thread local records whether the current
+# call is being served by the slave, whether the thread tolerates stale
+# results of the listings which need opting in, and when it last committed
+# to the main database.
+_ROUTING = threading.local()
+_READ_ROUTING_STATS = collections.defaultdict(collections.Counter)
+_SLAVE_LAG = {'checked_at': None, 'lag': None}
+_SLAVE_LAG_QUERIES = {
+    'mysql': 'SHOW SLAVE STATUS',
+    'postgresql': 'SELECT CASE WHEN pg_is_in_recovery() THEN EXTRACT('
+                  'EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+                  'ELSE 0 END',
+}
+
+
+def _reading_from_slave():
+    return getattr(_ROUTING, 'use_slave', False)
+
+
+def _record_write(conn):
+    if not _reading_from_slave():
+        _ROUTING.last_write = time.time()
+
+
+event.listen(Engine, 'commit', _record_write)
+
+
+def _slave_lag():
+    """Return the replication lag of the slave in seconds, or None if it
+    is unknown.  The result is cached for slave_lag_check_interval.
+    """
+    now = time.time()
+    checked_at = _SLAVE_LAG['checked_at']
+    if (checked_at is not None and
+            now - checked_at < CONF.slave_lag_check_interval):
+        return _SLAVE_LAG['lag']
+
+    lag = None
+    try:
+        engine = get_engine(slave_engine=True)
+        query = _SLAVE_LAG_QUERIES.get(engine.name)
+        if query is None:
+            lag = 0
+        else:
+            row = engine.execute(query).first()
+            if row is None:
+                # Not replicating, so the "slave" is the master itself
+                lag = 0
+            elif engine.name == 'mysql':
+                # NULL when replication is broken
+                lag = row['Seconds_Behind_Master']
+            else:
+                lag = row[0]
+    except Exception as e:
+        LOG.warn(_("Could not check the slave database replication lag: "
+                   "%s"), e)
+    _SLAVE_LAG.update(checked_at=now, lag=lag)
+    return lag
+
+
+def _read_route():
+    """Decide where the next read-only call of this thread goes."""
+    if (not CONF.slave_read_routing or
+            not CONF.database.slave_connection):
+        return 'primary'
+    last_write = getattr(_ROUTING, 'last_write', None)
+    if last_write is not None and (time.time() - last_write <
+                                   CONF.slave_max_lag):
+        # The slave may not have our own writes yet.
+        return 'primary_recent_write'
+    lag = _slave_lag()
+    if lag is None or lag > CONF.slave_max_lag:
+        return 'primary_lag'
+    return 'slave'
+
+
+def route_read(name, f, *args, **kwargs):
+    """Call the read-only DB API function f, from the slave if possible.
+
+    Every query made by f through model_query() or get_session() goes to
+    the slave when it is routed there.  If the slave fails, f is run again
+    against the main database.  Calls are counted per function and route,
+    see read_routing_stats().
+    """
+    if _reading_from_slave():
+        # Nested in another read-only call
+        return f(*args, **kwargs)
+    route = _read_route()
+    _READ_ROUTING_STATS[name][route] += 1
+    if route != 'slave':
+        return f(*args, **kwargs)
+
+    _ROUTING.use_slave = True
+    try:
+        return f(*args, **kwargs)
+    except OperationalError as e:
+        LOG.warn(_("Reading %(name)s from the slave database failed, using "
+                   "the main database: %(error)s"),
+                 {'name': name, 'error': e})
+        # Do not use the slave again until the next lag check.
+        _SLAVE_LAG.update(checked_at=time.time(), lag=None)
+        _READ_ROUTING_STATS[name]['primary_slave_error'] += 1
+    finally:
+        _ROUTING.use_slave = False
+    return f(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def stale_reads_allowed():
+    """Allow the calls of this thread within the block to route_read_opt_in()
+    to be served by the slave.
+    """
+    allowed = getattr(_ROUTING, 'stale_reads_allowed', False)
+    _ROUTING.stale_reads_allowed = True
+    try:
+        yield
+    finally:
+        _ROUTING.stale_reads_allowed = allowed
+
+
+def route_read_opt_in(name, f, *args, **kwargs):
+    """Call the read-only DB API function f like route_read(), if the
+    calling thread allowed stale reads, else from the main database.
+    """
+    if not getattr(_ROUTING, 'stale_reads_allowed', False):
+        return f(*args, **kwargs)
+    return route_read(name, f, *args, **kwargs)
+
+
+def read_routing_stats():
+    """Return a dict of read-only function name to a dict of route name to
+    the number of calls which took it.
+    """
+    return dict((name, dict(routes))
+                for name, routes in _READ_ROUTING_STATS.items())
+
+
 def model_query(context, model, *args, **kwargs):
     """Query helper that accounts for context's `read_deleted` field.
 
@@ -193,7 +388,7 @@ def model_query(context, model, *args, **kwargs):
             model parameter.
     """
 
-    use_slave = kwargs.get('use_slave') or False
+    use_slave = kwargs.get('use_slave') or _reading_from_slave()
     if CONF.database.slave_connection == '':
         use_slave = False
 
@@ -323,6 +518,33 @@ QUOTA_SYNC_FUNCTIONS = {
     '_sync_security_groups': _sync_security_groups,
 }
 
+
+def _sync_all(context, session):
+    """Count the usages of all the resources with a sync routine, for all
+    projects at once.
+
+    :returns: {(project_id, user_id): {resource: in_use}}, with a user_id
+              of None for the per project resources
+    """
+    usages = collections.defaultdict(dict)
+    for project_id, user_id, instances, cores, ram in \
+            _instance_data_get_all(context, session):
+        usages[(project_id, user_id)].update(instances=instances,
+                                             cores=cores or 0,
+                                             ram=ram or 0)
+    for project_id, count in _floating_ip_count_all(context, session):
+        usages[(project_id, None)]['floating_ips'] = count
+    for count, project_id in _fixed_ip_count_all(context, session):
+        usages[(project_id, None)]['fixed_ips'] = count
+    for project_id, user_id, count in \
+            _security_group_count_all(context, session):
+        usages[(project_id, user_id)]['security_groups'] = count
+    return usages
+
+# The resources counted by _sync_all()
+QUOTA_SYNC_ALL_RESOURCES = ['instances', 'cores', 'ram', 'floating_ips',
+                            'fixed_ips', 'security_groups']
+
 ###################
 
 
@@ -501,12 +723,13 @@ def compute_node_get(context, compute_id):
     return _compute_node_get(context, compute_id)
 
 
-def _compute_node_get(context, compute_id, session=None):
-    result = model_query(context, models.ComputeNode, session=session).\
+def _compute_node_get(context, compute_id, session=None, with_stats=True):
+    query = model_query(context, models.ComputeNode, session=session).\
             filter_by(id=compute_id).\
-            options(joinedload('service')).\
-            options(joinedload('stats')).\
-            first()
+            options(joinedload('service'))
+    if with_stats:
+        query = query.options(joinedload('stats'))
+    result = query.first()
 
     if not result:
         raise exception.ComputeHostNotFound(host=compute_id)
@@ -558,10 +781,14 @@ def compute_node_get_all(context, no_date_fields):
                             order_by(service.c.id)
         service_rows = conn.execute(service_query).fetchall()
 
-        stat_query = select(filter_columns(stat)).\
-                        where(stat.c.deleted == 0).\
-                        order_by(stat.c.compute_node_id)
-        stat_rows = conn.execute(stat_query).fetchall()
+        # Nodes with compact stats have no stat rows, so only join the stats
+        # table when some node is still stored the old way.
+        stat_rows = []
+        if any(row['compact_stats'] is None for row in compute_node_rows):
+            stat_query = select(filter_columns(stat)).\
+                            where(stat.c.deleted == 0).\
+                            order_by(stat.c.compute_node_id)
+            stat_rows = conn.execute(stat_query).fetchall()
 
     # NOTE(msdubov): Transferring sqla.RowProxy objects to dicts.
     stats = [dict(proxy.items()) for proxy in stat_rows]
@@ -593,6 +820,11 @@ def compute_node_get_all(context, no_date_fields):
             else:
                 node['stats'] = []
 
+    for node in compute_nodes:
+        node_stats = compute_stats.from_compact(node['compact_stats'])
+        if node_stats is not None:
+            node['stats'] = node_stats
+
     return compute_nodes
 
 
@@ -622,7 +854,11 @@ def compute_node_create(context, values):
     """Creates a new ComputeNode and populates the capacity fields
     with the most recent data.
     """
-    _prep_stats_dict(values)
+    if CONF.compact_compute_node_stats:
+        values['compact_stats'] = compute_stats.to_compact(
+            values.pop('stats', {}))
+    else:
+        _prep_stats_dict(values)
     convert_datetimes(values, 'created_at', 'deleted_at', 'updated_at')
 
     compute_node_ref = models.ComputeNode()
@@ -667,15 +903,61 @@ def _update_stats(context, new_stats, compute_id, session, prune_stats=False):
         session.add(stat)
 
 
+def _update_compact_stats(context, compute_ref, new_stats, session,
+                          prune_stats=False):
+    """Return the compact stats of a node updated with new_stats."""
+    stats = compute_stats.from_compact(compute_ref['compact_stats'])
+    if stats is None:
+        # First compact update of the node: carry its stat rows over, and
+        # retire them.
+        query = model_query(context, models.ComputeNodeStat, session=session,
+                            read_deleted="no").\
+                    filter_by(compute_node_id=compute_ref['id'])
+        stats = dict((stat['key'], stat['value']) for stat in query.all())
+        query.soft_delete(synchronize_session=False)
+    if prune_stats:
+        stats = {}
+    stats.update(new_stats)
+    return compute_stats.to_compact(stats)
+
+
 @require_admin_context
 def compute_node_update(context, compute_id, values, prune_stats=False):
     """Updates the ComputeNode record with the most recent data."""
+    update_stats = 'stats' in values or prune_stats
     stats = values.pop('stats', {})
 
     session = get_session()
     with session.begin():
-        _update_stats(context, stats, compute_id, session, prune_stats)
-        compute_ref = _compute_node_get(context, compute_id, session=session)
+        if CONF.compact_compute_node_stats:
+            # Only the compute_nodes row is written, and stat rows are
+            # neither read nor joined.
+            compute_ref = _compute_node_get(context, compute_id,
+                                            session=session,
+                                            with_stats=False)
+            if update_stats:
+                values['compact_stats'] = _update_compact_stats(
+                    context, compute_ref, stats, session, prune_stats)
+        else:
+            if update_stats and not prune_stats:
+                # Carry the stats of a node updated while stats were
+                # compacted back over to its rows.
+                compact_stats = model_query(context,
+                                            models.ComputeNode.compact_stats,
+                                            base_model=models.ComputeNode,
+                                            session=session).\
+                                    filter_by(id=compute_id).\
+                                    scalar()
+                old_stats = compute_stats.from_compact(compact_stats)
+                if old_stats:
+                    old_stats.update(stats)
+                    stats = old_stats
+            _update_stats(context, stats, compute_id, session, prune_stats)
+            compute_ref = _compute_node_get(context, compute_id,
+                                            session=session)
+            if update_stats:
+                # The rows are authoritative again.
+                values['compact_stats'] = None
         # Always update this, even if there's going to be no other
         # changes in data.  This ensures that we invalidate the
         # scheduler cache of compute node data in case of races.
@@ -876,6 +1158,16 @@ def _floating_ip_count_by_project(context, project_id, session=None):
                    count()
 
 
+def _floating_ip_count_all(context, session):
+    return model_query(context, models.FloatingIp.project_id,
+                       func.count(models.FloatingIp.id),
+                       base_model=models.FloatingIp, read_deleted="no",
+                       session=session).\
+                   filter_by(auto_assigned=False).\
+                   group_by(models.FloatingIp.project_id).\
+                   all()
+
+
 @require_context
 @_retry_on_deadlock
 def floating_ip_fixed_ip_associate(context, floating_address,
@@ -1415,6 +1707,17 @@ def _fixed_ip_count_by_project(context, project_id, session=None):
                 count()
 
 
+def _fixed_ip_count_all(context, session):
+    return model_query(context, func.count(models.FixedIp.id),
+                       models.Instance.project_id,
+                       base_model=models.FixedIp, read_deleted="no",
+                       session=session).\
+                join((models.Instance,
+                      models.Instance.uuid == models.FixedIp.instance_uuid)).\
+                group_by(models.Instance.project_id).\
+                all()
+
+
 ###################
 
 
@@ -1653,6 +1956,20 @@ def _instance_data_get_for_user(context, project_id, user_id, session=None):
     return (result[0] or 0, result[1] or 0, result[2] or 0)
 
 
+def _instance_data_get_all(context, session):
+    return model_query(context,
+                       models.Instance.project_id,
+                       models.Instance.user_id,
+                       func.count(models.Instance.id),
+                       func.sum(models.Instance.vcpus),
+                       func.sum(models.Instance.memory_mb),
+                       base_model=models.Instance, read_deleted="no",
+                       session=session).\
+                   group_by(models.Instance.project_id,
+                            models.Instance.user_id).\
+                   all()
+
+
 @require_context
 def instance_destroy(context, instance_uuid, constraint=None):
     session = get_session()
@@ -1746,6 +2063,11 @@ def _instances_fill_metadata(context, instances,
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
+    Metadata and system_metadata are filled in as plain key/value dicts,
+    built once here straight from the selected (uuid, key, value) tuples,
+    so neither utils.instance_meta/instance_sys_meta nor the Instance
+    object need to convert them again.
+
     :param context: security context
     :param instances: list of instances to fill
     :param manual_joins: list of tables to manually join (can be any
@@ -1757,16 +2079,17 @@ def _instances_fill_metadata(context, instances,
     if manual_joins is None:
         manual_joins = ['metadata', 'system_metadata']
 
-    meta = collections.defaultdict(list)
+    meta = collections.defaultdict(dict)
     if 'metadata' in manual_joins:
-        for row in _instance_metadata_get_multi(context, uuids, use_slave):
-            meta[row['instance_uuid']].append(row)
+        for uuid, key, value in _instance_metadata_get_multi(
+                context, uuids, use_slave=use_slave):
+            meta[uuid][key] = value
 
-    sys_meta = collections.defaultdict(list)
+    sys_meta = collections.defaultdict(dict)
     if 'system_metadata' in manual_joins:
-        for row in _instance_system_metadata_get_multi(context, uuids,
-                                                       use_slave):
-            sys_meta[row['instance_uuid']].append(row)
+        for uuid, key, value in _instance_system_metadata_get_multi(
+                context, uuids, use_slave=use_slave):
+            sys_meta[uuid][key] = value
 
     pcidevs = collections.defaultdict(list)
     if 'pci_devices' in manual_joins:
@@ -1785,6 +2108,31 @@ def _instances_fill_metadata(context, instances,
     return filled_instances
 
 
+# NOTE: A projected instance query always loads these, since they are
+# needed to identify (and later lazy-load) the instance.
+_INSTANCE_PROJECTION_REQUIRED_COLUMNS = ['id', 'uuid']
+
+
+def _instance_projection(columns):
+    """Return the Instance column attributes to select for a projection.
+
+    :param columns: list of instances table column names to load
+    """
+    names = list(_INSTANCE_PROJECTION_REQUIRED_COLUMNS)
+    for name in columns:
+        if name not in models.Instance.__table__.columns:
+            msg = _("Invalid instance column: %s") % name
+            raise exception.InvalidParameterValue(err=msg)
+        if name not in names:
+            names.append(name)
+    return [getattr(models.Instance, name) for name in names]
+
+
+def _projected_rows_to_dicts(rows):
+    """Convert the named tuples returned by a projection into dicts."""
+    return [dict(zip(row.keys(), row)) for row in rows]
+
+
 def _manual_join_columns(columns_to_join):
     manual_joins = []
     for column in ('metadata', 'system_metadata', 'pci_devices'):
@@ -1816,7 +2164,8 @@ def instance_get_all(context, columns_to_join=None):
 
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None, columns_to_join=None):
+                                limit=None, marker=None, columns_to_join=None,
+                                columns=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1849,6 +2198,11 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
         'soft_deleted' - modify behavior of 'deleted' to either
                          include or exclude instances whose
                          vm_state is SOFT_DELETED.
+
+    If columns is given, only those columns of the instances table (plus
+    id and uuid) are selected and the instances are returned as dicts
+    with no joined relationships other than the manually-joined
+    metadata, system_metadata and pci_devices.
     """
 
     sort_fn = {'desc': desc, 'asc': asc}
@@ -1861,9 +2215,13 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     else:
         manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
 
-    query_prefix = session.query(models.Instance)
-    for column in columns_to_join:
-        query_prefix = query_prefix.options(joinedload(column))
+    if columns is not None:
+        # NOTE: Relationships cannot be eager-loaded into a projection.
+        query_prefix = session.query(*_instance_projection(columns))
+    else:
+        query_prefix = session.query(models.Instance)
+        for column in columns_to_join:
+            query_prefix = query_prefix.options(joinedload(column))
 
     query_prefix = query_prefix.order_by(sort_fn[sort_dir](
             getattr(models.Instance, sort_key)))
@@ -1940,7 +2298,10 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                            marker=marker,
                            sort_dir=sort_dir)
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    instances = query_prefix.all()
+    if columns is not None:
+        instances = _projected_rows_to_dicts(instances)
+    return _instances_fill_metadata(context, instances, manual_joins)
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2056,7 +2417,15 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 def _instance_get_all_query(context, project_only=False,
-                            joins=None, use_slave=False):
+                            joins=None, use_slave=False, columns=None):
+    if columns is not None:
+        # NOTE: Relationships cannot be eager-loaded into a projection.
+        return model_query(context,
+                           *_instance_projection(columns),
+                           base_model=models.Instance,
+                           project_only=project_only,
+                           use_slave=use_slave)
+
     if joins is None:
         joins = ['info_cache', 'security_groups']
 
@@ -2072,12 +2441,17 @@ def _instance_get_all_query(context, project_only=False,
 @require_admin_context
 def instance_get_all_by_host(context, host,
                              columns_to_join=None,
-                             use_slave=False):
-    return _instances_fill_metadata(context,
-      _instance_get_all_query(context,
-                              use_slave=use_slave).filter_by(host=host).all(),
-                              manual_joins=columns_to_join,
-                              use_slave=use_slave)
+                             use_slave=False,
+                             columns=None):
+    instances = _instance_get_all_query(context, use_slave=use_slave,
+                                        columns=columns).\
+                    filter_by(host=host).\
+                    all()
+    if columns is not None:
+        instances = _projected_rows_to_dicts(instances)
+    return _instances_fill_metadata(context, instances,
+                                    manual_joins=columns_to_join,
+                                    use_slave=use_slave)
 
 
 def _instance_get_all_uuids_by_host(context, host, session=None):
@@ -2224,6 +2598,95 @@ def _instance_metadata_update_in_place(context, instance, metadata_type, model,
         instance[metadata_type].append(newitem)
 
 
+def _pop_expected_states(values):
+    """Remove the expected_task_state and expected_vm_state, which are not
+    DB columns, from values and return them as a dict of tuples.
+    """
+    expected = {}
+    for key in ('expected_task_state', 'expected_vm_state'):
+        if key in values:
+            states = values.pop(key)
+            if not isinstance(states, (tuple, list, set)):
+                states = (states,)
+            expected[key] = states
+    return expected
+
+
+def _check_instance_states(instance_ref, expected):
+    if 'expected_task_state' in expected:
+        actual_state = instance_ref["task_state"]
+        states = expected['expected_task_state']
+        if actual_state not in states:
+            if actual_state == task_states.DELETING:
+                raise exception.UnexpectedDeletingTaskStateError(
+                        actual=actual_state, expected=states)
+            else:
+                raise exception.UnexpectedTaskStateError(
+                        actual=actual_state, expected=states)
+    if 'expected_vm_state' in expected:
+        actual_state = instance_ref["vm_state"]
+        states = expected['expected_vm_state']
+        if actual_state not in states:
+            raise exception.UnexpectedVMStateError(actual=actual_state,
+                                                   expected=states)
+
+
+def _state_in(column, states):
+    """Filter for column being one of states, which may include None."""
+    clauses = []
+    if None in states:
+        clauses.append(column == None)
+    not_none = [state for state in states if state is not None]
+    if not_none:
+        clauses.append(column.in_(not_none))
+    return or_(*clauses)
+
+
+@require_context
+def instance_update_columns(context, instance_uuid, values):
+    """Set the given scalar columns of an instance with a single UPDATE.
+
+    Unlike instance_update(), the instance is neither read before nor
+    after the update, and metadata, system_metadata and hostname must not
+    be in values.  If "expected_task_state" or "expected_vm_state" are in
+    values, they are checked in the WHERE clause of the UPDATE, and the
+    errors raised are the same as for instance_update().
+
+    :returns: the values written, including updated_at
+
+    Raises InstanceNotFound if instance does not exist.
+    """
+    if not uuidutils.is_uuid_like(instance_uuid):
+        raise exception.InvalidUUID(instance_uuid)
+
+    values = dict(values)
+    expected = _pop_expected_states(values)
+    values.setdefault('updated_at', timeutils.utcnow())
+    _handle_objects_related_type_conversions(values)
+
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.Instance, session=session,
+                            project_only=True).\
+                filter_by(uuid=instance_uuid)
+        if 'expected_task_state' in expected:
+            query = query.filter(_state_in(models.Instance.task_state,
+                                           expected['expected_task_state']))
+        if 'expected_vm_state' in expected:
+            query = query.filter(_state_in(models.Instance.vm_state,
+                                           expected['expected_vm_state']))
+        if not query.update(values, synchronize_session=False):
+            # Find out whether the instance is gone or in another state.
+            instance_ref = model_query(context, models.Instance,
+                                       session=session, project_only=True).\
+                    filter_by(uuid=instance_uuid).\
+                    first()
+            if not instance_ref:
+                raise exception.InstanceNotFound(instance_id=instance_uuid)
+            _check_instance_states(instance_ref, expected)
+    return values
+
+
 def _instance_update(context, instance_uuid, values, copy_old_instance=False,
                      columns_to_join=None):
     session = get_session()
@@ -2235,27 +2698,7 @@ def _instance_update(context, instance_uuid, values, copy_old_instance=False,
         instance_ref = _instance_get_by_uuid(context, instance_uuid,
                                              session=session,
                                              columns_to_join=columns_to_join)
-        if "expected_task_state" in values:
-            # it is not a db column so always pop out
-            expected = values.pop("expected_task_state")
-            if not isinstance(expected, (tuple, list, set)):
-                expected = (expected,)
-            actual_state = instance_ref["task_state"]
-            if actual_state not in expected:
-                if actual_state == task_states.DELETING:
-                    raise exception.UnexpectedDeletingTaskStateError(
-                            actual=actual_state, expected=expected)
-                else:
-                    raise exception.UnexpectedTaskStateError(
-                            actual=actual_state, expected=expected)
-        if "expected_vm_state" in values:
-            expected = values.pop("expected_vm_state")
-            if not isinstance(expected, (tuple, list, set)):
-                expected = (expected,)
-            actual_state = instance_ref["vm_state"]
-            if actual_state not in expected:
-                raise exception.UnexpectedVMStateError(actual=actual_state,
-                                                       expected=expected)
+        _check_instance_states(instance_ref, _pop_expected_states(values))
 
         instance_hostname = instance_ref['hostname'] or ''
         if ("hostname" in values and
@@ -2358,6 +2801,57 @@ def instance_info_cache_update(context, instance_uuid, values):
     return info_cache
 
 
+@require_context
+def instance_info_cache_update_many(context, values_by_uuid):
+    """Update or create the info caches of many instances in one
+    transaction.
+
+    The existing records are looked up with a single query, updated with a
+    single executemany UPDATE and the missing ones created with a single
+    executemany INSERT.  The info caches which are deleted are skipped.
+    """
+    if not values_by_uuid:
+        return
+
+    table = models.InstanceInfoCache.__table__
+    update = table.update().\
+        where(table.c.instance_uuid == bindparam('_instance_uuid'))
+
+    session = get_session()
+    try:
+        with session.begin():
+            existing = dict(model_query(context,
+                    models.InstanceInfoCache.instance_uuid,
+                    models.InstanceInfoCache.deleted,
+                    base_model=models.InstanceInfoCache,
+                    session=session, read_deleted="yes").\
+                filter(models.InstanceInfoCache.instance_uuid.in_(
+                    values_by_uuid.keys())).\
+                all())
+            updates = []
+            inserts = []
+            for instance_uuid, values in values_by_uuid.iteritems():
+                if instance_uuid not in existing:
+                    values = dict(values, instance_uuid=instance_uuid)
+                    inserts.append(values)
+                elif not existing[instance_uuid]:
+                    values = dict(values, _instance_uuid=instance_uuid)
+                    updates.append(values)
+            if updates:
+                session.execute(update, updates)
+            if inserts:
+                session.execute(table.insert(), inserts)
+    except db_exc.DBDuplicateEntry:
+        # NOTE: Another greenthread created one of the records since we
+        # looked, so fall back to updating the info caches one at a time.
+        for instance_uuid, values in values_by_uuid.iteritems():
+            try:
+                instance_info_cache_update(context, instance_uuid,
+                                           dict(values))
+            except exception.InstanceInfoCacheNotFound:
+                pass
+
+
 @require_context
 def instance_info_cache_delete(context, instance_uuid):
     """Deletes an existing instance_info_cache record
@@ -2992,6 +3486,77 @@ def quota_usage_update(context, project_id, user_id, resource, **kwargs):
         raise exception.QuotaUsageNotFound(project_id=project_id)
 
 
+@require_admin_context
+def quota_usage_refresh_all(context):
+    """Set the in_use of all quota usages to the actual usage.
+
+    The usages of all projects and users are counted with one GROUP BY
+    query per sync routine, and only the usages which are out of sync are
+    written, with one UPDATE statement.  Usages with reservations in
+    flight are left alone, as the resources of those may or may not
+    exist yet, and so are the usages which changed since they were read.
+    Legacy per-user usages without a user are left alone too, as their
+    resources cannot be counted.
+
+    :returns: the number of usages which were out of sync
+    """
+    usage_table = models.QuotaUsage.__table__
+    reservation_table = models.Reservation.__table__
+    in_flight = exists([reservation_table.c.id]).\
+        where(reservation_table.c.usage_id == usage_table.c.id).\
+        where(reservation_table.c.deleted == 0).\
+        correlate(usage_table)
+
+    session = get_session()
+    with session.begin():
+        usages = model_query(context, models.QuotaUsage.id,
+                             models.QuotaUsage.project_id,
+                             models.QuotaUsage.user_id,
+                             models.QuotaUsage.resource,
+                             models.QuotaUsage.in_use,
+                             base_model=models.QuotaUsage,
+                             read_deleted="no", session=session).\
+                        filter(models.QuotaUsage.resource.in_(
+                               QUOTA_SYNC_ALL_RESOURCES)).\
+                        filter(~in_flight).\
+                        all()
+        actual = _sync_all(context, session)
+
+        updates = []
+        for usage_id, project_id, user_id, resource, in_use in usages:
+            if resource in PER_PROJECT_QUOTAS:
+                user_id = None
+            elif user_id is None:
+                continue
+            actual_use = actual.get((project_id, user_id), {}).get(resource,
+                                                                   0)
+            if in_use != actual_use:
+                LOG.debug(_('quota_usages out of sync, updating. '
+                            'project_id: %(project_id)s, '
+                            'user_id: %(user_id)s, '
+                            'resource: %(res)s, '
+                            'tracked usage: %(tracked_use)s, '
+                            'actual usage: %(in_use)s'),
+                          {'project_id': project_id,
+                           'user_id': user_id,
+                           'res': resource,
+                           'tracked_use': in_use,
+                           'in_use': actual_use})
+                updates.append({'_id': usage_id, '_in_use': in_use,
+                                'in_use': actual_use})
+
+        if updates:
+            session.execute(usage_table.update().
+                            where(usage_table.c.id == bindparam('_id')).
+                            where(usage_table.c.in_use ==
+                                  bindparam('_in_use')).
+                            where(~in_flight).
+                            values(in_use=bindparam('in_use'),
+                                   updated_at=timeutils.utcnow()),
+                            updates)
+    return len(updates)
+
+
 ###################
 
 
@@ -3017,26 +3582,28 @@ def _reservation_create(context, uuid, usage, project_id, user_id, resource,
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
 
-def _get_user_quota_usages(context, session, project_id, user_id):
+def _get_user_quota_usages(context, session, project_id, user_id,
+                           lock=True):
     # Broken out for testability
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
                    filter_by(project_id=project_id).\
                    filter(or_(models.QuotaUsage.user_id == user_id,
-                              models.QuotaUsage.user_id == None)).\
-                   with_lockmode('update').\
-                   all()
-    return dict((row.resource, row) for row in rows)
+                              models.QuotaUsage.user_id == None))
+    if lock:
+        query = query.with_lockmode('update')
+    return dict((row.resource, row) for row in query.all())
 
 
-def _get_project_quota_usages(context, session, project_id):
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   with_lockmode('update').\
-                   all()
+def _get_project_quota_usages(context, session, project_id, lock=True):
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+                   filter_by(project_id=project_id)
+    if lock:
+        query = query.with_lockmode('update')
+    rows = query.all()
     result = dict()
     # Get the total count of in_use,reserved
     for row in rows:
@@ -3051,6 +3618,39 @@ def _get_project_quota_usages(context, session, project_id):
     return result
 
 
+def _raise_over_quota(overs, deltas, project_quotas, user_quotas,
+                      project_usages, user_usages):
+    if project_quotas == user_quotas:
+        usages = project_usages
+    else:
+        usages = user_usages
+    usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
+                  for k, v in usages.items())
+    headroom = dict((res, user_quotas[res] -
+                         (usages[res]['in_use'] + usages[res]['reserved']))
+                    for res in user_quotas.keys())
+
+    # If quota_cores is unlimited [-1]:
+    # - set cores headroom based on instances headroom:
+    if user_quotas.get('cores') == -1:
+        if deltas['cores']:
+            hc = headroom['instances'] * deltas['cores']
+            headroom['cores'] = hc / deltas['instances']
+        else:
+            headroom['cores'] = headroom['instances']
+
+    # If quota_ram is unlimited [-1]:
+    # - set ram headroom based on instances headroom:
+    if user_quotas.get('ram') == -1:
+        if deltas['ram']:
+            hr = headroom['instances'] * deltas['ram']
+            headroom['ram'] = hr / deltas['instances']
+        else:
+            headroom['ram'] = headroom['instances']
+    raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
+                              usages=usages, headroom=headroom)
+
+
 @require_context
 @_retry_on_deadlock
 def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
@@ -3229,35 +3829,8 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
         LOG.warning(_("Change will make usage less than 0 for the following "
                       "resources: %s"), unders)
     if overs:
-        if project_quotas == user_quotas:
-            usages = project_usages
-        else:
-            usages = user_usages
-        usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
-                      for k, v in usages.items())
-        headroom = dict((res, user_quotas[res] -
-                             (usages[res]['in_use'] + usages[res]['reserved']))
-                        for res in user_quotas.keys())
-
-        # If quota_cores is unlimited [-1]:
-        # - set cores headroom based on instances headroom:
-        if user_quotas.get('cores') == -1:
-            if deltas['cores']:
-                hc = headroom['instances'] * deltas['cores']
-                headroom['cores'] = hc / deltas['instances']
-            else:
-                headroom['cores'] = headroom['instances']
-
-        # If quota_ram is unlimited [-1]:
-        # - set ram headroom based on instances headroom:
-        if user_quotas.get('ram') == -1:
-            if deltas['ram']:
-                hr = headroom['instances'] * deltas['ram']
-                headroom['ram'] = hr / deltas['instances']
-            else:
-                headroom['ram'] = headroom['instances']
-        raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
-                                  usages=usages, headroom=headroom)
+        _raise_over_quota(overs, deltas, project_quotas, user_quotas,
+                          project_usages, user_usages)
 
     return reservations
 
@@ -3302,6 +3875,126 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
         reservation_query.soft_delete(synchronize_session=False)
 
 
+@require_context
+@_retry_on_deadlock
+def quota_reserve_counted(context, resources, project_quotas, user_quotas,
+                          deltas, expire, until_refresh, max_age,
+                          project_id=None, user_id=None):
+    """Reserve deltas without locking the usages.
+
+    Instead of reading the usage rows with SELECT ... FOR UPDATE, every
+    positive delta is added to its usage row by an UPDATE which only
+    matches while the row stays within the user quota, so concurrent
+    reservations only contend for the duration of those statements.
+    Project quotas are checked against the usages read at the start of
+    the transaction, so requests racing with this one may overrun them
+    by their in-flight deltas.  Usages are not refreshed here; if one is
+    missing or was reset, the request goes through quota_reserve().
+    """
+    elevated = context.elevated()
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    session = get_session()
+    with session.begin():
+        user_usages = _get_user_quota_usages(context, session, project_id,
+                                             user_id, lock=False)
+        needs_refresh = [res for res in deltas
+                         if res not in user_usages or
+                         user_usages[res].in_use < 0]
+        if not needs_refresh:
+            project_usages = _get_project_quota_usages(context, session,
+                                                       project_id,
+                                                       lock=False)
+            for key, value in user_usages.items():
+                if key not in project_usages:
+                    project_usages[key] = value
+
+            overs = [res for res, delta in deltas.items()
+                     if user_quotas[res] >= 0 and delta >= 0 and
+                     project_quotas[res] < delta +
+                     project_usages[res]['total']]
+            for res, delta in deltas.items():
+                if overs or delta <= 0:
+                    continue
+                if not _quota_usage_add_reserved(context, session,
+                                                 user_usages[res].id,
+                                                 delta, user_quotas[res]):
+                    overs.append(res)
+            if overs:
+                # Raising rolls back the reserved counts added so far.
+                _raise_over_quota(overs, deltas, project_quotas,
+                                  user_quotas, project_usages, user_usages)
+            reservations = [
+                _reservation_create(elevated, str(uuid.uuid4()),
+                                    user_usages[res], project_id, user_id,
+                                    res, delta, expire,
+                                    session=session).uuid
+                for res, delta in deltas.items()]
+
+    if needs_refresh:
+        return quota_reserve(context, resources, project_quotas,
+                             user_quotas, deltas, expire, until_refresh,
+                             max_age, project_id=project_id,
+                             user_id=user_id)
+    return reservations
+
+
+def _quota_usage_add_reserved(context, session, usage_id, delta, limit):
+    """Atomically add delta to the reserved count of a usage, unless that
+    takes it over limit.
+
+    :returns: whether the usage was updated
+    """
+    query = model_query(context, models.QuotaUsage, read_deleted="no",
+                        session=session).\
+                    filter_by(id=usage_id)
+    if limit >= 0:
+        query = query.filter(models.QuotaUsage.in_use +
+                             models.QuotaUsage.reserved + delta <= limit)
+    return query.update({'reserved': models.QuotaUsage.reserved + delta},
+                        synchronize_session=False)
+
+
+def _reservation_finish_counted(context, reservations, commit):
+    session = get_session()
+    with session.begin():
+        # NOTE: Only the reservations are locked here, the usages are
+        # adjusted in place by the updates below.
+        reservation_query = _quota_reservations_query(session, context,
+                                                      reservations)
+        for reservation in reservation_query.all():
+            updates = {}
+            if reservation.delta >= 0:
+                updates['reserved'] = (models.QuotaUsage.reserved -
+                                       reservation.delta)
+            if commit:
+                updates['in_use'] = (models.QuotaUsage.in_use +
+                                     reservation.delta)
+            if updates:
+                model_query(context, models.QuotaUsage, read_deleted="no",
+                            session=session).\
+                        filter_by(id=reservation.usage_id).\
+                        update(updates, synchronize_session=False)
+        reservation_query.soft_delete(synchronize_session=False)
+
+
+@require_context
+@_retry_on_deadlock
+def reservation_commit_counted(context, reservations, project_id=None,
+                               user_id=None):
+    _reservation_finish_counted(context, reservations, commit=True)
+
+
+@require_context
+@_retry_on_deadlock
+def reservation_rollback_counted(context, reservations, project_id=None,
+                                 user_id=None):
+    _reservation_finish_counted(context, reservations, commit=False)
+
+
 @require_admin_context
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     session = get_session()
@@ -3359,10 +4052,25 @@ def reservation_expire(context):
                                         session=session, read_deleted="no").\
                             filter(models.Reservation.expire < current_time)
 
-        for reservation in reservation_query.join(models.QuotaUsage).all():
-            if reservation.delta >= 0:
-                reservation.usage.reserved -= reservation.delta
-                session.add(reservation.usage)
+        # Give back what the expired reservations hold on every usage,
+        # summed up by the database, with one UPDATE statement.
+        held = model_query(context, models.Reservation.usage_id,
+                           func.sum(models.Reservation.delta),
+                           base_model=models.Reservation,
+                           session=session, read_deleted="no").\
+                       filter(models.Reservation.expire < current_time).\
+                       filter(models.Reservation.delta >= 0).\
+                       group_by(models.Reservation.usage_id).\
+                       all()
+        if held:
+            table = models.QuotaUsage.__table__
+            session.execute(table.update().
+                            where(table.c.id == bindparam('_id')).
+                            values(reserved=table.c.reserved -
+                                            bindparam('delta'),
+                                   updated_at=current_time),
+                            [{'_id': usage_id, 'delta': int(delta)}
+                             for usage_id, delta in held])
 
         reservation_query.soft_delete(synchronize_session=False)
 
@@ -3808,6 +4516,17 @@ def _security_group_count_by_project_and_user(context, project_id, user_id,
                    count()
 
 
+def _security_group_count_all(context, session):
+    return model_query(context, models.SecurityGroup.project_id,
+                       models.SecurityGroup.user_id,
+                       func.count(models.SecurityGroup.id),
+                       base_model=models.SecurityGroup, read_deleted="no",
+                       session=session).\
+                   group_by(models.SecurityGroup.project_id,
+                            models.SecurityGroup.user_id).\
+                   all()
+
+
 ###################
 
 
@@ -4501,6 +5220,21 @@ def flavor_extra_specs_update_or_create(context, flavor_id, specs,
                 raise
 
 
+@require_context
+def flavor_generation_get(context):
+    generation = []
+    for model in (models.InstanceTypes, models.InstanceTypeExtraSpecs,
+                  models.InstanceTypeProjects):
+        generation.append(tuple(model_query(context,
+                                            func.count(model.id),
+                                            func.max(model.created_at),
+                                            func.max(model.updated_at),
+                                            func.max(model.deleted_at),
+                                            base_model=model,
+                                            read_deleted="yes").first()))
+    return tuple(generation)
+
+
 ####################
 
 
@@ -4553,11 +5287,17 @@ def cell_get_all(context):
 ########################
 # User-provided metadata
 
-def _instance_metadata_get_multi(context, instance_uuids, session=None):
+def _instance_metadata_get_multi(context, instance_uuids,
+                                 session=None, use_slave=False):
+    """Return (instance_uuid, key, value) tuples of live metadata items."""
     if not instance_uuids:
         return []
-    return model_query(context, models.InstanceMetadata,
-                       session=session).\
+    return model_query(context, models.InstanceMetadata.instance_uuid,
+                       models.InstanceMetadata.key,
+                       models.InstanceMetadata.value,
+                       base_model=models.InstanceMetadata,
+                       session=session, use_slave=use_slave,
+                       read_deleted="no").\
                     filter(
             models.InstanceMetadata.instance_uuid.in_(instance_uuids))
 
@@ -4617,11 +5357,17 @@ def instance_metadata_update(context, instance_uuid, metadata, delete):
 # System-owned metadata
 
 
-def _instance_system_metadata_get_multi(context, instance_uuids, session=None):
+def _instance_system_metadata_get_multi(context, instance_uuids,
+                                        session=None, use_slave=False):
+    """Return (instance_uuid, key, value) tuples of live system metadata."""
     if not instance_uuids:
         return []
-    return model_query(context, models.InstanceSystemMetadata,
-                       session=session).\
+    return model_query(context, models.InstanceSystemMetadata.instance_uuid,
+                       models.InstanceSystemMetadata.key,
+                       models.InstanceSystemMetadata.value,
+                       base_model=models.InstanceSystemMetadata,
+                       session=session, use_slave=use_slave,
+                       read_deleted="no").\
                     filter(
             models.InstanceSystemMetadata.instance_uuid.in_(instance_uuids))
 
@@ -4785,6 +5531,77 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
             pass
 
 
+@require_context
+def bw_usage_update_many(context, usages, last_refreshed=None):
+    """Update or create the bw usages in usages in one transaction.
+
+    Every usage is a dict with the uuid, mac, start_period, bw_in, bw_out,
+    last_ctr_in and last_ctr_out of one instance network.  Existing records
+    are looked up with one query per audit period, updated with a single
+    executemany UPDATE and the missing ones created with a single
+    executemany INSERT.
+    """
+    if not usages:
+        return
+
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    by_period = collections.defaultdict(list)
+    for usage in usages:
+        by_period[usage['start_period']].append(usage)
+
+    table = models.BandwidthUsage.__table__
+    update = table.update().\
+        where(table.c.uuid == bindparam('_uuid')).\
+        where(table.c.mac == bindparam('_mac')).\
+        where(table.c.start_period == bindparam('_start_period'))
+
+    session = get_session()
+    try:
+        with session.begin():
+            updates = []
+            inserts = []
+            for start_period, period_usages in by_period.iteritems():
+                existing = set(model_query(context,
+                        models.BandwidthUsage.uuid,
+                        models.BandwidthUsage.mac,
+                        base_model=models.BandwidthUsage,
+                        session=session, read_deleted="yes").\
+                    filter_by(start_period=start_period).\
+                    filter(models.BandwidthUsage.uuid.in_(
+                        set(usage['uuid'] for usage in period_usages))).\
+                    all())
+                for usage in period_usages:
+                    values = {'last_refreshed': last_refreshed,
+                              'last_ctr_in': usage['last_ctr_in'],
+                              'last_ctr_out': usage['last_ctr_out'],
+                              'bw_in': usage['bw_in'],
+                              'bw_out': usage['bw_out']}
+                    if (usage['uuid'], usage['mac']) in existing:
+                        values.update(_uuid=usage['uuid'],
+                                      _mac=usage['mac'],
+                                      _start_period=start_period)
+                        updates.append(values)
+                    else:
+                        values.update(uuid=usage['uuid'], mac=usage['mac'],
+                                      start_period=start_period)
+                        inserts.append(values)
+            if updates:
+                session.execute(update, updates)
+            if inserts:
+                session.execute(table.insert(), inserts)
+    except db_exc.DBDuplicateEntry:
+        # NOTE: Another greenthread created one of the records since we
+        # looked, so fall back to updating the usages one at a time.
+        for usage in usages:
+            bw_usage_update(context, usage['uuid'], usage['mac'],
+                            usage['start_period'], usage['bw_in'],
+                            usage['bw_out'], usage['last_ctr_in'],
+                            usage['last_ctr_out'],
+                            last_refreshed=last_refreshed)
+
+
 ####################
 
 
@@ -5259,6 +6076,19 @@ def instance_fault_create(context, values):
     return dict(fault_ref.iteritems())
 
 
+def instance_fault_create_many(context, values_list):
+    """Create many InstanceFaults in one transaction."""
+    session = get_session()
+    faults = []
+    with session.begin():
+        for values in values_list:
+            fault_ref = models.InstanceFault()
+            fault_ref.update(values)
+            session.add(fault_ref)
+            faults.append(fault_ref)
+    return [dict(fault_ref.iteritems()) for fault_ref in faults]
+
+
 def instance_fault_get_by_instance_uuids(context, instance_uuids):
     """Get all instance faults for the provided instance_uuids."""
     if not instance_uuids:
@@ -5386,6 +6216,81 @@ def action_event_finish(context, values):
     return event_ref
 
 
+def action_event_record_many(context, events):
+    """Start and finish events on instance actions in one transaction.
+
+    :param events: list of ('start' or 'finish', values) pairs, with values
+                   as for action_event_start() and action_event_finish(),
+                   applied in order.  A finish is applied to the latest
+                   unfinished event of its name, which is not read back
+                   when it was started earlier in the list.
+
+    Like action_event_start() and action_event_finish(), an event of an
+    action which does not exist raises InstanceActionNotFound, and a finish
+    of an event which was not started raises InstanceActionEventNotFound;
+    none of the events are recorded then.
+    """
+    if not events:
+        return
+
+    session = get_session()
+    with session.begin():
+        instance_uuids = set(values['instance_uuid']
+                             for kind, values in events)
+        request_ids = set(values['request_id'] for kind, values in events)
+        # The latest action of each instance and request
+        actions = {}
+        for action in model_query(context, models.InstanceAction,
+                                  session=session).\
+                filter(models.InstanceAction.instance_uuid.in_(
+                    instance_uuids)).\
+                filter(models.InstanceAction.request_id.in_(request_ids)).\
+                order_by(desc(models.InstanceAction.created_at),
+                         desc(models.InstanceAction.id)):
+            actions.setdefault((action.instance_uuid, action.request_id),
+                               action)
+
+        # (action id, event name): unfinished events, the latest last
+        started = collections.defaultdict(list)
+        if actions and any(kind == 'finish' for kind, values in events):
+            for action_event in model_query(context,
+                                            models.InstanceActionEvent,
+                                            session=session).\
+                    filter(models.InstanceActionEvent.action_id.in_(
+                        [action.id for action in actions.values()])).\
+                    filter_by(finish_time=None).\
+                    order_by(asc(models.InstanceActionEvent.id)):
+                started[(action_event.action_id,
+                         action_event.event)].append(action_event)
+
+        for kind, values in events:
+            action = actions.get((values['instance_uuid'],
+                                  values['request_id']))
+            if action is None:
+                raise exception.InstanceActionNotFound(
+                    request_id=values['request_id'],
+                    instance_uuid=values['instance_uuid'])
+
+            if kind == 'start':
+                convert_datetimes(values, 'start_time')
+                values['action_id'] = action.id
+                event_ref = models.InstanceActionEvent()
+                event_ref.update(values)
+                session.add(event_ref)
+                started[(action.id, values['event'])].append(event_ref)
+                continue
+
+            convert_datetimes(values, 'start_time', 'finish_time')
+            unfinished = started.get((action.id, values['event']))
+            if not unfinished:
+                raise exception.InstanceActionEventNotFound(
+                    action_id=action.id, event=values['event'])
+            event_ref = unfinished.pop()
+            event_ref.update(values)
+            if values['result'].lower() == 'error':
+                action.update({'message': 'Error'})
+
+
 def action_events_get(context, action_id):
     events = model_query(context, models.InstanceActionEvent).\
                          filter_by(action_id=action_id).\
@@ -5559,14 +6464,7 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
         # No corresponding shadow table; skip it.
         return rows_archived
 
-    if tablename == "dns_domains":
-        # We have one table (dns_domains) where the key is called
-        # "domain" rather than "id"
-        column = table.c.domain
-        column_name = "domain"
-    else:
-        column = table.c.id
-        column_name = "id"
+    column = _archive_key_column(table)
     # NOTE(guochbo): Use InsertFromSelect and DeleteFromSelect to avoid
     # database's limit of maximum parameter in one SQL statment.
     query_insert = select([table],
@@ -5596,6 +6494,118 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
     return rows_archived
 
 
+def _archive_key_column(table):
+    """Return the column archived rows are ordered and chunked by."""
+    if table.name == "dns_domains":
+        # We have one table (dns_domains) where the key is called
+        # "domain" rather than "id"
+        return table.c.domain
+    return table.c.id
+
+
+# The tables and shadow tables reflected for archiving, by engine and table
+# name, as reflecting them again for every chunk is costly.
+_ARCHIVE_TABLES = {}
+
+
+def _archive_tables(engine, tablename):
+    """Return a table and its shadow table, or None if it has none."""
+    key = (engine, tablename)
+    if key not in _ARCHIVE_TABLES:
+        metadata = MetaData()
+        metadata.bind = engine
+        table = Table(tablename, metadata, autoload=True)
+        try:
+            shadow_table = Table(_SHADOW_TABLE_PREFIX + tablename, metadata,
+                                 autoload=True)
+        except NoSuchTableError:
+            shadow_table = None
+        _ARCHIVE_TABLES[key] = (table, shadow_table)
+    return _ARCHIVE_TABLES[key]
+
+
+# NOTE: Errors which mean the rows are locked by someone else right now,
+# and the same chunk can simply be retried later.
+_LOCK_WAIT_RE = re.compile(r"Lock wait timeout|database is locked|"
+                           r"lock timeout|could not obtain lock")
+
+
+@require_admin_context
+def archive_deleted_rows_chunk(context, tablename, max_rows, marker=None):
+    """Move the next chunk of deleted rows of one table to its shadow table.
+
+    Rows are visited in key order, starting after marker, so that a caller
+    walking a large table in chunks never rescans rows it already passed.
+    The insert and delete are bounded by a key range rather than by a
+    LIMIT subquery, so each chunk only locks the rows it moves.  The
+    context argument is only used for the decorator.
+
+    :param max_rows: maximum number of deleted rows in the chunk
+    :param marker: key of the last row of the previous chunk, or None to
+                   start from the beginning of the table
+    :returns: a tuple (rows_archived, marker) where marker is the key of the
+              last row in the chunk, or None if no deleted rows were left.
+              If a foreign key kept the chunk from being moved, nothing is
+              archived but the marker still moves past the chunk.
+    :raises: db_exc.DBDeadlock if the rows are locked by someone else
+    """
+    # NOTE(guochbo): There is a circular import, nova.db.sqlalchemy.utils
+    # imports nova.db.sqlalchemy.api.
+    from nova.db.sqlalchemy import utils as db_utils
+
+    engine = get_engine()
+    table, shadow_table = _archive_tables(engine, tablename)
+    if shadow_table is None:
+        return 0, None
+
+    column = _archive_key_column(table)
+    where = table.c.deleted != _get_default_deleted_value(table)
+    if marker is not None:
+        where = and_(where, column > marker)
+
+    conn = engine.connect()
+    try:
+        keys = conn.execute(select([column], where).order_by(column).
+                            limit(max_rows)).fetchall()
+        if not keys:
+            return 0, None
+        last = keys[-1][0]
+        where = and_(where, column <= last)
+
+        insert_statement = db_utils.InsertFromSelect(shadow_table,
+                                                     select([table], where))
+        delete_statement = table.delete().where(where)
+        try:
+            with conn.begin():
+                conn.execute(insert_statement)
+                result_delete = conn.execute(delete_statement)
+        except IntegrityError:
+            LOG.warn(_("IntegrityError detected when archiving table "
+                       "%(table)s after %(marker)s, skipping chunk"),
+                     {'table': tablename, 'marker': marker})
+            return 0, last
+        except OperationalError as e:
+            if _LOCK_WAIT_RE.search(str(e)):
+                raise db_exc.DBDeadlock(e)
+            raise
+        return result_delete.rowcount, last
+    finally:
+        conn.close()
+
+
+@require_admin_context
+def archive_tablenames(context):
+    """Return the names of the tables which have shadow tables, in an
+    order where rows referencing another table come before it.
+    The context argument is only used for the decorator.
+    """
+    metadata = MetaData(bind=get_engine())
+    metadata.reflect()
+    return [table.name for table in reversed(metadata.sorted_tables)
+            if not table.name.startswith(_SHADOW_TABLE_PREFIX) and
+            _SHADOW_TABLE_PREFIX + table.name in metadata.tables]
+
+
 @require_admin_context
 def archive_deleted_rows(context, max_rows=None):
     """Move up to max_rows rows from production tables to the corresponding
@@ -0,0 +1,82 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+# Found by tools/db/index_advisor.py
+data = {
+    # table_name: ((index_name_1, (*columns)), ...)
+    # migration_get_in_progress_by_host_and_node, one index per side of
+    # the OR
+    'migrations': (
+        ('migrations_source_compute_source_node_deleted_idx',
+         ('source_compute', 'source_node', 'deleted')),
+        ('migrations_dest_compute_dest_node_deleted_idx',
+         ('dest_compute', 'dest_node', 'deleted')),
+    ),
+    # reservation_expire
+    'reservations': (
+        ('reservations_deleted_expire_idx', ('deleted', 'expire')),
+    ),
+}
+
+# Two of these in one index are too long for a MySQL index key
+column_mysql = ['source_compute', 'dest_compute', 'source_node', 'dest_node']
+
+
+def _add_index(migrate_engine, table, index_name, idx_columns):
+    if migrate_engine.name == 'mysql':
+        columns = []
+        for column in idx_columns:
+            if column in column_mysql:
+                columns.append(column + "(100)")
+            else:
+                columns.append(column)
+        sql = ("create index %s ON %s (%s)" % (index_name, table,
+                                               ",".join(columns)))
+        migrate_engine.execute(sql)
+    else:
+        index = Index(
+            index_name, *[getattr(table.c, col) for col in idx_columns]
+        )
+        index.create(migrate_engine)
+
+
+def _drop_index(migrate_engine, table, index_name, idx_columns):
+    index = Index(
+        index_name, *[getattr(table.c, col) for col in idx_columns]
+    )
+    index.drop(migrate_engine)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name, indexes in data.iteritems():
+        table = Table(table_name, meta, autoload=True)
+        for index_name, columns in indexes:
+            _add_index(migrate_engine, table, index_name, columns)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name, indexes in data.iteritems():
+        table = Table(table_name, meta, autoload=True)
+        for index_name, columns in indexes:
+            _drop_index(migrate_engine, table, index_name, columns)
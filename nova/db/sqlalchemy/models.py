@@ -122,6 +122,11 @@ class ComputeNode(BASE, NovaBase):
     # data about additional resources.
     extra_resources = Column(Text)
 
+    # Versioned json encoding of the stats of the node, used instead of
+    # ComputeNodeStat rows when compact_compute_node_stats is set, see
+    # nova.compute.stats.to_compact().
+    compact_stats = Column(Text)
+
 
 class ComputeNodeStat(BASE, NovaBase):
     """Stats related to the current workload of a compute host that are
@@ -495,6 +500,7 @@ class Reservation(BASE, NovaBase):
     __table_args__ = (
         Index('ix_reservations_project_id', 'project_id'),
         Index('reservations_uuid_idx', 'uuid'),
+        Index('reservations_deleted_expire_idx', 'deleted', 'expire'),
     )
     id = Column(Integer, primary_key=True, nullable=False)
     uuid = Column(String(36), nullable=False)
@@ -739,6 +745,10 @@ class Migration(BASE, NovaBase):
         Index('migrations_by_host_nodes_and_status_idx', 'deleted',
               'source_compute', 'dest_compute', 'source_node', 'dest_node',
               'status'),
+        Index('migrations_source_compute_source_node_deleted_idx',
+              'source_compute', 'source_node', 'deleted'),
+        Index('migrations_dest_compute_dest_node_deleted_idx',
+              'dest_compute', 'dest_node', 'deleted'),
     )
     id = Column(Integer, primary_key=True, nullable=False)
     # NOTE(tr3buchet): the ____compute variables are instance['host']
@@ -1343,6 +1343,10 @@ class IncompatibleObjectVersion(NovaException):
     msg_fmt = _('Version %(objver)s of %(objname)s is not supported')
 
 
+class ObjectBaseNotFound(NovaException):
+    msg_fmt = _('Base %(base)s of %(objname)s object is not cached')
+
+
 class ObjectActionError(NovaException):
     msg_fmt = _('Object action %(action)s failed because: %(reason)s')
 
@@ -53,22 +53,94 @@ This module provides Manager, a base class for managers.
 
 """
 
+import datetime
+import functools
+import random
+import time
+
 from oslo.config import cfg
 
 from nova import baserpc
 from nova.db import base
+from nova.db import query_stats
 from nova import notifier
 from nova.objects import base as objects_base
+from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
 from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
-
+from nova import utils
+
+periodic_task_opts = [
+    cfg.BoolOpt('run_periodic_tasks_concurrently',
+                default=False,
+                help='Run every periodic task of a service in its own '
+                     'greenthread, so that a slow one does not delay the '
+                     'others. A task is skipped while its previous run is '
+                     'still going'),
+    cfg.FloatOpt('periodic_task_budget',
+                 default=0.0,
+                 help='Seconds within which a periodic task is expected to '
+                      'finish. Runs taking longer are logged and counted '
+                      'as overruns, 0 to disable'),
+    cfg.ListOpt('periodic_task_budgets',
+                default=[],
+                help='Budgets of single periodic tasks as name:seconds, '
+                     'like _sync_power_states:120, overriding '
+                     'periodic_task_budget'),
+    cfg.IntOpt('periodic_task_jitter',
+               default=0,
+               help='Maximum seconds by which every run of a periodic task '
+                    'with a spacing is randomly delayed, so that services '
+                    'started at the same time do not run it at the same '
+                    'time'),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(periodic_task_opts)
 CONF.import_opt('host', 'nova.netconf')
 LOG = logging.getLogger(__name__)
 
 
+class _AccountingRpcDispatcher(rpc_dispatcher.RpcDispatcher):
+    """Accounts the DB queries of every RPC call to the method called."""
+
+    def dispatch(self, ctxt, version, method, namespace, **kwargs):
+        with query_stats.scope('rpc %s' % method):
+            return super(_AccountingRpcDispatcher, self).dispatch(
+                ctxt, version, method, namespace, **kwargs)
+
+
+def _periodic_task_budget(name):
+    for budget in CONF.periodic_task_budgets:
+        task_name, sep, seconds = budget.partition(':')
+        if task_name == name:
+            return float(seconds)
+    return CONF.periodic_task_budget
+
+
+def _accounted_periodic_task(name, task):
+    @functools.wraps(task)
+    def wrapper(self, context):
+        stats = self.periodic_task_stats[name]
+        if stats['running']:
+            stats['skipped'] += 1
+            LOG.warn(_("Skipping periodic task %s because its previous run "
+                       "has not finished"), name)
+            return
+        if (CONF.periodic_task_jitter and self._periodic_spacing[name] and
+                self._periodic_last_run[name]):
+            self._periodic_last_run[name] += datetime.timedelta(
+                seconds=random.randint(0, CONF.periodic_task_jitter))
+        stats['running'] = True
+        if CONF.run_periodic_tasks_concurrently:
+            utils.spawn_n(self._run_periodic_task_in_thread, name, task,
+                          context)
+        else:
+            return self._run_periodic_task(name, task, context)
+    return wrapper
+
+
 class Manager(base.Base, periodic_task.PeriodicTasks):
     # Set RPC API version to 1.0 by default.
     RPC_API_VERSION = '1.0'
@@ -80,6 +152,14 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         self.backdoor_port = None
         self.service_name = service_name
         self.notifier = notifier.get_notifier(self.service_name, self.host)
+        # Account the DB queries and time of every periodic task to the
+        # task.
+        self._periodic_tasks = [(name, _accounted_periodic_task(name, task))
+                                for name, task in self._periodic_tasks]
+        self.periodic_task_stats = dict(
+            (name, {'running': False, 'runs': 0, 'skipped': 0,
+                    'overruns': 0, 'last_duration': None})
+            for name, task in self._periodic_tasks)
         super(Manager, self).__init__(db_driver)
 
     def create_rpc_dispatcher(self, backdoor_port=None, additional_apis=None):
@@ -94,12 +174,43 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         base_rpc = baserpc.BaseRPCAPI(self.service_name, backdoor_port)
         apis.extend([self, base_rpc])
         serializer = objects_base.NovaObjectSerializer()
-        return rpc_dispatcher.RpcDispatcher(apis, serializer)
+        return _AccountingRpcDispatcher(apis, serializer)
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
         return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
 
+    def _run_periodic_task(self, name, task, context):
+        full_task_name = '%s.%s' % (self.__class__.__name__, name)
+        stats = self.periodic_task_stats[name]
+        start = time.time()
+        try:
+            with query_stats.scope('periodic %s' % full_task_name):
+                return task(self, context)
+        finally:
+            duration = time.time() - start
+            stats['running'] = False
+            stats['runs'] += 1
+            stats['last_duration'] = duration
+            budget = _periodic_task_budget(name)
+            if budget and duration > budget:
+                stats['overruns'] += 1
+                LOG.warn(_("Periodic task %(task)s took %(duration).2f "
+                           "seconds, over its budget of %(budget).2f"),
+                         {'task': full_task_name, 'duration': duration,
+                          'budget': budget})
+            else:
+                LOG.debug(_("Periodic task %(task)s took %(duration).2f "
+                            "seconds"),
+                          {'task': full_task_name, 'duration': duration})
+
+    def _run_periodic_task_in_thread(self, name, task, context):
+        try:
+            self._run_periodic_task(name, task, context)
+        except Exception:
+            LOG.exception(_("Error during %(class)s.%(task)s"),
+                          {'class': self.__class__.__name__, 'task': name})
+
     def init_host(self):
         """Hook to do additional manager initialization when one requests
         the service be started.  This is called before any service record
@@ -109,6 +220,13 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         """
         pass
 
+    def cleanup_host(self):
+        """Hook to do cleanup work when the service shuts down.
+
+        Child classes should override this method.
+        """
+        pass
+
     def pre_start_hook(self):
         """Hook to provide the manager the ability to do additional
         start-up work before any RPC queues/consumers are created. This is
@@ -86,6 +86,22 @@ def update_instance_cache_with_nw_info(api, context, instance, nw_info=None,
             LOG.exception(_('Failed storing info cache'), instance=instance)
 
 
+def update_instances_cache_with_nw_info(context, nw_infos):
+    """Save the network info of many instances to their info caches at once.
+
+    :param nw_infos: dict of instance uuid to its NetworkInfo
+    """
+    if not nw_infos:
+        return
+    try:
+        info_cache_obj.InstanceInfoCache.update_many(context, dict(
+            (instance_uuid, nw_info.json())
+            for instance_uuid, nw_info in nw_infos.iteritems()))
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            LOG.exception(_('Failed storing info caches'))
+
+
 def wrap_check_policy(func):
     """Check policy corresponding to the wrapped methods prior to execution."""
 
@@ -398,6 +414,25 @@ class API(base.Base):
                                            result, update_cells=False)
         return result
 
+    @wrap_check_policy
+    def get_instances_nw_info(self, context, instances):
+        """Returns the network info of many instances, and saves them all
+        to their info caches at once.
+
+        The instances whose network info could not be fetched are left out
+        of the returned dict of instance uuid to network info.
+        """
+        nw_infos = {}
+        for instance in instances:
+            try:
+                nw_infos[instance['uuid']] = self._get_instance_nw_info(
+                    context, instance)
+            except Exception:
+                LOG.debug(_('Failed to get network info'), exc_info=True,
+                          instance=instance)
+        update_instances_cache_with_nw_info(context, nw_infos)
+        return nw_infos
+
     def _get_instance_nw_info(self, context, instance):
         """Returns all network info related to an instance."""
         flavor = flavors.extract_flavor(instance)
@@ -16,6 +16,7 @@
 #
 # vim: tabstop=4 shiftwidth=4 softtabstop=4
 
+import collections
 import time
 
 from neutronclient.common import exceptions as neutron_client_exc
@@ -97,6 +98,11 @@ LOG = logging.getLogger(__name__)
 
 refresh_cache = network_api.refresh_cache
 update_instance_info_cache = network_api.update_instance_cache_with_nw_info
+update_instances_info_cache = network_api.update_instances_cache_with_nw_info
+
+# Number of instances whose ports are listed with one request, to keep
+# the URL of the request short
+PORT_LISTING_BATCH_SIZE = 100
 
 
 class API(base.Base):
@@ -450,6 +456,41 @@ class API(base.Base):
         result = self._get_instance_nw_info(context, instance, networks)
         return result
 
+    def get_instances_nw_info(self, context, instances):
+        """Return the network info of many instances, and save them all to
+        their info caches at once.
+
+        The ports of the instances are listed with one request to neutron
+        per PORT_LISTING_BATCH_SIZE instances.  The instances whose network
+        info could not be built are left out of the returned dict of
+        instance uuid to network info.
+        """
+        client = neutronv2.get_client(context, admin=True)
+        device_ids = [instance['uuid'] for instance in instances]
+        ports_by_device = collections.defaultdict(list)
+        for i in xrange(0, len(device_ids), PORT_LISTING_BATCH_SIZE):
+            data = client.list_ports(
+                device_id=device_ids[i:i + PORT_LISTING_BATCH_SIZE])
+            for port in data.get('ports', []):
+                ports_by_device[port['device_id']].append(port)
+
+        nw_infos = {}
+        for instance in instances:
+            # NOTE: The ports get_instance_nw_info() would have listed
+            ports = [port for port in ports_by_device[instance['uuid']]
+                     if port['tenant_id'] == instance['project_id']]
+            try:
+                nw_info = self._build_network_info_model(context, instance,
+                                                         ports=ports)
+            except Exception:
+                LOG.debug(_('Failed to get network info'), exc_info=True,
+                          instance=instance)
+                continue
+            nw_infos[instance['uuid']] = network_model.NetworkInfo.hydrate(
+                nw_info)
+        update_instances_info_cache(context, nw_infos)
+        return nw_infos
+
     def _get_instance_nw_info(self, context, instance, networks=None):
         # keep this caching-free version of the get_instance_nw_info method
         # because it is used by the caching logic itself.
@@ -969,15 +1010,17 @@ class API(base.Base):
             network['should_create_bridge'] = should_create_bridge
         return network, ovs_interfaceid
 
-    def _build_network_info_model(self, context, instance, networks=None):
+    def _build_network_info_model(self, context, instance, networks=None,
+                                  ports=None):
         # Note(arosen): on interface-attach networks only contains the
         # network that the interface is being attached to.
 
-        search_opts = {'tenant_id': instance['project_id'],
-                       'device_id': instance['uuid'], }
         client = neutronv2.get_client(context, admin=True)
-        data = client.list_ports(**search_opts)
-        ports = data.get('ports', [])
+        if ports is None:
+            search_opts = {'tenant_id': instance['project_id'],
+                           'device_id': instance['uuid'], }
+            data = client.list_ports(**search_opts)
+            ports = data.get('ports', [])
         nw_info = network_model.NetworkInfo()
 
         # Unfortunately, this is sometimes in unicode and sometimes not
@@ -17,7 +17,9 @@
 import collections
 import copy
 import functools
+import hashlib
 
+from oslo.config import cfg
 import six
 
 from nova import context
@@ -25,11 +27,16 @@ from nova import exception
 from nova.objects import fields
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
+from nova.openstack.common import memorycache
 from nova.openstack.common.rpc import common as rpc_common
 import nova.openstack.common.rpc.serializer
+from nova.openstack.common import uuidutils
 from nova.openstack.common import versionutils
 
 
+CONF = cfg.CONF
+CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
+
 LOG = logging.getLogger('object')
 
 
@@ -56,17 +63,22 @@ def make_class_properties(cls):
             if name not in cls.fields:
                 cls.fields[name] = field
     for name, field in cls.fields.iteritems():
+        # These are called on every attribute access of every object, so
+        # everything that can be is bound once per field here.
 
-        def getter(self, name=name):
-            attrname = get_attrname(name)
-            if not hasattr(self, attrname):
+        def getter(self, name=name, attrname=get_attrname(name),
+                   unset=NotSpecifiedSentinel):
+            value = getattr(self, attrname, unset)
+            if value is unset:
                 self.obj_load_attr(name)
-            return getattr(self, attrname)
+                value = getattr(self, attrname)
+            return value
 
-        def setter(self, value, name=name, field=field):
+        def setter(self, value, name=name, field=field,
+                   attrname=get_attrname(name)):
             self._changed_fields.add(name)
             try:
-                return setattr(self, get_attrname(name),
+                return setattr(self, attrname,
                                field.coerce(self, name, value))
             except Exception:
                 attr = "%s.%s" % (self.obj_name(), name)
@@ -147,6 +159,12 @@ def remotable(fn):
                     self[key] = field.from_primitive(self, key, value)
             self.obj_reset_changes()
             self._changed_fields = set(updates.get('obj_what_changed', []))
+            if updates.get('obj_base'):
+                # The other side has cached the object as it is now, so
+                # only what changes from here on needs to be sent next time
+                self._obj_base = (updates['obj_base'],
+                                  set(name for name in self.fields
+                                      if self.obj_attr_is_set(name)))
             return result
         else:
             return fn(self, ctxt, *args, **kwargs)
@@ -180,6 +198,15 @@ class NovaObject(object):
     fields = {}
     obj_extra_fields = []
 
+    # The fields which identify an object, for the object to be sent
+    # with only its changes to a side which has cached it.  Objects
+    # without any are always sent whole.
+    obj_identity_fields = []
+
+    # (base, fields) if the object was cached as base by the other side of
+    # the last remotable call, fields being the ones set at the time
+    _obj_base = None
+
     def __init__(self, context=None, **kwargs):
         self._changed_fields = set()
         self._context = context
@@ -235,11 +262,15 @@ class NovaObject(object):
                                    primitive['nova_object.name']))
         objname = primitive['nova_object.name']
         objver = primitive['nova_object.version']
-        objdata = primitive['nova_object.data']
         objclass = cls.obj_class_from_name(objname, objver)
-        self = objclass()
+        return objclass._obj_from_primitive(context, objver, primitive)
+
+    @classmethod
+    def _obj_from_primitive(cls, context, objver, primitive):
+        self = cls()
         self._context = context
         self.VERSION = objver
+        objdata = primitive['nova_object.data']
         for name, field in self.fields.items():
             if name in objdata:
                 setattr(self, name, field.from_primitive(self, name,
@@ -306,6 +337,39 @@ class NovaObject(object):
             obj['nova_object.changes'] = list(self.obj_what_changed())
         return obj
 
+    def obj_to_delta_primitive(self):
+        """Dehydration of only what changed since the last remotable call.
+
+        Returns (base, primitive), primitive having the identity fields,
+        the changed fields, and the fields which were not set or have
+        nested changes since, or None if there is no base to apply the
+        primitive to.
+        """
+        if not self._obj_base or not self.obj_identity_fields:
+            return None
+        base, base_fields = self._obj_base
+        if not all(self.obj_attr_is_set(name)
+                   for name in self.obj_identity_fields):
+            return None
+        changes = self.obj_what_changed()
+        names = set(changes) | set(self.obj_identity_fields)
+        for name in self.fields:
+            if (self.obj_attr_is_set(name) and
+                    (name not in base_fields or
+                     _obj_has_changes(getattr(self, name)))):
+                names.add(name)
+        primitive = dict()
+        for name in names:
+            primitive[name] = self.fields[name].to_primitive(
+                self, name, getattr(self, name))
+        obj = {'nova_object.name': self.obj_name(),
+               'nova_object.namespace': 'nova',
+               'nova_object.version': self.VERSION,
+               'nova_object.data': primitive}
+        if changes:
+            obj['nova_object.changes'] = list(changes)
+        return base, obj
+
     def obj_load_attr(self, attrname):
         """Load an additional attribute from the real object.
 
@@ -341,8 +405,12 @@ class NovaObject(object):
         """
         if fields:
             self._changed_fields -= set(fields)
+            if self._obj_base:
+                # These may no longer match the base, so always send them
+                self._obj_base[1].difference_update(fields)
         else:
             self._changed_fields.clear()
+            self._obj_base = None
 
     def obj_attr_is_set(self, attrname):
         """Test object to see if attrname is present.
@@ -351,7 +419,8 @@ class NovaObject(object):
         False if not. Raises AttributeError if attrname is not
         a valid attribute for this object.
         """
-        if attrname not in self.obj_fields:
+        if (attrname not in self.fields and
+                attrname not in self.obj_extra_fields):
             raise AttributeError(
                 _("%(objname)s object has no attribute '%(attrname)s'") %
                 {'objname': self.obj_name(), 'attrname': attrname})
@@ -502,6 +571,86 @@ class ObjectListBase(object):
             primitives[index]['nova_object.version'] = child_target_version
 
 
+class ObjectBaseCache(object):
+    """Bases of objects sent with only their changes.
+
+    This keeps the last version of the most recently seen objects, one per
+    object, for remotable calls on them to only send what changed since.
+    The versions are kept in memcached if memcached_servers is set, so that
+    every conductor worker can apply the changes sent to any of them.
+    Otherwise each worker keeps the last size objects it saw, and objects
+    have to be sent whole again to workers which did not see them.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._bases = collections.OrderedDict()
+        self._mc = None
+        if CONF.memcached_servers:
+            self._mc = memorycache.get_client()
+
+    @staticmethod
+    def _key(objinst):
+        return (objinst.obj_name(),) + tuple(
+            getattr(objinst, name) for name in objinst.obj_identity_fields)
+
+    @staticmethod
+    def _mc_key(key):
+        return 'nova-object-base-%s' % hashlib.sha1(repr(key)).hexdigest()
+
+    def _set(self, key, value):
+        if self._mc is not None:
+            self._mc.set(self._mc_key(key), value)
+            return
+        self._bases.pop(key, None)
+        self._bases[key] = value
+        while len(self._bases) > self.size:
+            self._bases.popitem(last=False)
+
+    def _pop(self, key):
+        if self._mc is None:
+            return self._bases.pop(key, None)
+        mc_key = self._mc_key(key)
+        value = self._mc.get(mc_key)
+        if value is not None:
+            self._mc.delete(mc_key)
+        return value
+
+    def add(self, objinst):
+        """Cache objinst as it is now.
+
+        Returns the base to send its changes against, or None if it
+        cannot be sent with only its changes.
+        """
+        if self.size <= 0 or not objinst.obj_identity_fields:
+            return None
+        base = uuidutils.generate_uuid()
+        self._set(self._key(objinst),
+                  (base, objinst.obj_to_primitive()['nova_object.data']))
+        return base
+
+    def apply(self, objinst, base):
+        """Set the fields objinst was sent without from its base.
+
+        The base is used up, the object should be added again once done
+        with.
+
+        :raises: ObjectBaseNotFound if base is not the last one cached
+                 for objinst.
+        """
+        cached = self._pop(self._key(objinst))
+        if cached is None or cached[0] != base:
+            raise exception.ObjectBaseNotFound(objname=objinst.obj_name(),
+                                               base=base)
+        changes = set(objinst._changed_fields)
+        for name, value in cached[1].iteritems():
+            if name in objinst.fields and not objinst.obj_attr_is_set(name):
+                field = objinst.fields[name]
+                setattr(objinst, name,
+                        field.from_primitive(objinst, name, value))
+        objinst._changed_fields = changes
+
+
 class NovaObjectSerializer(nova.openstack.common.rpc.serializer.Serializer):
     """A NovaObject-aware Serializer.
 
@@ -577,6 +726,18 @@ def obj_to_primitive(obj):
         return obj
 
 
+def _obj_has_changes(value):
+    """Whether value is or holds an object with changes of its own."""
+    if isinstance(value, list):
+        return any(_obj_has_changes(item) for item in value)
+    if not isinstance(value, NovaObject):
+        return False
+    if value.obj_what_changed():
+        return True
+    return any(_obj_has_changes(getattr(value, name))
+               for name in value.fields if value.obj_attr_is_set(name))
+
+
 def obj_make_list(context, list_obj, item_cls, db_list, **extra_args):
     """Construct an object list from a list of primitives.
 
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from nova.compute import stats as compute_stats
 from nova import db
 from nova.objects import base
 from nova.objects import fields
@@ -21,7 +22,8 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: Added get_by_service_id()
     # Version 1.2: String attributes updated to support unicode
-    VERSION = '1.2'
+    # Version 1.3: Added stats field
+    VERSION = '1.3'
 
     fields = {
         'id': fields.IntegerField(),
@@ -43,11 +45,22 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject):
         'disk_available_least': fields.IntegerField(nullable=True),
         'metrics': fields.StringField(nullable=True),
         'extra_resources': fields.StringField(nullable=True),
+        'stats': fields.DictOfNullableStringsField(nullable=True),
         }
 
+    def obj_make_compatible(self, primitive, target_version):
+        target_version = (int(target_version.split('.')[0]),
+                          int(target_version.split('.')[1]))
+        if target_version < (1, 3) and 'stats' in primitive:
+            del primitive['stats']
+
     @staticmethod
     def _from_db_object(context, compute, db_compute):
         for key in compute.fields:
+            if key == 'stats':
+                # NOTE: stored either compact or as compute_node_stats rows
+                compute[key] = compute_stats.stats_to_dict(db_compute)
+                continue
             compute[key] = db_compute[key]
         compute._context = context
         compute.obj_reset_changes()
@@ -94,13 +107,15 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject):
 class ComputeNodeList(base.ObjectListBase, base.NovaObject):
     # Version 1.0: Initial version
     #              ComputeNode <= version 1.2
-    VERSION = '1.0'
+    # Version 1.1: ComputeNode version 1.3
+    VERSION = '1.1'
     fields = {
         'objects': fields.ListOfObjectsField('ComputeNode'),
         }
     child_versions = {
         '1.0': '1.2',
         # NOTE(danms): ComputeNode was at 1.2 before we added this
+        '1.1': '1.3',
         }
 
     @base.remotable_classmethod
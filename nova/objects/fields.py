@@ -47,6 +47,10 @@ class ElementTypeError(TypeError):
 
 
 class AbstractFieldType(six.with_metaclass(abc.ABCMeta, object)):
+    # Values of exactly this type are what coerce() would return them as,
+    # and are set without calling it
+    coerced_type = None
+
     @abc.abstractmethod
     def coerce(self, obj, attr, value):
         """This is called to coerce (if possible) a value on assignment.
@@ -162,6 +166,8 @@ class Field(object):
         """
         if value is None:
             return self._null(obj, attr)
+        elif type(value) is self._type.coerced_type:
+            return value
         else:
             return self._type.coerce(obj, attr, value)
 
@@ -207,6 +213,8 @@ class Field(object):
 
 
 class String(FieldType):
+    coerced_type = unicode
+
     @staticmethod
     def coerce(obj, attr, value):
         # FIXME(danms): We should really try to avoid the need to do this
@@ -219,6 +227,8 @@ class String(FieldType):
 
 
 class UUID(FieldType):
+    coerced_type = str
+
     @staticmethod
     def coerce(obj, attr, value):
         # FIXME(danms): We should actually verify the UUIDness here
@@ -226,17 +236,23 @@ class UUID(FieldType):
 
 
 class Integer(FieldType):
+    coerced_type = int
+
     @staticmethod
     def coerce(obj, attr, value):
         return int(value)
 
 
 class Float(FieldType):
+    coerced_type = float
+
     def coerce(self, obj, attr, value):
         return float(value)
 
 
 class Boolean(FieldType):
+    coerced_type = bool
+
     @staticmethod
     def coerce(obj, attr, value):
         return bool(value)
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from nova.compute import flavors
 from nova import db
 from nova import exception
 from nova.objects import base
@@ -66,8 +67,8 @@ class Flavor(base.NovaPersistentObject, base.NovaObject):
     @base.remotable
     def _load_projects(self, context):
         self.projects = [x['project_id'] for x in
-                         db.flavor_access_get_by_flavor_id(context,
-                                                           self.flavorid)]
+                         flavors.get_flavor_access_by_flavor_id(
+                             self.flavorid, ctxt=context)]
         self.obj_reset_changes('projects')
 
     def obj_load_attr(self, attrname):
@@ -80,20 +81,20 @@ class Flavor(base.NovaPersistentObject, base.NovaObject):
 
     @base.remotable_classmethod
     def get_by_id(cls, context, id):
-        db_flavor = db.flavor_get(context, id)
+        db_flavor = flavors.get_flavor(id, ctxt=context)
         return cls._from_db_object(context, cls(), db_flavor,
                                    expected_attrs=['extra_specs'])
 
     @base.remotable_classmethod
     def get_by_name(cls, context, name):
-        db_flavor = db.flavor_get_by_name(context, name)
+        db_flavor = flavors.get_flavor_by_name(name, ctxt=context)
         return cls._from_db_object(context, cls(), db_flavor,
                                    expected_attrs=['extra_specs'])
 
     @base.remotable_classmethod
     def get_by_flavor_id(cls, context, flavor_id, read_deleted=None):
-        db_flavor = db.flavor_get_by_flavor_id(context, flavor_id,
-                                               read_deleted)
+        db_flavor = flavors.get_flavor_by_flavor_id(
+            flavor_id, ctxt=context, read_deleted=read_deleted)
         return cls._from_db_object(context, cls(), db_flavor,
                                    expected_attrs=['extra_specs'])
 
@@ -103,6 +104,9 @@ class Flavor(base.NovaPersistentObject, base.NovaObject):
             raise exception.ObjectActionError(action='add_access',
                                               reason='projects modified')
         db.flavor_access_add(context, self.flavorid, project_id)
+        flavors.notify_flavor_change(context, 'access.add',
+                                     {'flavorid': self.flavorid,
+                                      'project_id': project_id})
         self._load_projects(context)
 
     @base.remotable
@@ -111,6 +115,9 @@ class Flavor(base.NovaPersistentObject, base.NovaObject):
             raise exception.ObjectActionError(action='remove_access',
                                               reason='projects modified')
         db.flavor_access_remove(context, self.flavorid, project_id)
+        flavors.notify_flavor_change(context, 'access.remove',
+                                     {'flavorid': self.flavorid,
+                                      'project_id': project_id})
         self._load_projects(context)
 
     @base.remotable
@@ -125,6 +132,8 @@ class Flavor(base.NovaPersistentObject, base.NovaObject):
                 expected_attrs.append(attr)
         projects = updates.pop('projects', [])
         db_flavor = db.flavor_create(context, updates, projects=projects)
+        flavors.notify_flavor_change(context, 'create',
+                                     {'flavorid': db_flavor['flavorid']})
         self._from_db_object(context, self, db_flavor,
                              expected_attrs=expected_attrs)
 
@@ -155,11 +164,15 @@ class Flavor(base.NovaPersistentObject, base.NovaObject):
             for condemned_project_id in current_projects:
                 db.flavor_access_remove(context, self.flavorid,
                                         condemned_project_id)
+        if extra_specs or projects is not None:
+            flavors.notify_flavor_change(context, 'update',
+                                         {'flavorid': self.flavorid})
         self.obj_reset_changes()
 
     @base.remotable
     def destroy(self, context):
         db.flavor_destroy(context, self.name)
+        flavors.notify_flavor_change(context, 'delete', {'name': self.name})
 
 
 class FlavorList(base.ObjectListBase, base.NovaObject):
@@ -43,12 +43,19 @@ _INSTANCE_OPTIONAL_JOINED_FIELDS = ['metadata', 'system_metadata',
 # These are fields that are optional but don't translate to db columns
 _INSTANCE_OPTIONAL_NON_COLUMN_FIELDS = ['fault']
 
+# Changes to these fields need the instance to be read before being saved.
+_INSTANCE_SLOW_SAVE_FIELDS = set(['metadata', 'system_metadata', 'hostname'])
+
 # These are fields that can be specified as expected_attrs
 INSTANCE_OPTIONAL_ATTRS = (_INSTANCE_OPTIONAL_JOINED_FIELDS +
                            _INSTANCE_OPTIONAL_NON_COLUMN_FIELDS)
 # These are fields that most query calls load by default
 INSTANCE_DEFAULT_FIELDS = ['metadata', 'system_metadata',
                            'info_cache', 'security_groups']
+# These are fields always loaded when only some columns are requested
+_INSTANCE_PROJECTION_REQUIRED_FIELDS = ['id', 'uuid']
+# These are joined fields that cannot be loaded along with a projection
+_INSTANCE_NON_PROJECTABLE_FIELDS = ['info_cache', 'security_groups']
 
 
 def _expected_cols(expected_attrs):
@@ -161,10 +168,14 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         }
 
     obj_extra_fields = ['name']
+    obj_identity_fields = ['id', 'uuid']
 
     def __init__(self, *args, **kwargs):
         super(Instance, self).__init__(*args, **kwargs)
         self._reset_metadata_tracking()
+        # Whether this came from a projected query, the columns it was
+        # loaded without can then be lazy-loaded
+        self._projected = False
 
     def _reset_metadata_tracking(self):
         self._orig_system_metadata = (dict(self.system_metadata) if
@@ -185,6 +196,30 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
             changes.add('system_metadata')
         return changes
 
+    @classmethod
+    def _obj_from_primitive(cls, context, objver, primitive):
+        self = super(Instance, cls)._obj_from_primitive(context, objver,
+                                                        primitive)
+        self._projected = primitive.get('nova_object.projected', False)
+        return self
+
+    def obj_to_primitive(self, target_version=None):
+        primitive = super(Instance, self).obj_to_primitive(target_version)
+        if self._projected:
+            primitive['nova_object.projected'] = True
+        return primitive
+
+    def obj_to_delta_primitive(self):
+        delta = super(Instance, self).obj_to_delta_primitive()
+        if delta is not None and self._projected:
+            delta[1]['nova_object.projected'] = True
+        return delta
+
+    def __deepcopy__(self, memo):
+        nobj = super(Instance, self).__deepcopy__(memo)
+        nobj._projected = self._projected
+        return nobj
+
     def obj_make_compatible(self, primitive, target_version):
         target_version = (int(target_version.split('.')[0]),
                           int(target_version.split('.')[1]))
@@ -238,15 +273,28 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         return base_name
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        columns=None):
         """Method to help with migration to objects.
 
         Converts a database entity to a formal object.
+
+        If columns is given, db_inst is the result of a projected query
+        and only those fields are set; the rest are left unset so that
+        they get lazy-loaded on access.
         """
         if expected_attrs is None:
             expected_attrs = []
+        if columns is None:
+            fields_to_load = instance.fields
+        else:
+            fields_to_load = set(_INSTANCE_PROJECTION_REQUIRED_FIELDS +
+                                 list(columns))
+            expected_attrs = [attr for attr in expected_attrs
+                              if attr not in _INSTANCE_NON_PROJECTABLE_FIELDS]
+            instance._projected = True
         # Most of the field names match right now, so be quick
-        for field in instance.fields:
+        for field in fields_to_load:
             if field in INSTANCE_OPTIONAL_ATTRS:
                 continue
             elif field == 'deleted':
@@ -440,6 +488,16 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         if expected_vm_state is not None:
             updates['expected_vm_state'] = expected_vm_state
 
+        if (cell_type is None and not CONF.notify_on_state_change and
+                not set(updates) & _INSTANCE_SLOW_SAVE_FIELDS):
+            # NOTE: Nothing needs the old or the new DB copy of the
+            # instance, so just write the changed columns, leaving the
+            # other fields as they are.  Use refresh() to reload them.
+            written = db.instance_update_columns(context, self.uuid, updates)
+            self.updated_at = written['updated_at']
+            self.obj_reset_changes()
+            return
+
         expected_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
                                if self.obj_attr_is_set(attr)]
         # NOTE(alaski): We need to pull system_metadata for the
@@ -478,7 +536,38 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                 self[field] = current[field]
         self.obj_reset_changes()
 
+    def _load_projected_fields(self):
+        """Load every column field left unset by a projected query."""
+        instance = self.__class__.get_by_uuid(self._context,
+                                              uuid=self.uuid,
+                                              expected_attrs=[])
+        loaded = []
+        for field in self.fields:
+            if (field in INSTANCE_OPTIONAL_ATTRS or
+                    self.obj_attr_is_set(field)):
+                continue
+            self[field] = instance[field]
+            loaded.append(field)
+        # NOTE: These were not changed by the caller, so do not let save()
+        # write them back.  Use the base implementation so that pending
+        # metadata changes are still tracked.
+        super(Instance, self).obj_reset_changes(loaded)
+        self._projected = False
+
     def obj_load_attr(self, attrname):
+        if (self._projected and
+                attrname not in INSTANCE_OPTIONAL_ATTRS and
+                attrname in self.fields):
+            # NOTE: Load all of the columns the projected query left out
+            # at once.
+            if not self._context:
+                raise exception.OrphanedObjectError(method='obj_load_attr',
+                                                    objtype=self.obj_name())
+            LOG.debug(_("Lazy-loading projected columns on %(name)s uuid "
+                        "%(uuid)s"),
+                      {'name': self.obj_name(), 'uuid': self.uuid})
+            self._load_projected_fields()
+            return
         if attrname not in INSTANCE_OPTIONAL_ATTRS:
             raise exception.ObjectActionError(
                 action='obj_load_attr',
@@ -527,7 +616,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         self.save()
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        columns=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
@@ -543,7 +633,8 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     inst_list.objects = []
     for db_inst in db_inst_list:
         inst_obj = Instance._from_db_object(context, Instance(), db_inst,
-                                            expected_attrs=expected_attrs)
+                                            expected_attrs=expected_attrs,
+                                            columns=columns)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
@@ -556,7 +647,8 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 1.1: Added use_slave to get_by_host
     #              Instance <= version 1.9
     # Version 1.2: Instance <= version 1.11
-    VERSION = '1.2'
+    # Version 1.3: Added columns to get_by_filters and get_by_host
+    VERSION = '1.3'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -565,25 +657,37 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         '1.1': '1.9',
         # NOTE(danms): Instance was at 1.9 before we added this
         '1.2': '1.11',
+        '1.3': '1.11',
         }
 
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
-                       marker=None, expected_attrs=None):
+                       marker=None, expected_attrs=None, columns=None):
+        """Get instances matching filters.
+
+        If columns is given, only those fields (plus id and uuid) are
+        loaded from the database; the others are lazy-loaded on access.
+        """
         db_inst_list = db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, limit=limit, marker=marker,
-            columns_to_join=_expected_cols(expected_attrs))
+            columns_to_join=_expected_cols(expected_attrs), columns=columns)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
+    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False,
+                    columns=None):
+        """Get instances on a host.
+
+        If columns is given, only those fields (plus id and uuid) are
+        loaded from the database; the others are lazy-loaded on access.
+        """
         db_inst_list = db.instance_get_all_by_host(
             context, host, columns_to_join=_expected_cols(expected_attrs),
-            use_slave=use_slave)
+            use_slave=use_slave, columns=columns)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
     def get_by_host_and_node(cls, context, host, node, expected_attrs=None):
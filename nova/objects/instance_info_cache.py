@@ -32,7 +32,8 @@ class InstanceInfoCache(base.NovaPersistentObject, base.NovaObject):
     # Version 1.4: String attributes updated to support unicode
     # Version 1.5: Actually set the deleted, created_at, updated_at, and
     #              deleted_at attributes
-    VERSION = '1.5'
+    # Version 1.6: Added update_many()
+    VERSION = '1.6'
 
     fields = {
         'instance_uuid': fields.UUIDField(),
@@ -93,6 +94,32 @@ class InstanceInfoCache(base.NovaPersistentObject, base.NovaObject):
                 self._info_cache_cells_update(context, rv)
         self.obj_reset_changes()
 
+    @base.remotable_classmethod
+    def update_many(cls, context, network_infos):
+        """Save the network info of many instances at once.
+
+        In a compute cell every info cache is saved on its own instead, so
+        that the top cell hears of each update like with save().
+
+        :param network_infos: dict of instance uuid to the JSON of its
+                              network info
+        """
+        if cells_opts.get_cell_type() == 'compute':
+            for instance_uuid, nw_info_json in network_infos.iteritems():
+                try:
+                    rv = db.instance_info_cache_update(
+                        context, instance_uuid,
+                        {'network_info': nw_info_json})
+                except exception.InstanceInfoCacheNotFound:
+                    # Deleted, like update_many skips it
+                    continue
+                if rv:
+                    cls._info_cache_cells_update(context, rv)
+            return
+        db.instance_info_cache_update_many(context, dict(
+            (instance_uuid, {'network_info': nw_info_json})
+            for instance_uuid, nw_info_json in network_infos.iteritems()))
+
     @base.remotable
     def delete(self, context):
         db.instance_info_cache_delete(context, self.instance_uuid)
@@ -29,7 +29,8 @@ class Service(base.NovaPersistentObject, base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: Added compute_node nested object
     # Version 1.2: String attributes updated to support unicode
-    VERSION = '1.2'
+    # Version 1.3: ComputeNode version 1.3
+    VERSION = '1.3'
 
     fields = {
         'id': fields.IntegerField(),
@@ -43,6 +44,14 @@ class Service(base.NovaPersistentObject, base.NovaObject):
         'compute_node': fields.ObjectField('ComputeNode'),
         }
 
+    def obj_make_compatible(self, primitive, target_version):
+        target_version = (int(target_version.split('.')[0]),
+                          int(target_version.split('.')[1]))
+        if target_version < (1, 3) and 'compute_node' in primitive:
+            self.compute_node.obj_make_compatible(
+                primitive['compute_node']['nova_object.data'], '1.2')
+            primitive['compute_node']['nova_object.version'] = '1.2'
+
     @staticmethod
     def _do_compute_node(context, service, db_service):
         try:
@@ -126,7 +135,8 @@ class Service(base.NovaPersistentObject, base.NovaObject):
 class ServiceList(base.ObjectListBase, base.NovaObject):
     # Version 1.0: Initial version
     #              Service <= version 1.2
-    VERSION = '1.0'
+    # Version 1.1: Service version 1.3
+    VERSION = '1.1'
 
     fields = {
         'objects': fields.ListOfObjectsField('Service'),
@@ -134,6 +144,7 @@ class ServiceList(base.ObjectListBase, base.NovaObject):
     child_versions = {
         '1.0': '1.2',
         # NOTE(danms): Service was at 1.2 before we added this
+        '1.1': '1.3',
         }
 
     @base.remotable_classmethod
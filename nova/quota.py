@@ -79,9 +79,16 @@ quota_opts = [
     cfg.IntOpt('max_age',
                default=0,
                help='number of seconds between subsequent usage refreshes'),
+    cfg.IntOpt('quota_usage_refresh_interval',
+               default=3600,
+               help='number of seconds between the refreshes of the usages '
+                    'of all projects by the scheduler, a negative value '
+                    'disables them'),
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
-               help='default driver to use for quota checks'),
+               help='default driver to use for quota checks, '
+                    'nova.quota.CounterQuotaDriver avoids locking usages '
+                    'at the cost of exact project quotas'),
     ]
 
 CONF = cfg.CONF
@@ -494,6 +501,11 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
+        return self._quota_reserve(context, resources, quotas, user_quotas,
+                                   deltas, expire, project_id, user_id)
+
+    def _quota_reserve(self, context, resources, quotas, user_quotas, deltas,
+                       expire, project_id, user_id):
         return db.quota_reserve(context, resources, quotas, user_quotas,
                                 deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
@@ -575,6 +587,18 @@ class DbQuotaDriver(object):
                 # That means it'll be refreshed anyway
                 pass
 
+    def usage_refresh_all(self, context):
+        """
+        Set the usage records of all projects and users to the actual
+        usage, all at once.  This makes refreshing them while making
+        reservations unnecessary.
+
+        :param context: The request context, for access checks.
+        :returns: the number of usage records which were out of sync
+        """
+
+        return db.quota_usage_refresh_all(context)
+
     def destroy_all_by_project_and_user(self, context, project_id, user_id):
         """
         Destroy all quotas, usages, and reservations associated with a
@@ -610,6 +634,45 @@ class DbQuotaDriver(object):
         db.reservation_expire(context)
 
 
+class CounterQuotaDriver(DbQuotaDriver):
+    """Database quota driver which does not lock the usage rows.
+
+    Reservations add to the usages with conditional UPDATE statements
+    instead of locking a project's usage rows for the whole transaction,
+    and commits and rollbacks adjust them in place.  This lets bursts of
+    requests from one project proceed concurrently, at the cost of
+    project-wide quotas possibly being overrun by concurrent requests, and
+    of usages only being refreshed when they are reset.
+    """
+
+    def _quota_reserve(self, context, resources, quotas, user_quotas, deltas,
+                       expire, project_id, user_id):
+        return db.quota_reserve_counted(context, resources, quotas,
+                                        user_quotas, deltas, expire,
+                                        CONF.until_refresh, CONF.max_age,
+                                        project_id=project_id,
+                                        user_id=user_id)
+
+    def commit(self, context, reservations, project_id=None, user_id=None):
+        if project_id is None:
+            project_id = context.project_id
+        if user_id is None:
+            user_id = context.user_id
+
+        db.reservation_commit_counted(context, reservations,
+                                      project_id=project_id, user_id=user_id)
+
+    def rollback(self, context, reservations, project_id=None, user_id=None):
+        if project_id is None:
+            project_id = context.project_id
+        if user_id is None:
+            user_id = context.user_id
+
+        db.reservation_rollback_counted(context, reservations,
+                                        project_id=project_id,
+                                        user_id=user_id)
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
@@ -858,6 +921,17 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def usage_refresh_all(self, context):
+        """
+        Set the usage records of all projects and users to the actual
+        usage, all at once.  This makes refreshing them while making
+        reservations unnecessary.
+
+        :param context: The request context, for access checks.
+        :returns: the number of usage records which were out of sync
+        """
+        return 0
+
     def destroy_all_by_project_and_user(self, context, project_id, user_id):
         """
         Destroy all quotas, usages, and reservations associated with a
@@ -1339,6 +1413,18 @@ class QuotaEngine(object):
 
         self._driver.usage_reset(context, resources)
 
+    def usage_refresh_all(self, context):
+        """
+        Set the usage records of all projects and users to the actual
+        usage, all at once.  This makes refreshing them while making
+        reservations unnecessary.
+
+        :param context: The request context, for access checks.
+        :returns: the number of usage records which were out of sync
+        """
+
+        return self._driver.usage_refresh_all(context)
+
     def destroy_all_by_project_and_user(self, context, project_id, user_id):
         """
         Destroy all quotas, usages, and reservations associated with a
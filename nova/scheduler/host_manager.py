@@ -128,6 +128,7 @@ class HostState(object):
         self.num_instances_by_project = {}
         self.num_instances_by_os_type = {}
         self.num_io_ops = 0
+        self.num_builds_queued = 0
 
         # Other information
         self.host_ip = None
@@ -251,6 +252,9 @@ class HostState(object):
 
         self.num_io_ops = int(self.stats.get('io_workload', 0))
 
+        # Track number of builds queued for one of their stages
+        self.num_builds_queued = int(self.stats.get('num_builds_queued', 0))
+
         # update metrics
         self._update_metrics_from_compute_node(compute)
 
@@ -304,6 +308,9 @@ class HostState(object):
             self.num_io_ops += 1
 
     def _statmap(self, stats):
+        if isinstance(stats, dict):
+            # NOTE: Already decoded from the compact stats of the node
+            return stats
         return dict((st['key'], st['value']) for st in stats)
 
     def __repr__(self):
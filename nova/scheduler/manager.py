@@ -33,6 +33,7 @@ from nova import exception
 from nova import manager
 from nova.objects import instance as instance_obj
 from nova.openstack.common import excutils
+from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -272,6 +273,16 @@ class SchedulerManager(manager.Manager):
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
 
+    @periodic_task.periodic_task(spacing=CONF.quota_usage_refresh_interval)
+    def _refresh_quota_usages(self, context):
+        # NOTE: Expired reservations are expired first, so that their
+        # usages are refreshed too.
+        QUOTAS.expire(context)
+        count = QUOTAS.usage_refresh_all(context)
+        if count:
+            LOG.info(_("Refreshed %d quota usages which were out of sync"),
+                     count)
+
     # NOTE(russellb) This method can be removed in 3.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
@@ -273,6 +273,7 @@ class Service(service.Service):
         except Exception:
             pass
 
+        self.manager.cleanup_host()
         super(Service, self).stop()
 
     def periodic_tasks(self, raise_on_error=False):
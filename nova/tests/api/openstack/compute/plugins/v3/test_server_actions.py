@@ -28,6 +28,7 @@ from nova import db
 from nova import exception
 from nova.image import glance
 from nova.openstack.common import importutils
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests import fake_instance
@@ -54,6 +55,10 @@ def instance_update_and_get_original(context, instance_uuid, values,
     return (inst, inst)
 
 
+def instance_update_columns(context, instance_uuid, values):
+    return {'updated_at': timeutils.utcnow()}
+
+
 def instance_update(context, instance_uuid, kwargs, update_cells=True):
     inst = fakes.stub_instance(INSTANCE_IDS[instance_uuid], host='fake_host')
     return inst
@@ -80,6 +85,8 @@ class ServerActionsControllerTest(test.TestCase):
                                                host='fake_host'))
         self.stubs.Set(db, 'instance_update_and_get_original',
                        instance_update_and_get_original)
+        self.stubs.Set(db, 'instance_update_columns',
+                       instance_update_columns)
 
         fakes.stub_out_glance(self.stubs)
         fakes.stub_out_nw_api(self.stubs)
@@ -170,7 +177,8 @@ class ServerActionsControllerTest(test.TestCase):
         req = fakes.HTTPRequestV3.blank(self.url)
         self.stubs.Set(db, 'instance_get_by_uuid',
                        fakes.fake_instance_get(vm_state=vm_states.ACTIVE,
-                                        task_state=task_states.REBOOTING))
+                                        task_state=task_states.REBOOTING,
+                                        host='fake_host'))
         self.controller._action_reboot(req, FAKE_UUID, body)
 
     def test_reboot_hard_with_hard_in_progress_raises_conflict(self):
@@ -458,6 +458,8 @@ def fake_instance_get_all_by_filters(num_servers=5, **kwargs):
 
         if 'columns_to_join' in kwargs:
             kwargs.pop('columns_to_join')
+        if 'columns' in kwargs:
+            kwargs.pop('columns')
         for i in xrange(num_servers):
             uuid = get_fake_uuid(i)
             server = stub_instance(id=i + 1, uuid=uuid,
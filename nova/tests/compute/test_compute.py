@@ -573,6 +573,48 @@ class ComputeVolumeTestCase(BaseTestCase):
                         self.compute._last_vol_usage_poll)
         self.mox.UnsetStubs()
 
+    def test_poll_bandwidth_usage_writes_all_counters_at_once(self):
+        ctxt = 'MockContext'
+        self.compute.host = 'MockHost'
+        self.flags(bandwidth_poll_interval=10)
+        self.compute._last_bw_usage_poll = 0
+        counters = [{'uuid': 'uuid1', 'mac_address': 'mac1',
+                     'bw_in': 10, 'bw_out': 20},
+                    {'uuid': 'uuid2', 'mac_address': 'mac2',
+                     'bw_in': 5, 'bw_out': 6}]
+        self.mox.StubOutWithMock(utils, 'last_completed_audit_period')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'instance_get_all_by_host')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_all_bw_counters')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'bw_usage_get_by_uuids')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'bw_usage_update_many')
+        self.useFixture(test.TimeOverride())
+        utils.last_completed_audit_period().AndReturn((0, 100))
+        self.compute.conductor_api.instance_get_all_by_host(
+            ctxt, 'MockHost', columns_to_join=[]).AndReturn(['inst'])
+        self.compute.driver.get_all_bw_counters(['inst']).AndReturn(counters)
+        # Both periods are fetched once, for all counters
+        self.compute.conductor_api.bw_usage_get_by_uuids(
+            ctxt, ['uuid1', 'uuid2'], 100).AndReturn(
+                [{'uuid': 'uuid1', 'mac': 'mac1', 'bw_in': 1, 'bw_out': 2,
+                  'last_ctr_in': 4, 'last_ctr_out': 8},
+                 {'uuid': 'uuid2', 'mac': 'other-mac', 'bw_in': 1,
+                  'bw_out': 2, 'last_ctr_in': 4, 'last_ctr_out': 8}])
+        self.compute.conductor_api.bw_usage_get_by_uuids(
+            ctxt, ['uuid1', 'uuid2'], 0).AndReturn([])
+        self.compute.conductor_api.bw_usage_update_many(
+            ctxt, [{'uuid': 'uuid1', 'mac': 'mac1', 'start_period': 100,
+                    'bw_in': 7, 'bw_out': 14, 'last_ctr_in': 10,
+                    'last_ctr_out': 20},
+                   {'uuid': 'uuid2', 'mac': 'mac2', 'start_period': 100,
+                    'bw_in': 0, 'bw_out': 0, 'last_ctr_in': 5,
+                    'last_ctr_out': 6}],
+            last_refreshed=timeutils.utcnow(), update_cells=True)
+        self.mox.ReplayAll()
+        self.compute._poll_bandwidth_usage(ctxt)
+
     def test_detach_volume_usage(self):
         # Test that detach volume update the volume usage cache table correctly
         instance = self._create_fake_instance()
@@ -1476,6 +1518,21 @@ class ComputeTestCase(BaseTestCase):
                 None, True, None, False)
         self.assertIn('default_block_device_names', called)
 
+    def test_run_instance_admits_build_stages(self):
+        admitted = []
+
+        @contextlib.contextmanager
+        def fake_admit(stage, instance):
+            admitted.append(stage)
+            yield
+
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.stubs.Set(self.compute._build_admission, 'admit', fake_admit)
+        self.compute.run_instance(self.context, instance, {}, {}, [], None,
+                None, True, None, False)
+        self.assertEqual(['prefetch_image', 'prep_block_device', 'spawn'],
+                         admitted)
+
     def test_can_terminate_on_error_state(self):
         # Make sure that the instance can be terminated in ERROR state.
         #check failed to schedule --> terminate
@@ -2117,7 +2174,7 @@ class ComputeTestCase(BaseTestCase):
         self.mox.StubOutWithMock(self.compute, '_get_instance_nw_info')
         self.mox.StubOutWithMock(self.compute, '_notify_about_instance_usage')
         self.mox.StubOutWithMock(self.compute, '_instance_update')
-        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(db, 'instance_update_columns')
         self.mox.StubOutWithMock(self.compute, '_get_power_state')
         self.mox.StubOutWithMock(self.compute.driver, 'reboot')
 
@@ -2135,16 +2192,7 @@ class ComputeTestCase(BaseTestCase):
         instance = instance_obj.Instance._from_db_object(
             econtext, instance_obj.Instance(), db_instance)
 
-        updated_dbinstance1 = fake_instance.fake_db_instance(
-            **dict(uuid='updated-instance1',
-                   power_state=10003,
-                   vm_state=vm_states.ACTIVE,
-                   launched_at=timeutils.utcnow()))
-        updated_dbinstance2 = fake_instance.fake_db_instance(
-            **dict(uuid='updated-instance2',
-                   power_state=10003,
-                   vm_state=vm_states.ACTIVE,
-                   launched_at=timeutils.utcnow()))
+        updated_at = timeutils.utcnow()
 
         if test_unrescue:
             instance['vm_state'] = vm_states.RESCUED
@@ -2173,12 +2221,9 @@ class ComputeTestCase(BaseTestCase):
                                                   'reboot.start')
         self.compute._get_power_state(econtext,
                 instance).AndReturn(fake_power_state1)
-        db.instance_update_and_get_original(econtext, instance['uuid'],
-                                            {'power_state': fake_power_state1},
-                                            update_cells=False,
-                                            columns_to_join=['system_metadata']
-                                            ).AndReturn((None,
-                                                         updated_dbinstance1))
+        db.instance_update_columns(econtext, instance['uuid'],
+                                   {'power_state': fake_power_state1}
+                                   ).AndReturn({'updated_at': updated_at})
 
         expected_nw_info = fake_nw_model
 
@@ -2205,6 +2250,12 @@ class ComputeTestCase(BaseTestCase):
 
         self.stubs.Set(self.compute.driver, 'reboot', fake_reboot)
 
+        # Rebooting a rescued instance leaves it rescued
+        if test_unrescue:
+            new_vm_state = vm_states.RESCUED
+        else:
+            new_vm_state = vm_states.ACTIVE
+
         # Power state should be updated again
         if not fail_reboot or fail_running:
             new_power_state = fake_power_state2
@@ -2216,13 +2267,11 @@ class ComputeTestCase(BaseTestCase):
                     instance).AndReturn(fake_power_state3)
 
         if test_delete:
-            db.instance_update_and_get_original(
-                econtext, updated_dbinstance1['uuid'],
+            db.instance_update_columns(
+                econtext, instance['uuid'],
                 {'power_state': new_power_state,
                  'task_state': None,
-                 'vm_state': vm_states.ACTIVE},
-                update_cells=False,
-                columns_to_join=['system_metadata'],
+                 'vm_state': new_vm_state},
                 ).AndRaise(exception.InstanceNotFound(
                     instance_id=instance['uuid']))
             self.compute._notify_about_instance_usage(
@@ -2230,22 +2279,18 @@ class ComputeTestCase(BaseTestCase):
                 instance,
                 'reboot.end')
         elif fail_reboot and not fail_running:
-            db.instance_update_and_get_original(
-                econtext, updated_dbinstance1['uuid'],
+            db.instance_update_columns(
+                econtext, instance['uuid'],
                 {'vm_state': vm_states.ERROR},
-                update_cells=False,
-                columns_to_join=['system_metadata'],
                 ).AndRaise(exception.InstanceNotFound(
                     instance_id=instance['uuid']))
         else:
-            db.instance_update_and_get_original(
-                econtext, updated_dbinstance1['uuid'],
+            db.instance_update_columns(
+                econtext, instance['uuid'],
                 {'power_state': new_power_state,
                  'task_state': None,
-                 'vm_state': vm_states.ACTIVE},
-                update_cells=False,
-                columns_to_join=['system_metadata'],
-                ).AndReturn((None, updated_dbinstance2))
+                 'vm_state': new_vm_state},
+                ).AndReturn({'updated_at': updated_at})
             self.compute._notify_about_instance_usage(
                 econtext,
                 instance,
@@ -5116,8 +5161,9 @@ class ComputeTestCase(BaseTestCase):
         self.compute._get_instances_on_driver(
             admin_context, {'deleted': True,
                             'soft_deleted': False,
-                            'host': self.compute.host}).AndReturn([instance1,
-                                                                   instance2])
+                            'host': self.compute.host},
+            columns=compute_manager._RUNNING_DELETED_COLUMNS).AndReturn(
+                [instance1, instance2])
         self.flags(running_deleted_instance_timeout=3600,
                    running_deleted_instance_action=action)
 
@@ -5207,7 +5253,9 @@ class ComputeTestCase(BaseTestCase):
         self.compute._get_instances_on_driver(
             admin_context, {'deleted': True,
                             'soft_deleted': False,
-                            'host': self.compute.host}).AndReturn([instance1])
+                            'host': self.compute.host},
+            columns=compute_manager._RUNNING_DELETED_COLUMNS).AndReturn(
+                [instance1])
 
         self.mox.StubOutWithMock(timeutils, 'is_older_than')
         timeutils.is_older_than('sometimeago',
@@ -5267,7 +5315,8 @@ class ComputeTestCase(BaseTestCase):
                 'get_nw_info': 0, 'expected_instance': None}
 
         def fake_instance_get_all_by_host(context, host,
-                                          columns_to_join, use_slave=False):
+                                          columns_to_join, use_slave=False,
+                                          columns=None):
             call_info['get_all_by_host'] += 1
             self.assertEqual([], columns_to_join)
             return instances[:]
@@ -5332,6 +5381,46 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(call_info['get_by_uuid'], 3)
         self.assertEqual(call_info['get_nw_info'], 4)
 
+    def test_heal_instance_info_cache_batched(self):
+        self.flags(heal_instance_info_cache_interval=120,
+                   heal_instance_info_cache_per_minute=2)
+        ctxt = context.get_admin_context()
+        uuids = [self._create_fake_instance({'host': self.compute.host})[
+                 'uuid'] for x in xrange(5)]
+        self._create_fake_instance({'host': 'not-me'})
+
+        healed = []
+
+        def fake_get_instances_nw_info(context, instances):
+            for instance in instances:
+                self.assertTrue(instance.obj_attr_is_set('info_cache'))
+                self.assertTrue(instance.obj_attr_is_set('system_metadata'))
+            healed.append(set(instance.uuid for instance in instances))
+            return dict((instance.uuid, network_model.NetworkInfo())
+                        for instance in instances)
+
+        self.stubs.Set(self.compute.network_api, 'get_instances_nw_info',
+                       fake_get_instances_nw_info)
+
+        self.compute._heal_instance_info_cache(ctxt)
+        # Not due yet
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual(1, len(healed))
+        self.assertEqual(4, len(healed[0]))
+
+        # The last instance switches hosts, so there is nothing to heal
+        moved = self.compute._instance_uuids_to_heal[0]
+        db.instance_update(ctxt, moved, {'host': 'not-me'})
+        self.compute._last_info_cache_heal = 0
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual(1, len(healed))
+        self.assertEqual([], self.compute._instance_uuids_to_heal)
+
+        # Pulls the instances from the DB again
+        self.compute._last_info_cache_heal = 0
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual(set(uuids) - set([moved]), healed[1])
+
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
         not_timed_out_time = timeutils.utcnow()
@@ -5908,9 +5997,11 @@ class ComputeTestCase(BaseTestCase):
         self._create_fake_instance({'host': self.compute.host})
         self._create_fake_instance({'host': self.compute.host})
         self._create_fake_instance({'host': self.compute.host})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
         self.mox.StubOutWithMock(self.compute.driver, 'get_info')
         self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
 
+        self.compute.driver.get_power_states().AndRaise(NotImplementedError)
         # Check to make sure task continues on error.
         self.compute.driver.get_info(mox.IgnoreArg()).AndRaise(
             exception.InstanceNotFound(instance_id='fake-uuid'))
@@ -5931,6 +6022,57 @@ class ComputeTestCase(BaseTestCase):
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
+    def test_sync_power_states_bulk(self):
+        ctxt = self.context.elevated()
+        in_sync = self._create_fake_instance(
+            {'host': self.compute.host, 'power_state': power_state.RUNNING})
+        shutdown = self._create_fake_instance(
+            {'host': self.compute.host, 'power_state': power_state.RUNNING})
+        missing = self._create_fake_instance(
+            {'host': self.compute.host, 'power_state': power_state.RUNNING})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_num_instances')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+        self.compute.driver.get_power_states().AndReturn(
+            {in_sync['uuid']: power_state.RUNNING,
+             shutdown['uuid']: power_state.SHUTDOWN})
+        self.compute._sync_instance_power_state(
+            ctxt, mox.Func(lambda inst: inst.uuid == shutdown['uuid']),
+            power_state.SHUTDOWN, use_slave=True).InAnyOrder()
+        self.compute._sync_instance_power_state(
+            ctxt, mox.Func(lambda inst: inst.uuid == missing['uuid']),
+            power_state.NOSTATE, use_slave=True).InAnyOrder()
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
+    def test_power_state_in_sync(self):
+        def in_sync(vm_state, db_power_state, vm_power_state):
+            instance = instance_obj.Instance(vm_state=vm_state,
+                                             power_state=db_power_state)
+            return self.compute._power_state_in_sync(instance,
+                                                     vm_power_state)
+
+        self.assertTrue(in_sync(vm_states.ACTIVE, power_state.RUNNING,
+                                power_state.RUNNING))
+        self.assertFalse(in_sync(vm_states.ACTIVE, power_state.RUNNING,
+                                 power_state.SHUTDOWN))
+        self.assertFalse(in_sync(vm_states.ACTIVE, power_state.SHUTDOWN,
+                                 power_state.SHUTDOWN))
+        self.assertFalse(in_sync(vm_states.ACTIVE, power_state.PAUSED,
+                                 power_state.PAUSED))
+        self.assertTrue(in_sync(vm_states.STOPPED, power_state.SHUTDOWN,
+                                power_state.SHUTDOWN))
+        self.assertFalse(in_sync(vm_states.STOPPED, power_state.RUNNING,
+                                 power_state.RUNNING))
+        self.assertTrue(in_sync(vm_states.DELETED, power_state.NOSTATE,
+                                power_state.NOSTATE))
+        self.assertFalse(in_sync(vm_states.SOFT_DELETED, power_state.RUNNING,
+                                 power_state.RUNNING))
+        self.assertTrue(in_sync(vm_states.PAUSED, power_state.PAUSED,
+                                power_state.PAUSED))
+
     def _test_lifecycle_event(self, lifecycle_event, power_state):
         instance = self._create_fake_instance()
         uuid = instance['uuid']
@@ -5957,6 +6099,113 @@ class ComputeTestCase(BaseTestCase):
                                    power_state.RUNNING)
         self._test_lifecycle_event(-1, None)
 
+    def _test_lifecycle_event_notes_power_state(self, synced):
+        self.flags(sync_power_state_from_events=True)
+        instance = self._create_fake_instance()
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+        self.compute._sync_instance_power_state(
+            mox.IgnoreArg(), mox.IgnoreArg(),
+            power_state.SHUTDOWN).AndReturn(synced)
+        self.mox.ReplayAll()
+        self.compute.handle_events(event.LifecycleEvent(
+            instance['uuid'], event.EVENT_LIFECYCLE_STOPPED))
+        return self.compute._known_power_states.get(instance['uuid'])
+
+    def test_lifecycle_event_notes_power_state(self):
+        known = self._test_lifecycle_event_notes_power_state(True)
+        self.assertEqual(power_state.SHUTDOWN, known[1])
+
+    def test_lifecycle_event_not_synced_not_noted(self):
+        # A skipped or failed sync is retried by _sync_power_states
+        self.assertIsNone(self._test_lifecycle_event_notes_power_state(False))
+
+    def _setup_missed_power_states(self, known_power_states):
+        self.flags(sync_power_state_from_events=True)
+        self.compute._last_full_power_state_sync = time.time()
+        for uuid, state in known_power_states.items():
+            self.compute._note_power_state(uuid, state)
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'get_by_host')
+        self.mox.StubOutWithMock(instance_obj.Instance, 'get_by_uuid')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+    def test_sync_power_states_from_events(self):
+        ctxt = self.context.elevated()
+        self._setup_missed_power_states({'in-sync': power_state.RUNNING,
+                                         'missed': power_state.RUNNING,
+                                         'failed': power_state.RUNNING,
+                                         'gone': power_state.RUNNING})
+        missed = instance_obj.Instance(uuid='missed', task_state=None)
+        failed = instance_obj.Instance(uuid='failed', task_state=None)
+
+        self.compute.driver.get_power_states().AndReturn(
+            {'in-sync': power_state.RUNNING,
+             'missed': power_state.SHUTDOWN,
+             'failed': power_state.SHUTDOWN,
+             'foreign': power_state.RUNNING})
+        instance_obj.Instance.get_by_uuid(
+            ctxt, 'missed', expected_attrs=[], use_slave=True).InAnyOrder(
+            ).AndReturn(missed)
+        self.compute._sync_instance_power_state(
+            ctxt, missed, power_state.SHUTDOWN, use_slave=True).InAnyOrder(
+            ).AndReturn(True)
+        instance_obj.Instance.get_by_uuid(
+            ctxt, 'failed', expected_attrs=[], use_slave=True).InAnyOrder(
+            ).AndReturn(failed)
+        self.compute._sync_instance_power_state(
+            ctxt, failed, power_state.SHUTDOWN, use_slave=True).InAnyOrder(
+            ).AndReturn(False)
+        instance_obj.Instance.get_by_uuid(
+            ctxt, 'foreign', expected_attrs=[], use_slave=True).InAnyOrder(
+            ).AndRaise(exception.InstanceNotFound(instance_id='foreign'))
+        instance_obj.Instance.get_by_uuid(
+            ctxt, 'gone', expected_attrs=[], use_slave=True).InAnyOrder(
+            ).AndRaise(exception.InstanceNotFound(instance_id='gone'))
+        self.mox.ReplayAll()
+
+        self.compute._sync_power_states(ctxt)
+        self.assertEqual(
+            {'in-sync': power_state.RUNNING,
+             'missed': power_state.SHUTDOWN,
+             'failed': power_state.RUNNING,
+             'foreign': power_state.RUNNING,
+             'gone': power_state.NOSTATE},
+            dict((uuid, state) for uuid, (sequence, state)
+                 in self.compute._known_power_states.items()))
+
+    def test_sync_power_states_from_events_newer_event(self):
+        ctxt = self.context.elevated()
+        self._setup_missed_power_states({'paused': power_state.RUNNING})
+
+        def get_power_states():
+            # The event arrives while the hypervisor is listed
+            self.compute._note_power_state('paused', power_state.PAUSED)
+            return {'paused': power_state.RUNNING}
+
+        self.compute.driver.get_power_states().WithSideEffects(
+            get_power_states).AndReturn({'paused': power_state.RUNNING})
+        self.mox.ReplayAll()
+
+        self.compute._sync_power_states(ctxt)
+        self.assertEqual(power_state.PAUSED,
+                         self.compute._known_power_states['paused'][1])
+
+    def test_sync_power_states_from_events_full(self):
+        self.flags(sync_power_state_from_events=True)
+        ctxt = self.context.elevated()
+        instance = self._create_fake_instance(
+            {'host': self.compute.host, 'power_state': power_state.RUNNING})
+        self.compute._note_power_state('deleted', power_state.RUNNING)
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.compute.driver.get_power_states().AndReturn(
+            {instance['uuid']: power_state.RUNNING})
+        self.mox.ReplayAll()
+
+        self.compute._sync_power_states(ctxt)
+        self.assertEqual([instance['uuid']],
+                         self.compute._known_power_states.keys())
+        self.assertNotEqual(0, self.compute._last_full_power_state_sync)
+
     def test_lifecycle_event_non_existent_instance(self):
         # No error raised for non-existent instance because of inherent race
         # between database updates and hypervisor events. See bug #1180501.
@@ -9151,7 +9400,7 @@ class ComputeRescheduleOrErrorTestCase(BaseTestCase):
             exc_info = sys.exc_info()
 
             compute_utils.add_instance_fault_from_exc(self.context,
-                    self.compute.conductor_api,
+                    self.compute.audit_records,
                     self.instance, exc_info[0], exc_info=exc_info)
             self.compute._shutdown_instance(self.context, self.instance,
                     mox.IgnoreArg(),
@@ -9207,7 +9456,7 @@ class ComputeRescheduleOrErrorTestCase(BaseTestCase):
         except Exception:
             exc_info = sys.exc_info()
             compute_utils.add_instance_fault_from_exc(self.context,
-                    self.compute.conductor_api,
+                    self.compute.audit_records,
                     self.instance, exc_info[0], exc_info=exc_info)
 
             self.compute._shutdown_instance(self.context, self.instance,
@@ -9240,7 +9489,7 @@ class ComputeRescheduleOrErrorTestCase(BaseTestCase):
             exc_info = sys.exc_info()
 
             compute_utils.add_instance_fault_from_exc(self.context,
-                    self.compute.conductor_api,
+                    self.compute.audit_records,
                     self.instance, exc_info[0], exc_info=exc_info)
             self.compute._shutdown_instance(self.context, self.instance,
                                             mox.IgnoreArg(),
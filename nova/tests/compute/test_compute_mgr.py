@@ -15,6 +15,8 @@
 import contextlib
 import time
 
+from eventlet import event
+from eventlet import greenthread
 import mock
 import mox
 from oslo.config import cfg
@@ -48,6 +50,11 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.compute = importutils.import_object(CONF.compute_manager)
         self.context = context.RequestContext('fake', 'fake')
 
+    def test_poll_bandwidth_usage_is_periodic_task(self):
+        tasks = [name for name, task in self.compute._periodic_tasks]
+        self.assertIn('_poll_bandwidth_usage', tasks)
+        self.assertNotIn('_bw_usage_getter', tasks)
+
     def test_allocate_network_succeeds_after_retries(self):
         self.flags(network_allocate_retries=8)
 
@@ -158,7 +165,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             context.get_admin_context().AndReturn(fake_context)
             db.instance_get_all_by_host(
                     fake_context, our_host, columns_to_join=['info_cache'],
-                    use_slave=False
+                    use_slave=False, columns=None
                     ).AndReturn(startup_instances)
             if defer_iptables_apply:
                 self.compute.driver.filter_defer_apply_on()
@@ -204,6 +211,74 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.mox.VerifyAll()
         self.mox.UnsetStubs()
 
+    def test_init_host_concurrently_defers_iptables_apply(self):
+        self.flags(defer_iptables_apply=False, init_instance_concurrency=4)
+        with contextlib.nested(
+            mock.patch.object(self.compute.driver, 'init_host'),
+            mock.patch.object(self.compute.driver, 'filter_defer_apply_on'),
+            mock.patch.object(self.compute.driver, 'filter_defer_apply_off'),
+            mock.patch.object(instance_obj.InstanceList, 'get_by_host',
+                              return_value=[]),
+            mock.patch.object(self.compute, '_destroy_evacuated_instances'),
+        ) as (init_host, apply_on, apply_off, get_by_host, destroy):
+            self.compute.init_host()
+            apply_on.assert_called_once_with()
+            apply_off.assert_called_once_with()
+
+    def test_init_instances_concurrently(self):
+        self.flags(init_instance_concurrency=2)
+        running = []
+        initialized = []
+
+        def fake_init_instance(context, instance):
+            running.append(instance)
+            self.assertTrue(len(running) <= 2)
+            greenthread.sleep(0)
+            running.remove(instance)
+            initialized.append(instance)
+
+        self.stubs.Set(self.compute, '_init_instance', fake_init_instance)
+        self.compute._init_instances(self.context, range(5))
+        self.assertEqual(range(5), sorted(initialized))
+
+    def test_init_instances_concurrently_error(self):
+        self.flags(init_instance_concurrency=3)
+        initialized = []
+
+        def fake_init_instance(context, instance):
+            greenthread.sleep(0)
+            if instance == 1:
+                raise test.TestingException()
+            greenthread.sleep(0)
+            initialized.append(instance)
+
+        self.stubs.Set(self.compute, '_init_instance', fake_init_instance)
+        self.assertRaises(test.TestingException,
+                          self.compute._init_instances, self.context,
+                          range(3))
+        # The instance initialized along with the failed one is done
+        self.assertEqual([0, 2], sorted(initialized))
+
+    def test_init_instances_concurrently_error_stops(self):
+        self.flags(init_instance_concurrency=3)
+        started = []
+
+        def fake_init_instance(context, instance):
+            started.append(instance)
+            greenthread.sleep(0)
+            if instance == 0:
+                raise test.TestingException()
+            # The others take long, so that slots free up after the error
+            for i in range(10):
+                greenthread.sleep(0)
+
+        self.stubs.Set(self.compute, '_init_instance', fake_init_instance)
+        self.assertRaises(test.TestingException,
+                          self.compute._init_instances, self.context,
+                          range(10))
+        # No instance is started once one failed
+        self.assertEqual([0, 1, 2], started)
+
     def test_init_host_with_deleted_migration(self):
         our_host = self.compute.host
         not_our_host = 'not-' + our_host
@@ -225,7 +300,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         context.get_admin_context().AndReturn(fake_context)
         db.instance_get_all_by_host(fake_context, our_host,
                                     columns_to_join=['info_cache'],
-                                    use_slave=False
+                                    use_slave=False, columns=None
                                     ).AndReturn([])
         self.compute.init_virt_events()
 
@@ -433,7 +508,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                 {'uuid': [inst['uuid'] for
                           inst in driver_instances]},
                 'created_at', 'desc', columns_to_join=None,
-                limit=None, marker=None).AndReturn(
+                limit=None, marker=None, columns=None).AndReturn(
                         driver_instances)
 
         self.mox.ReplayAll()
@@ -473,7 +548,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         db.instance_get_all_by_filters(
                 fake_context, filters,
                 'created_at', 'desc', columns_to_join=None,
-                limit=None, marker=None).AndReturn(all_instances)
+                limit=None, marker=None, columns=None).AndReturn(all_instances)
 
         self.mox.ReplayAll()
 
@@ -517,8 +592,17 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                                            vm_states.ACTIVE)
         instance.refresh(use_slave=False)
         self.mox.ReplayAll()
-        self.compute._sync_instance_power_state(self.context, instance,
-                                                power_state.RUNNING)
+        self.assertTrue(self.compute._sync_instance_power_state(
+            self.context, instance, power_state.RUNNING))
+
+    def test_sync_instance_power_state_pending_task(self):
+        instance = self._get_sync_instance(power_state.RUNNING,
+                                           vm_states.ACTIVE,
+                                           task_states.REBOOTING)
+        instance.refresh(use_slave=False)
+        self.mox.ReplayAll()
+        self.assertFalse(self.compute._sync_instance_power_state(
+            self.context, instance, power_state.SHUTDOWN))
 
     def test_sync_instance_power_state_running_stopped(self):
         instance = self._get_sync_instance(power_state.RUNNING,
@@ -531,7 +615,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.assertEqual(instance.power_state, power_state.SHUTDOWN)
 
     def _test_sync_to_stop(self, power_state, vm_state, driver_power_state,
-                           stop=True, force=False):
+                           stop=True, force=False, stop_fails=False):
         instance = self._get_sync_instance(power_state, vm_state)
         instance.refresh(use_slave=False)
         instance.save()
@@ -539,12 +623,18 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.mox.StubOutWithMock(self.compute.compute_api, 'force_stop')
         if stop:
             if force:
-                self.compute.compute_api.force_stop(self.context, instance)
+                stopped = self.compute.compute_api.force_stop(self.context,
+                                                              instance)
             else:
-                self.compute.compute_api.stop(self.context, instance)
+                stopped = self.compute.compute_api.stop(self.context,
+                                                        instance)
+            if stop_fails:
+                stopped.AndRaise(test.TestingException())
         self.mox.ReplayAll()
-        self.compute._sync_instance_power_state(self.context, instance,
-                                                driver_power_state)
+        synced = self.compute._sync_instance_power_state(self.context,
+                                                         instance,
+                                                         driver_power_state)
+        self.assertEqual(not stop_fails, synced)
         self.mox.VerifyAll()
         self.mox.UnsetStubs()
 
@@ -555,6 +645,13 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self._test_sync_to_stop(power_state.SHUTDOWN, vm_states.STOPPED,
                                 power_state.RUNNING, force=True)
 
+    def test_sync_instance_power_state_stop_fails(self):
+        self._test_sync_to_stop(power_state.RUNNING, vm_states.ACTIVE,
+                                power_state.SHUTDOWN, stop_fails=True)
+        self._test_sync_to_stop(power_state.SHUTDOWN, vm_states.STOPPED,
+                                power_state.RUNNING, force=True,
+                                stop_fails=True)
+
     def test_sync_instance_power_state_to_no_stop(self):
         for ps in (power_state.PAUSED, power_state.NOSTATE):
             self._test_sync_to_stop(power_state.RUNNING, vm_states.ACTIVE, ps,
@@ -832,6 +929,12 @@ class ComputeManagerBuildInstanceTestCase(test.NoDBTestCase):
                     self.compute.driver, self.node)
         self.compute._resource_tracker_dict[self.node] = fake_rt
 
+        # the stages of a build report instance action events
+        self.stubs.Set(self.compute.conductor_api, 'action_event_start',
+                       lambda *args: None)
+        self.stubs.Set(self.compute.conductor_api, 'action_event_finish',
+                       lambda *args: None)
+
     def _do_build_instance_update(self, reschedule_update=False):
         self.mox.StubOutWithMock(self.compute, '_instance_update')
         self.compute._instance_update(self.context, self.instance['uuid'],
@@ -1358,6 +1461,118 @@ class ComputeManagerBuildInstanceTestCase(test.NoDBTestCase):
         except Exception as e:
             self.assertTrue(isinstance(e, exception.BuildAbortException))
 
+    def test_build_resources_prefetches_image(self):
+        self.instance['image_ref'] = 'fake-image'
+        self.mox.StubOutWithMock(self.compute.driver, 'prefetch_image')
+        self.mox.StubOutWithMock(self.compute, '_build_networks_for_instance')
+        self.compute._build_networks_for_instance(self.context, self.instance,
+                self.requested_networks, self.security_groups).AndReturn(
+                        self.network_info)
+        self._build_resources_instance_update()
+        self.compute.driver.prefetch_image(self.context, self.instance,
+                self.image).AndRaise(test.TestingException())
+        self.mox.ReplayAll()
+
+        # A failed prefetch is left to spawn
+        with self.compute._build_resources(self.context, self.instance,
+                self.requested_networks, self.security_groups,
+                self.image, self.block_device_mapping) as resources:
+            self.assertEqual(self.network_info, resources['network_info'])
+            self.assertEqual(self.block_device_info,
+                             resources['block_device_info'])
+
+    def test_build_resources_skips_image_prefetch_on_volume_root(self):
+        self.instance['image_ref'] = 'fake-image'
+        self.block_device_mapping = [{'boot_index': 0,
+                                      'source_type': 'image',
+                                      'destination_type': 'volume'}]
+        self.mox.StubOutWithMock(self.compute, '_default_block_device_names')
+        self.mox.StubOutWithMock(self.compute, '_prep_block_device')
+        self.mox.StubOutWithMock(self.compute, '_build_networks_for_instance')
+        self.compute._default_block_device_names(self.context, self.instance,
+                self.image, self.block_device_mapping)
+        self.compute._build_networks_for_instance(self.context, self.instance,
+                self.requested_networks, self.security_groups).AndReturn(
+                        self.network_info)
+        self._build_resources_instance_update()
+        self.compute._prep_block_device(self.context, self.instance,
+                self.block_device_mapping).AndReturn(self.block_device_info)
+        self.mox.ReplayAll()
+
+        with mock.patch.object(self.compute.driver,
+                               'prefetch_image') as prefetch_image:
+            with self.compute._build_resources(self.context, self.instance,
+                    self.requested_networks, self.security_groups,
+                    self.image, self.block_device_mapping):
+                pass
+            self.assertFalse(prefetch_image.called)
+
+    def test_build_resources_does_not_wait_for_async_network_alloc(self):
+        allocated = event.Event()
+
+        def fake_network_info():
+            allocated.wait()
+            return network_model.NetworkInfo()
+
+        network_info = network_model.NetworkInfoAsyncWrapper(
+                fake_network_info)
+        self.mox.StubOutWithMock(self.compute, '_build_networks_for_instance')
+        self.compute._build_networks_for_instance(self.context, self.instance,
+                self.requested_networks, self.security_groups).AndReturn(
+                        network_info)
+        self._build_resources_instance_update()
+        self.mox.ReplayAll()
+
+        with self.compute._build_resources(self.context, self.instance,
+                self.requested_networks, self.security_groups,
+                self.image, self.block_device_mapping) as resources:
+            # spawn() overlaps the allocation
+            self.assertIs(network_info, resources['network_info'])
+            allocated.send()
+
+    def test_build_resources_cleans_up_on_failed_async_network_alloc(self):
+        def fake_network_info():
+            raise test.TestingException()
+
+        network_info = network_model.NetworkInfoAsyncWrapper(
+                fake_network_info)
+        self.mox.StubOutWithMock(self.compute, '_cleanup_build_resources')
+        self.mox.StubOutWithMock(self.compute, '_build_networks_for_instance')
+        self.compute._build_networks_for_instance(self.context, self.instance,
+                self.requested_networks, self.security_groups).AndReturn(
+                        network_info)
+        self._build_resources_instance_update()
+        self.compute._cleanup_build_resources(self.context, self.instance,
+                self.block_device_mapping)
+        self.mox.ReplayAll()
+
+        def build():
+            with self.compute._build_resources(self.context, self.instance,
+                    self.requested_networks, self.security_groups,
+                    self.image, self.block_device_mapping) as resources:
+                # Like the driver accessing network_info in spawn()
+                len(resources['network_info'])
+
+        self.assertRaises(test.TestingException, build)
+
+    def test_build_queue_reported_in_stats(self):
+        self.flags(max_concurrent_spawns=1)
+        compute = importutils.import_object(CONF.compute_manager)
+        rt = fake_resource_tracker.FakeResourceTracker(compute.host,
+                compute.driver, self.node)
+        compute._resource_tracker_dict[self.node] = rt
+
+        def spawn():
+            with compute._build_admission.admit('spawn', self.instance):
+                pass
+
+        with compute._build_admission.admit('spawn', self.instance):
+            queued = greenthread.spawn(spawn)
+            greenthread.sleep(0)
+            self.assertEqual(1, rt.stats['num_builds_queued'])
+        queued.wait()
+        self.assertEqual(0, rt.stats['num_builds_queued'])
+
     def test_cleanup_cleans_volumes(self):
         self.mox.StubOutWithMock(self.compute, '_cleanup_volumes')
         self.compute._cleanup_volumes(self.context, self.instance['uuid'],
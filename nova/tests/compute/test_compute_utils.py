@@ -21,6 +21,8 @@
 import copy
 import string
 
+from eventlet import greenthread
+import mock
 from oslo.config import cfg
 
 from nova.compute import flavors
@@ -708,3 +710,236 @@ class ComputeUtilsGetNWInfo(test.TestCase):
         self.assertIsNone(inst['info_cache'])
         result = compute_utils.get_nw_info_for_instance(inst)
         self.assertEqual(jsonutils.dumps([]), result.json())
+
+
+class AuditRecordBufferTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(AuditRecordBufferTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.conductor = mock.Mock()
+        self.timers = []
+
+        def fake_spawn_after(delay, func):
+            self.timers.append((delay, func))
+            return mock.Mock()
+
+        self.stubs.Set(compute_utils.greenthread, 'spawn_after',
+                       fake_spawn_after)
+
+    def test_write_through(self):
+        records = compute_utils.AuditRecordBuffer(self.conductor, 10, 0)
+        records.instance_fault_create(self.context, 'fault')
+        records.action_event_start(self.context, 'start')
+        records.action_event_finish(self.context, 'finish')
+        self.conductor.instance_fault_create.assert_called_once_with(
+            self.context, 'fault')
+        self.conductor.action_event_start.assert_called_once_with(
+            self.context, 'start')
+        self.conductor.action_event_finish.assert_called_once_with(
+            self.context, 'finish')
+        self.assertEqual([], self.timers)
+
+    def test_flush_after_delay(self):
+        records = compute_utils.AuditRecordBuffer(self.conductor, 10, 2)
+        start = greenthread.spawn(records.action_event_start, self.context,
+                                  'start')
+        finish = greenthread.spawn(records.action_event_finish, self.context,
+                                   'finish')
+        greenthread.sleep(0)
+        # Both callers wait for their records to be written
+        self.assertFalse(self.conductor.action_event_record_many.called)
+        self.assertFalse(start.dead or finish.dead)
+        self.assertEqual(1, len(self.timers))
+        delay, flush = self.timers[0]
+        self.assertEqual(2, delay)
+        flush()
+        start.wait()
+        finish.wait()
+        self.conductor.action_event_record_many.assert_called_once_with(
+            self.context, [('start', 'start'), ('finish', 'finish')])
+        self.assertFalse(self.conductor.instance_fault_create_many.called)
+
+    def test_flush_when_full(self):
+        records = compute_utils.AuditRecordBuffer(self.conductor, 2, 2)
+        fault = greenthread.spawn(records.instance_fault_create,
+                                  self.context, 'fault')
+        greenthread.sleep(0)
+        records.action_event_start(self.context, 'start')
+        fault.wait()
+        self.conductor.instance_fault_create_many.assert_called_once_with(
+            self.context, ['fault'])
+        self.conductor.action_event_record_many.assert_called_once_with(
+            self.context, [('start', 'start')])
+        self.assertEqual([], records.records)
+
+    def test_flush_per_user_and_project(self):
+        records = compute_utils.AuditRecordBuffer(self.conductor, 10, 2)
+        other = context.RequestContext('other-user', 'other-project')
+        for ctxt, values in [(self.context, 'start1'), (other, 'start2'),
+                             (self.context, 'start3')]:
+            greenthread.spawn(records.action_event_start, ctxt, values)
+        greenthread.sleep(0)
+        records.flush()
+        self.assertEqual(
+            [mock.call(self.context, [('start', 'start1'),
+                                      ('start', 'start3')]),
+             mock.call(other, [('start', 'start2')])],
+            self.conductor.action_event_record_many.call_args_list)
+
+    def test_failed_flush_raised_to_affected_callers(self):
+        records = compute_utils.AuditRecordBuffer(self.conductor, 10, 2)
+        self.conductor.action_event_record_many.side_effect = (
+            test.TestingException())
+        self.conductor.action_event_start.side_effect = [
+            None, test.TestingException()]
+        fault = greenthread.spawn(records.instance_fault_create,
+                                  self.context, 'fault')
+        start1 = greenthread.spawn(records.action_event_start, self.context,
+                                   'start1')
+        start2 = greenthread.spawn(records.action_event_start, self.context,
+                                   'start2')
+        greenthread.sleep(0)
+        records.flush()
+        fault.wait()
+        start1.wait()
+        self.assertRaises(test.TestingException, start2.wait)
+        self.assertEqual([mock.call(self.context, 'start1'),
+                          mock.call(self.context, 'start2')],
+                         self.conductor.action_event_start.call_args_list)
+        self.assertEqual([], records.records)
+        # Later records are not affected
+        self.conductor.action_event_record_many.side_effect = None
+        start = greenthread.spawn(records.action_event_start, self.context,
+                                  'start')
+        greenthread.sleep(0)
+        records.flush()
+        start.wait()
+
+
+class StageGraphTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(StageGraphTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.conductor = mock.Mock()
+        self.stages = compute_utils.StageGraph(self.context, self.conductor,
+                                               'fake-uuid')
+
+    def _events(self, method):
+        return [call[0][1]['event'] for call in method.call_args_list]
+
+    def test_run(self):
+        ran = []
+        self.stages.add('first', lambda: ran.append('first'))
+        self.stages.add('second', lambda: ran.append('second'),
+                        requires=['first'])
+        self.stages.add('third', lambda: ran.append('third'))
+        self.stages.run()
+        self.assertEqual(['first', 'second', 'third'], ran)
+        self.assertEqual(['compute_first', 'compute_second', 'compute_third'],
+                         self._events(self.conductor.action_event_start))
+        self.assertEqual(['compute_first', 'compute_second', 'compute_third'],
+                         self._events(self.conductor.action_event_finish))
+
+    def test_run_concurrently(self):
+        ran = []
+
+        def slow():
+            greenthread.sleep(0)
+            ran.append('slow')
+
+        self.stages.add('slow', slow)
+        self.stages.add('fast', lambda: ran.append('fast'))
+        self.stages.run()
+        self.assertEqual(['fast', 'slow'], ran)
+
+    def test_run_failure(self):
+        ran = []
+        threads = []
+        spawn = greenthread.spawn
+
+        def fake_spawn(*args, **kwargs):
+            threads.append(spawn(*args, **kwargs))
+            return threads[-1]
+
+        def fail():
+            raise test.TestingException()
+
+        self.stubs.Set(compute_utils.greenthread, 'spawn', fake_spawn)
+        self.stages.add('fail', fail)
+        self.stages.add('skipped', lambda: ran.append('skipped'),
+                        requires=['fail'])
+        self.stages.add('also_skipped', lambda: ran.append('also_skipped'),
+                        requires=['skipped'])
+        self.stages.add('other', lambda: ran.append('other'))
+        self.assertRaises(test.TestingException, self.stages.run)
+        self.assertEqual(['other'], ran)
+        # The failure is not raised out of the greenthreads
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(['compute_fail', 'compute_other'],
+                         self._events(self.conductor.action_event_finish))
+        result = self.conductor.action_event_finish.call_args_list[0][0][1]
+        self.assertEqual('Error', result['result'])
+
+    def test_run_unreported(self):
+        ran = []
+        self.stages.add('unreported', lambda: ran.append('unreported'),
+                        report=False)
+        self.stages.add('reported', lambda: ran.append('reported'),
+                        requires=['unreported'])
+        self.stages.run()
+        self.assertEqual(['unreported', 'reported'], ran)
+        self.assertEqual(['compute_reported'],
+                         self._events(self.conductor.action_event_start))
+
+    def test_add_unknown_requirement(self):
+        self.assertRaises(ValueError, self.stages.add, 'stage', lambda: None,
+                          requires=['unknown'])
+
+
+class BuildAdmissionTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(BuildAdmissionTestCase, self).setUp()
+        self.queue_changes = []
+        self.admission = compute_utils.BuildAdmission(
+            {'limited': 1, 'unlimited': 0}, self._queue_changed)
+        self.instance = {'uuid': 'fake-uuid'}
+
+    def _queue_changed(self):
+        self.queue_changes.append(self.admission.num_queued)
+
+    def test_unlimited(self):
+        with self.admission.admit('unlimited', self.instance):
+            with self.admission.admit('unlimited', self.instance):
+                pass
+        with self.admission.admit('unknown', self.instance):
+            pass
+        self.assertEqual([], self.queue_changes)
+
+    def test_queued(self):
+        ran = []
+
+        def build():
+            with self.admission.admit('limited', self.instance):
+                ran.append('second')
+
+        with self.admission.admit('limited', self.instance):
+            ran.append('first')
+            second = greenthread.spawn(build)
+            greenthread.sleep(0)
+            self.assertEqual(['first'], ran)
+            self.assertEqual({'limited': 1}, self.admission.queued)
+        second.wait()
+        self.assertEqual(['first', 'second'], ran)
+        self.assertEqual([1, 0], self.queue_changes)
+        self.assertEqual(0, self.admission.num_queued)
+
+    def test_released_on_failure(self):
+        def fail():
+            with self.admission.admit('limited', self.instance):
+                raise test.TestingException()
+
+        self.assertRaises(test.TestingException, fail)
+        with self.admission.admit('limited', self.instance):
+            pass
+        self.assertEqual([], self.queue_changes)
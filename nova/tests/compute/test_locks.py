@@ -0,0 +1,146 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the locks of the compute host."""
+
+from eventlet import event
+from eventlet import greenthread
+
+from nova.compute import locks
+from nova import test
+
+
+class LockManagerTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(LockManagerTestCase, self).setUp()
+        self.locks = locks.LockManager()
+        self.ran = []
+
+    def _hold(self, name, key=None, shared=False, release=None):
+        with self.locks.lock(name, key, shared):
+            self.ran.append((name, key, shared))
+            if release is not None:
+                release.wait()
+
+    def test_exclusive(self):
+        release = event.Event()
+        first = greenthread.spawn(self._hold, 'instance', 'uuid',
+                                  release=release)
+        second = greenthread.spawn(self._hold, 'instance', 'uuid')
+        other = greenthread.spawn(self._hold, 'instance', 'other-uuid')
+        greenthread.sleep(0)
+        self.assertEqual([('instance', 'uuid', False),
+                          ('instance', 'other-uuid', False)], self.ran)
+
+        release.send()
+        first.wait()
+        second.wait()
+        other.wait()
+        self.assertEqual(('instance', 'uuid', False), self.ran[-1])
+
+    def test_shared(self):
+        release = event.Event()
+        first = greenthread.spawn(self._hold, 'instance', 'uuid', True,
+                                  release)
+        second = greenthread.spawn(self._hold, 'instance', 'uuid', True,
+                                   release)
+        exclusive = greenthread.spawn(self._hold, 'instance', 'uuid')
+        # Queued behind the exclusive waiter
+        third = greenthread.spawn(self._hold, 'instance', 'uuid', True)
+        greenthread.sleep(0)
+        self.assertEqual([('instance', 'uuid', True)] * 2, self.ran)
+
+        release.send()
+        for thread in (first, second, exclusive, third):
+            thread.wait()
+        self.assertEqual([('instance', 'uuid', True)] * 2 +
+                         [('instance', 'uuid', False),
+                          ('instance', 'uuid', True)], self.ran)
+
+    def test_idle_locks_are_dropped(self):
+        with self.locks.lock('instance', 'uuid'):
+            self.assertEqual(1, len(self.locks.report()['locks']))
+        self.assertEqual([], self.locks.report()['locks'])
+
+    def test_failure_releases(self):
+        def fail():
+            with self.locks.lock('instance', 'uuid'):
+                raise test.TestingException()
+
+        self.assertRaises(test.TestingException, fail)
+        self._hold('instance', 'uuid')
+        self.assertEqual([], self.locks.report()['locks'])
+
+    def test_killed_waiter(self):
+        release = event.Event()
+        holder = greenthread.spawn(self._hold, 'instance', 'uuid',
+                                   release=release)
+        waiter = greenthread.spawn(self._hold, 'instance', 'uuid')
+        greenthread.sleep(0)
+        waiter.kill()
+        release.send()
+        holder.wait()
+        self.assertEqual(1, len(self.ran))
+        self.assertEqual([], self.locks.report()['locks'])
+
+    def test_report(self):
+        release = event.Event()
+        holder = greenthread.spawn(self._hold, 'instance', 'uuid',
+                                   release=release)
+        waiter = greenthread.spawn(self._hold, 'instance', 'uuid', True)
+        greenthread.sleep(0)
+
+        report = self.locks.report()
+        self.assertEqual(1, len(report['locks']))
+        lock = report['locks'][0]
+        self.assertEqual('instance', lock['name'])
+        self.assertEqual('uuid', lock['key'])
+        self.assertEqual([False], [h['shared'] for h in lock['holders']])
+        self.assertEqual([True], [w['shared'] for w in lock['waiters']])
+        self.assertIn('stack', lock['holders'][0])
+
+        release.send()
+        holder.wait()
+        waiter.wait()
+        report = self.locks.report()
+        self.assertEqual(2, report['wait_times']['instance']['count'])
+        self.assertEqual(2, report['hold_times']['instance']['count'])
+        self.assertEqual(8, len(report['hold_times']['instance']['buckets']))
+
+    def test_synchronized(self):
+        @locks.synchronized('instance', 'uuid')
+        def do_locked(value):
+            report = locks.report(with_stacks=False)
+            self.assertIn(('instance', 'uuid'),
+                          [(lock['name'], lock['key'])
+                           for lock in report['locks']])
+            return value
+
+        self.assertEqual('value', do_locked('value'))
+
+
+class HistogramTestCase(test.NoDBTestCase):
+    def test_add(self):
+        histogram = locks.Histogram()
+        histogram.add(0.0005)
+        histogram.add(0.5)
+        histogram.add(1000)
+        result = histogram.to_dict()
+        self.assertEqual(3, result['count'])
+        self.assertEqual(1000, result['max'])
+        self.assertEqual(1, result['buckets']['<=0.001'])
+        self.assertEqual(1, result['buckets']['<=1'])
+        self.assertEqual(1, result['buckets']['>600'])
+        self.assertEqual(0, result['buckets']['<=10'])
@@ -17,6 +17,7 @@
 
 """Tests for compute resource tracking."""
 
+import contextlib
 import mock
 import re
 import uuid
@@ -30,6 +31,7 @@ from nova.compute import vm_states
 from nova import context
 from nova import db
 from nova.objects import base as obj_base
+from nova.objects import instance as instance_obj
 from nova.objects import migration as migration_obj
 from nova.openstack.common import jsonutils
 from nova.openstack.common.notifier import api as notifier_api
@@ -1039,6 +1041,67 @@ class OrphanTestCase(BaseTrackerTestCase):
         self.assertEqual(2, len(orphans))
 
 
+class IncrementalAuditTestCase(BaseTrackerTestCase):
+    def setUp(self):
+        super(IncrementalAuditTestCase, self).setUp()
+        self.flags(full_resource_audit_interval=3)
+        instance = self._fake_instance(memory_mb=1, root_gb=1,
+                                       ephemeral_gb=1, vcpus=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+
+    def _assert_usage(self, memory_mb=1 + FAKE_VIRT_MEMORY_OVERHEAD):
+        self._assert(memory_mb, 'memory_mb_used')
+        self._assert(FAKE_VIRT_MEMORY_MB - memory_mb, 'free_ram_mb')
+        self._assert(2, 'local_gb_used')
+        self._assert(1, 'vcpus_used')
+        self._assert(1, 'running_vms')
+
+    def test_incremental_audits(self):
+        with mock.patch.object(
+                instance_obj.InstanceList, 'get_by_host_and_node',
+                wraps=instance_obj.InstanceList.get_by_host_and_node) as get:
+            for i in range(2):
+                self.tracker.update_available_resource(self.context)
+                self._assert_usage()
+            self.assertFalse(get.called)
+
+            self.tracker.update_available_resource(self.context)
+            self._assert_usage()
+            self.assertTrue(get.called)
+
+    def test_untracked_instances_force_full_audit(self):
+        orphans = {'1-2-3-4-5': {'memory_mb': 1, 'uuid': '1-2-3-4-5'}}
+        with contextlib.nested(
+                mock.patch.object(
+                    instance_obj.InstanceList, 'get_by_host_and_node',
+                    wraps=instance_obj.InstanceList.get_by_host_and_node),
+                mock.patch.object(self.tracker.driver,
+                                  'get_per_instance_usage',
+                                  return_value=orphans)
+        ) as (get, get_per_instance_usage):
+            self.tracker.update_available_resource(self.context)
+            self.assertTrue(get.called)
+        self._assert_usage(memory_mb=2 + 2 * FAKE_VIRT_MEMORY_OVERHEAD)
+
+    def test_listed_untracked_instances_force_full_audit(self):
+        tracked = self.tracker.tracked_instances.keys()
+        with contextlib.nested(
+                mock.patch.object(
+                    instance_obj.InstanceList, 'get_by_host_and_node',
+                    wraps=instance_obj.InstanceList.get_by_host_and_node),
+                mock.patch.object(self.tracker.driver, 'list_instance_uuids',
+                                  return_value=tracked),
+                mock.patch.object(self.tracker.driver, 'get_available_nodes',
+                                  return_value=['fakenode'])
+        ) as (get, list_instance_uuids, get_available_nodes):
+            self.tracker.update_available_resource(self.context)
+            self.assertFalse(get.called)
+
+            list_instance_uuids.return_value = tracked + ['1-2-3-4-5']
+            self.tracker.update_available_resource(self.context)
+            self.assertTrue(get.called)
+
+
 class ComputeMonitorTestCase(BaseTestCase):
     def setUp(self):
         super(ComputeMonitorTestCase, self).setUp()
@@ -54,6 +54,7 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
         self.mox.StubOutWithMock(self.compute.driver, 'power_off')
         self.mox.StubOutWithMock(self.compute, '_get_power_state')
         self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(db, 'instance_update_columns')
 
         self.compute._notify_about_instance_usage(self.context, instance,
                 'shelve.start')
@@ -84,16 +85,13 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
             self.compute.driver.power_off(instance)
             self.compute._get_power_state(self.context,
                                           instance).AndReturn(123)
-            db.instance_update_and_get_original(self.context,
-                              instance['uuid'],
+            db.instance_update_columns(self.context, instance['uuid'],
                               {'power_state': 123, 'host': None, 'node': None,
                                'vm_state': vm_states.SHELVED_OFFLOADED,
                                'task_state': None,
                                'expected_task_state': [task_states.SHELVING,
-                                           task_states.SHELVING_OFFLOADING]},
-                              update_cells=False,
-                              columns_to_join=['metadata', 'system_metadata'],
-                              ).AndReturn((db_instance, db_instance))
+                                           task_states.SHELVING_OFFLOADING]}
+                              ).AndReturn({'updated_at': cur_time})
             self.compute._notify_about_instance_usage(self.context, instance,
                                                       'shelve_offload.end')
         self.mox.ReplayAll()
@@ -128,22 +126,20 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
         self.mox.StubOutWithMock(self.compute, '_notify_about_instance_usage')
         self.mox.StubOutWithMock(self.compute.driver, 'power_off')
         self.mox.StubOutWithMock(self.compute, '_get_power_state')
-        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(db, 'instance_update_columns')
 
         self.compute._notify_about_instance_usage(self.context, instance,
                 'shelve_offload.start')
         self.compute.driver.power_off(instance)
         self.compute._get_power_state(self.context,
                 instance).AndReturn(123)
-        db.instance_update_and_get_original(self.context, instance['uuid'],
+        db.instance_update_columns(self.context, instance['uuid'],
                 {'power_state': 123, 'host': None, 'node': None,
                  'vm_state': vm_states.SHELVED_OFFLOADED,
                  'task_state': None,
                  'expected_task_state': [task_states.SHELVING,
-                    task_states.SHELVING_OFFLOADING]},
-                 update_cells=False,
-                 columns_to_join=['metadata', 'system_metadata'],
-                 ).AndReturn((db_instance, db_instance))
+                    task_states.SHELVING_OFFLOADING]}
+                ).AndReturn({'updated_at': cur_time})
         self.compute._notify_about_instance_usage(self.context, instance,
                 'shelve_offload.end')
         self.mox.ReplayAll()
@@ -176,7 +172,7 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
         self.mox.StubOutWithMock(self.compute.driver, 'spawn')
         self.mox.StubOutWithMock(self.compute, '_get_power_state')
         self.mox.StubOutWithMock(self.compute, '_get_compute_info')
-        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(db, 'instance_update_columns')
 
         self.deleted_image_id = None
 
@@ -191,12 +187,10 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
         self.compute._get_compute_info(mox.IgnoreArg(),
                                        mox.IgnoreArg()).AndReturn(
                                                         fake_compute_info)
-        db.instance_update_and_get_original(self.context, instance['uuid'],
+        db.instance_update_columns(self.context, instance['uuid'],
                 {'task_state': task_states.SPAWNING, 'host': host,
-                 'node': hypervisor_hostname},
-                update_cells=False,
-                columns_to_join=['metadata', 'system_metadata'],
-                ).AndReturn((db_instance, db_instance))
+                 'node': hypervisor_hostname}
+                ).AndReturn({'updated_at': cur_time})
         self.compute._prep_block_device(self.context, instance,
                 []).AndReturn('fake_bdm')
         db_instance['key_data'] = None
@@ -206,17 +200,15 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
                 network_info=[],
                 block_device_info='fake_bdm')
         self.compute._get_power_state(self.context, instance).AndReturn(123)
-        db.instance_update_and_get_original(self.context, instance['uuid'],
+        db.instance_update_columns(self.context, instance['uuid'],
                 {'power_state': 123,
                  'vm_state': vm_states.ACTIVE,
                  'task_state': None,
                  'key_data': None,
                  'auto_disk_config': False,
                  'expected_task_state': task_states.SPAWNING,
-                 'launched_at': cur_time_tz},
-                 update_cells=False,
-                 columns_to_join=['metadata', 'system_metadata']
-                 ).AndReturn((db_instance, db_instance))
+                 'launched_at': cur_time_tz}
+                ).AndReturn({'updated_at': cur_time})
         self.compute._notify_about_instance_usage(self.context, instance,
                 'unshelve.end')
         self.mox.ReplayAll()
@@ -251,19 +243,17 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
         self.mox.StubOutWithMock(self.compute.driver, 'spawn')
         self.mox.StubOutWithMock(self.compute, '_get_power_state')
         self.mox.StubOutWithMock(self.compute, '_get_compute_info')
-        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(db, 'instance_update_columns')
 
         self.compute._notify_about_instance_usage(self.context, instance,
                 'unshelve.start')
         self.compute._get_compute_info(mox.IgnoreArg(),
                                        mox.IgnoreArg()).AndReturn(
                                                         fake_compute_info)
-        db.instance_update_and_get_original(self.context, instance['uuid'],
+        db.instance_update_columns(self.context, instance['uuid'],
                 {'task_state': task_states.SPAWNING, 'host': host,
-                 'node': hypervisor_hostname},
-                update_cells=False,
-                columns_to_join=['metadata', 'system_metadata']
-                ).AndReturn((db_instance, db_instance))
+                 'node': hypervisor_hostname}
+                ).AndReturn({'updated_at': cur_time})
         self.compute._prep_block_device(self.context, instance,
                 []).AndReturn('fake_bdm')
         db_instance['key_data'] = None
@@ -273,17 +263,15 @@ class ShelveComputeManagerTestCase(test_compute.BaseTestCase):
                 network_info=[],
                 block_device_info='fake_bdm')
         self.compute._get_power_state(self.context, instance).AndReturn(123)
-        db.instance_update_and_get_original(self.context, instance['uuid'],
+        db.instance_update_columns(self.context, instance['uuid'],
                 {'power_state': 123,
                  'vm_state': vm_states.ACTIVE,
                  'task_state': None,
                  'key_data': None,
                  'auto_disk_config': False,
                  'expected_task_state': task_states.SPAWNING,
-                 'launched_at': cur_time_tz},
-                 update_cells=False,
-                 columns_to_join=['metadata', 'system_metadata']
-                 ).AndReturn((db_instance, db_instance))
+                 'launched_at': cur_time_tz}
+                ).AndReturn({'updated_at': cur_time})
         self.compute._notify_about_instance_usage(self.context, instance,
                 'unshelve.end')
         self.mox.ReplayAll()
@@ -20,6 +20,7 @@
 from nova.compute import stats
 from nova.compute import task_states
 from nova.compute import vm_states
+from nova.openstack.common import jsonutils
 from nova import test
 
 
@@ -199,3 +200,48 @@ class StatsTestCase(test.NoDBTestCase):
 
         self.assertEqual(0, len(self.stats))
         self.assertEqual(0, len(self.stats.states))
+
+    def test_update_stats_for_build_queue(self):
+        self.stats.update_stats_for_build_queue(3)
+        self.assertEqual(3, self.stats["num_builds_queued"])
+
+        # Not derived from the instances
+        self.stats.clear()
+        self.assertEqual({"num_builds_queued": 3}, self.stats)
+
+        self.stats.update_stats_for_build_queue(0)
+        self.assertEqual(0, self.stats["num_builds_queued"])
+        self.stats.clear()
+        self.assertEqual({}, self.stats)
+
+
+class CompactStatsTestCase(test.NoDBTestCase):
+    def test_round_trip(self):
+        blob = stats.to_compact({'num_instances': 3, 'io_workload': 0})
+        self.assertEqual({'num_instances': '3', 'io_workload': '0'},
+                         stats.from_compact(blob))
+
+    def test_from_compact_none(self):
+        self.assertIsNone(stats.from_compact(None))
+
+    def test_from_compact_unknown_version(self):
+        blob = jsonutils.dumps({'version': stats.COMPACT_VERSION + 1,
+                                'stats': {'num_instances': '3'}})
+        self.assertIsNone(stats.from_compact(blob))
+
+    def test_from_compact_malformed(self):
+        self.assertIsNone(stats.from_compact('{"stats": {}}'))
+        self.assertIsNone(stats.from_compact('not json'))
+
+    def test_stats_to_dict_compact(self):
+        compute = {'compact_stats': stats.to_compact({'num_instances': 3}),
+                   'stats': []}
+        self.assertEqual({'num_instances': '3'},
+                         stats.stats_to_dict(compute))
+
+    def test_stats_to_dict_rows(self):
+        compute = {'compact_stats': None,
+                   'stats': [{'key': 'num_instances', 'value': '3'}]}
+        self.assertEqual({'num_instances': '3'},
+                         stats.stats_to_dict(compute))
+        self.assertEqual({}, stats.stats_to_dict({}))
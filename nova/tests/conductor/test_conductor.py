@@ -223,6 +223,39 @@ class _BaseTestCase(object):
         result = self.conductor.bw_usage_update(*update_args)
         self.assertEqual(result, 'foo')
 
+    def test_instance_fault_create_many(self):
+        self.mox.StubOutWithMock(db, 'instance_fault_create_many')
+        db.instance_fault_create_many(self.context, [{'code': 500}])
+        self.mox.ReplayAll()
+        self.conductor.instance_fault_create_many(self.context,
+                                                  [{'code': 500}])
+
+    def test_action_event_record_many(self):
+        self.mox.StubOutWithMock(db, 'action_event_record_many')
+        events = [['start', {'event': 'foo'}], ['finish', {'event': 'foo'}]]
+        db.action_event_record_many(self.context, events)
+        self.mox.ReplayAll()
+        self.conductor.action_event_record_many(self.context, events)
+
+    def test_bw_usage_update_many(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_update_many')
+        usages = [{'uuid': 'uuid', 'mac': 'mac', 'start_period': 0,
+                   'bw_in': 10, 'bw_out': 20, 'last_ctr_in': 5,
+                   'last_ctr_out': 10}]
+        db.bw_usage_update_many(self.context, usages, last_refreshed=20,
+                                update_cells=False)
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_many(self.context, usages,
+                                            last_refreshed=20,
+                                            update_cells=False)
+
+    def test_bw_usage_get_by_uuids(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_get_by_uuids')
+        db.bw_usage_get_by_uuids(self.context, ['uuid'], 0).AndReturn(['foo'])
+        self.mox.ReplayAll()
+        self.assertEqual(['foo'], self.conductor.bw_usage_get_by_uuids(
+            self.context, ['uuid'], 0))
+
     def test_provider_fw_rule_get_all(self):
         fake_rules = ['a', 'b', 'c']
         self.mox.StubOutWithMock(db, 'provider_fw_rule_get_all')
@@ -847,6 +880,43 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         self.assertIn('dict', updates)
         self.assertEqual({'foo': 'bar'}, updates['dict'])
 
+    def test_object_delta_action(self):
+        class TestObject(obj_base.NovaObject):
+            fields = {'uuid': fields.StringField(),
+                      'foo': fields.IntegerField(),
+                      'bar': fields.StringField()}
+            obj_identity_fields = ['uuid']
+
+            def touch(self, context):
+                self.foo += 1
+
+        obj = TestObject(uuid='fake-uuid', foo=1, bar='bar')
+        obj.obj_reset_changes()
+        updates, result = self.conductor.object_delta_action(
+            self.context, obj, None, 'touch', tuple(), {})
+        self.assertEqual(2, updates['foo'])
+        self.assertIsNotNone(updates['obj_base'])
+
+        delta = TestObject(uuid='fake-uuid', foo=5)
+        updates, result = self.conductor.object_delta_action(
+            self.context, delta, updates['obj_base'], 'touch', tuple(), {})
+        self.assertEqual(6, updates['foo'])
+        self.assertNotIn('bar', updates)
+        self.assertEqual('bar', delta.bar)
+
+    def test_object_delta_action_unknown_base(self):
+        class TestObject(obj_base.NovaObject):
+            fields = {'uuid': fields.StringField()}
+            obj_identity_fields = ['uuid']
+
+            def touch(self, context):
+                pass
+
+        self.assertRaises(rpc_common.ClientException,
+                          self.conductor.object_delta_action,
+                          self.context, TestObject(uuid='fake-uuid'),
+                          'fake-base', 'touch', tuple(), {})
+
     def test_aggregate_metadata_add(self):
         aggregate = {'name': 'fake aggregate', 'id': 'fake-id'}
         metadata = {'foo': 'bar'}
@@ -899,6 +969,28 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor_manager = self.conductor_service.manager
         self.conductor = conductor_rpcapi.ConductorAPI()
 
+    def test_bw_usage_update_many_old_conductor(self):
+        self.flags(conductor='1.62', group='upgrade_levels')
+        self.conductor = conductor_rpcapi.ConductorAPI()
+        self.mox.StubOutWithMock(db, 'bw_usage_update')
+        self.mox.StubOutWithMock(db, 'bw_usage_get')
+        usages = [{'uuid': 'uuid%d' % i, 'mac': 'mac', 'start_period': 0,
+                   'bw_in': 10, 'bw_out': 20, 'last_ctr_in': 5,
+                   'last_ctr_out': 10} for i in range(2)]
+        for i in range(2):
+            db.bw_usage_update(self.context, 'uuid%d' % i, 'mac', 0, 10, 20,
+                               5, 10, 20, update_cells=True)
+            db.bw_usage_get(self.context, 'uuid%d' % i, 0, 'mac')
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_many(self.context, usages,
+                                            last_refreshed=20)
+
+    def test_bw_usage_get_by_uuids_old_conductor(self):
+        self.flags(conductor='1.65', group='upgrade_levels')
+        self.conductor = conductor_rpcapi.ConductorAPI()
+        self.assertIsNone(self.conductor.bw_usage_get_by_uuids(
+            self.context, ['uuid'], 0))
+
     def test_block_device_mapping_update_or_create(self):
         fake_bdm = {'id': 'fake-id'}
         self.mox.StubOutWithMock(db, 'block_device_mapping_create')
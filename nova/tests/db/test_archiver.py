@@ -0,0 +1,126 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the online archiver."""
+
+import json
+import os
+import time
+
+import fixtures
+
+from nova import context
+from nova import db
+from nova.db import archiver
+from nova.openstack.common.db import exception as db_exc
+from nova import test
+
+
+class OnlineArchiverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(OnlineArchiverTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.checkpoint = os.path.join(self.tmpdir, 'checkpoint.json')
+        self.sleeps = []
+        self.stubs.Set(time, 'sleep', self.sleeps.append)
+        self.flags(archive_lock_backoff=1.0, archive_max_lock_backoff=3.0)
+
+    def _archiver(self, **kwargs):
+        kwargs.setdefault('rows_per_second', 0)
+        return archiver.OnlineArchiver(self.context, chunk_size=2,
+                                       checkpoint_file=self.checkpoint,
+                                       **kwargs)
+
+    def _read_checkpoint(self):
+        with open(self.checkpoint) as f:
+            return json.load(f)
+
+    def test_archive_table_in_chunks(self):
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows_chunk')
+        db.archive_deleted_rows_chunk(self.context, 'fake', 2,
+                                      marker=None).AndReturn((2, 2))
+        db.archive_deleted_rows_chunk(self.context, 'fake', 2,
+                                      marker=2).AndReturn((1, 5))
+        db.archive_deleted_rows_chunk(self.context, 'fake', 2,
+                                      marker=5).AndReturn((0, None))
+        self.mox.ReplayAll()
+        arch = self._archiver()
+        self.assertEqual(3, arch.archive_table('fake'))
+        # A finished table is dropped from the checkpoint
+        self.assertEqual({}, self._read_checkpoint())
+
+    def test_archive_table_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'fake': 7}, f)
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows_chunk')
+        db.archive_deleted_rows_chunk(self.context, 'fake', 2,
+                                      marker=7).AndReturn((0, None))
+        self.mox.ReplayAll()
+        self.assertEqual(0, self._archiver().archive_table('fake'))
+
+    def test_archive_table_checkpoints_every_chunk(self):
+        def fake_chunk(context, tablename, max_rows, marker=None):
+            if marker is None:
+                return 2, 4
+            self.assertEqual({'fake': 4}, self._read_checkpoint())
+            raise test.TestingException()
+
+        self.stubs.Set(db, 'archive_deleted_rows_chunk', fake_chunk)
+        arch = self._archiver()
+        self.assertRaises(test.TestingException, arch.archive_table, 'fake')
+        # A new archiver picks up where the last one stopped
+        self.assertEqual({'fake': 4}, self._archiver().markers)
+
+    def test_unreadable_checkpoint_is_ignored(self):
+        with open(self.checkpoint, 'w') as f:
+            f.write('garbage')
+        self.assertEqual({}, self._archiver().markers)
+
+    def test_rate_limit(self):
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows_chunk')
+        db.archive_deleted_rows_chunk(self.context, 'fake', 2,
+                                      marker=None).AndReturn((2, 2))
+        db.archive_deleted_rows_chunk(self.context, 'fake', 2,
+                                      marker=2).AndReturn((0, None))
+        self.mox.ReplayAll()
+        self.stubs.Set(time, 'time', lambda: 100.0)
+        self._archiver(rows_per_second=4).archive_table('fake')
+        self.assertEqual([0.5], self.sleeps)
+
+    def test_lock_wait_backoff(self):
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows_chunk')
+        for i in range(3):
+            db.archive_deleted_rows_chunk(
+                self.context, 'fake', 2, marker=None).AndRaise(
+                    db_exc.DBDeadlock())
+        db.archive_deleted_rows_chunk(self.context, 'fake', 2,
+                                      marker=None).AndReturn((0, None))
+        self.mox.ReplayAll()
+        self._archiver().archive_table('fake')
+        self.assertEqual([1.0, 2.0, 3.0], self.sleeps)
+
+    def test_run_once(self):
+        self.mox.StubOutWithMock(db, 'archive_tablenames')
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows_chunk')
+        db.archive_tablenames(self.context).AndReturn(['child', 'parent'])
+        db.archive_deleted_rows_chunk(self.context, 'child', 2,
+                                      marker=None).AndReturn((1, 1))
+        db.archive_deleted_rows_chunk(self.context, 'child', 2,
+                                      marker=1).AndReturn((0, None))
+        db.archive_deleted_rows_chunk(self.context, 'parent', 2,
+                                      marker=None).AndReturn((0, None))
+        self.mox.ReplayAll()
+        self.assertEqual({'child': 1, 'parent': 0},
+                         self._archiver().run_once())
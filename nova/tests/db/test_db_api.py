@@ -19,9 +19,11 @@
 
 """Unit tests for the DB API."""
 
+import collections
 import copy
 import datetime
 import iso8601
+import threading
 import types
 import uuid as stdlib_uuid
 
@@ -38,6 +40,7 @@ from sqlalchemy.orm import query
 from sqlalchemy.sql.expression import select
 
 from nova import block_device
+from nova.compute import stats as compute_stats
 from nova.compute import vm_states
 from nova import context
 from nova import db
@@ -978,6 +981,15 @@ class ReservationTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                             self.ctxt, 'project1', 'user1'))
 
 
+    def test_reservation_expire_deletes_reservations(self):
+        reservations = _quota_reserve(self.ctxt, 'project1', 'user1')
+        db.reservation_expire(self.ctxt)
+
+        for reservation in reservations:
+            self.assertRaises(exception.ReservationNotFound,
+                _reservation_get, self.ctxt, reservation)
+
+
 class SecurityGroupRuleTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
         super(SecurityGroupRuleTestCase, self).setUp()
@@ -1487,11 +1499,70 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         filtered_instances = db.instance_get_all_by_filters(self.ctxt, {})
         self._assertEqualListsOfInstances(instances, filtered_instances)
 
+    def test_instance_get_all_by_filters_columns(self):
+        instance = self.create_instance_with_args(vm_state='active')
+        result = db.instance_get_all_by_filters(
+            self.ctxt, {'host': 'h1'}, columns_to_join=['system_metadata'],
+            columns=['vm_state', 'host'])
+        self.assertEqual(1, len(result))
+        self.assertEqual(set(['id', 'uuid', 'vm_state', 'host',
+                              'system_metadata', 'metadata']),
+                         set(result[0].keys()))
+        self.assertEqual(instance['uuid'], result[0]['uuid'])
+        self.assertEqual('active', result[0]['vm_state'])
+        sys_meta = utils.metadata_to_dict(result[0]['system_metadata'])
+        self.assertEqual(self.sample_data['system_metadata'], sys_meta)
+
+    def test_instance_get_all_by_filters_columns_paginated(self):
+        instances = [self.create_instance_with_args() for i in range(3)]
+        result = db.instance_get_all_by_filters(
+            self.ctxt, {}, sort_key='id', sort_dir='asc', limit=2,
+            marker=instances[0]['uuid'], columns=['host'])
+        self.assertEqual([inst['uuid'] for inst in instances[1:]],
+                         [inst['uuid'] for inst in result])
+
+    def test_instance_get_all_by_filters_invalid_column(self):
+        self.assertRaises(exception.InvalidParameterValue,
+                          db.instance_get_all_by_filters,
+                          self.ctxt, {}, columns=['info_cache'])
+
+    def test_instance_get_all_by_host_columns(self):
+        instance = self.create_instance_with_args(power_state=1)
+        self.create_instance_with_args(host='h2')
+        result = db.instance_get_all_by_host(self.ctxt, 'h1',
+                                             columns_to_join=[],
+                                             columns=['power_state'])
+        self.assertEqual(1, len(result))
+        self.assertEqual(instance['uuid'], result[0]['uuid'])
+        self.assertEqual(instance['id'], result[0]['id'])
+        self.assertEqual(1, result[0]['power_state'])
+        self.assertNotIn('host', result[0])
+
     def test_instance_metadata_get_multi(self):
         uuids = [self.create_instance_with_args()['uuid'] for i in range(3)]
         meta = sqlalchemy_api._instance_metadata_get_multi(self.ctxt, uuids)
-        for row in meta:
-            self.assertIn(row['instance_uuid'], uuids)
+        for uuid, key, value in meta:
+            self.assertIn(uuid, uuids)
+            self.assertEqual(self.sample_data['metadata'][key], value)
+
+    def test_instance_metadata_get_multi_skips_deleted(self):
+        uuid = self.create_instance_with_args()['uuid']
+        db.instance_metadata_delete(self.ctxt, uuid, 'mkey1')
+        meta = sqlalchemy_api._instance_metadata_get_multi(self.ctxt, [uuid])
+        self.assertEqual([(uuid, 'mkey2', 'mval2')],
+                         [tuple(row) for row in meta])
+
+    def test_instance_get_all_by_filters_decodes_metadata(self):
+        instance = self.create_instance_with_args()
+        self.ctxt.read_deleted = 'yes'
+        db.instance_metadata_delete(self.ctxt, instance['uuid'], 'mkey1')
+        result = db.instance_get_all_by_filters(self.ctxt, {})
+        self.assertEqual({'mkey2': 'mval2'}, result[0]['metadata'])
+        self.assertEqual(self.sample_data['system_metadata'],
+                         result[0]['system_metadata'])
+        self.assertIs(result[0]['metadata'], utils.instance_meta(result[0]))
+        self.assertIs(result[0]['system_metadata'],
+                      utils.instance_sys_meta(result[0]))
 
     def test_instance_metadata_get_multi_no_uuids(self):
         self.mox.StubOutWithMock(query.Query, 'filter')
@@ -1502,8 +1573,9 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         uuids = [self.create_instance_with_args()['uuid'] for i in range(3)]
         sys_meta = sqlalchemy_api._instance_system_metadata_get_multi(
                 self.ctxt, uuids)
-        for row in sys_meta:
-            self.assertIn(row['instance_uuid'], uuids)
+        for uuid, key, value in sys_meta:
+            self.assertIn(uuid, uuids)
+            self.assertEqual(self.sample_data['system_metadata'][key], value)
 
     def test_instance_system_metadata_get_multi_no_uuids(self):
         self.mox.StubOutWithMock(query.Query, 'filter')
@@ -1702,7 +1774,7 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         instance = self.create_instance_with_args()
         result = db.instance_get_all_by_host_and_node(self.ctxt, 'h1', 'n1')
         self.assertEqual(result[0]['uuid'], instance['uuid'])
-        self.assertEqual(result[0]['system_metadata'], [])
+        self.assertEqual(result[0]['system_metadata'], {})
 
     def test_instance_get_all_hung_in_rebooting(self):
         # Ensure no instances are returned.
@@ -1736,6 +1808,44 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
                     db.instance_update, self.ctxt, instance['uuid'],
                     {'host': 'h1', 'expected_vm_state': ('spam', 'bar')})
 
+    def test_instance_update_columns(self):
+        instance = self.create_instance_with_args(vm_state='foo',
+                                                  task_state=None)
+        written = db.instance_update_columns(self.ctxt, instance['uuid'],
+                {'host': 'h1', 'expected_task_state': [None, 'spam'],
+                 'expected_vm_state': 'foo'})
+        self.assertEqual('h1', written['host'])
+        self.assertNotIn('expected_task_state', written)
+        instance = db.instance_get_by_uuid(self.ctxt, instance['uuid'])
+        self.assertEqual('h1', instance['host'])
+        self.assertEqual(written['updated_at'], instance['updated_at'])
+
+    def test_instance_update_columns_unexpected_task_state(self):
+        instance = self.create_instance_with_args(task_state='deleting')
+        self.assertRaises(exception.UnexpectedDeletingTaskStateError,
+                          db.instance_update_columns, self.ctxt,
+                          instance['uuid'],
+                          {'host': 'h2', 'expected_task_state': [None]})
+        instance = self.create_instance_with_args(task_state=None)
+        self.assertRaises(exception.UnexpectedTaskStateError,
+                          db.instance_update_columns, self.ctxt,
+                          instance['uuid'],
+                          {'host': 'h2', 'expected_task_state': 'spam'})
+        instance = db.instance_get_by_uuid(self.ctxt, instance['uuid'])
+        self.assertNotEqual('h2', instance['host'])
+
+    def test_instance_update_columns_unexpected_vm_state(self):
+        instance = self.create_instance_with_args(vm_state='foo')
+        self.assertRaises(exception.UnexpectedVMStateError,
+                          db.instance_update_columns, self.ctxt,
+                          instance['uuid'],
+                          {'host': 'h1', 'expected_vm_state': ('spam', )})
+
+    def test_instance_update_columns_not_found(self):
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_update_columns, self.ctxt,
+                          str(stdlib_uuid.uuid4()), {'host': 'h1'})
+
     def test_instance_update_with_instance_uuid(self):
         # test instance_update() works when an instance UUID is passed.
         ctxt = context.get_admin_context()
@@ -1933,6 +2043,44 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.InstanceNotFound,
                           db.instance_destroy, ctxt, instance['uuid'])
 
+    def test_instance_info_cache_update_many(self):
+        updated = self.create_instance_with_args()['uuid']
+        deleted = self.create_instance_with_args()['uuid']
+        db.instance_info_cache_delete(self.ctxt, deleted)
+        created = self.create_instance_with_args()['uuid']
+        sqlalchemy_api.model_query(self.ctxt, models.InstanceInfoCache).\
+            filter_by(instance_uuid=created).\
+            delete()
+
+        db.instance_info_cache_update_many(self.ctxt, {
+            updated: {'network_info': '[1]'},
+            deleted: {'network_info': '[2]'},
+            created: {'network_info': '[3]'}})
+
+        self.assertEqual('[1]', db.instance_info_cache_get(
+            self.ctxt, updated)['network_info'])
+        self.assertIsNone(db.instance_info_cache_get(self.ctxt, deleted))
+        self.assertEqual('[3]', db.instance_info_cache_get(
+            self.ctxt, created)['network_info'])
+
+    def test_instance_info_cache_update_many_duplicate_fallback(self):
+        def fake_execute(*args, **kwargs):
+            raise db_exc.DBDuplicateEntry()
+
+        self.stubs.Set(db_session.Session, 'execute', fake_execute)
+        self.mox.StubOutWithMock(sqlalchemy_api, 'instance_info_cache_update')
+        sqlalchemy_api.instance_info_cache_update(
+            self.ctxt, 'fake_uuid1', {'network_info': '[]'})
+        sqlalchemy_api.instance_info_cache_update(
+            self.ctxt, 'fake_uuid2', {'network_info': '[]'}).AndRaise(
+                exception.InstanceInfoCacheNotFound(
+                    instance_uuid='fake_uuid2'))
+        self.mox.ReplayAll()
+        db.instance_info_cache_update_many(
+            self.ctxt, collections.OrderedDict([
+                ('fake_uuid1', {'network_info': '[]'}),
+                ('fake_uuid2', {'network_info': '[]'})]))
+
 
 class InstanceMetadataTestCase(test.TestCase):
 
@@ -2392,6 +2540,79 @@ class InstanceActionTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                              self.ctxt.request_id)
         self.assertNotEqual('Error', action['message'])
 
+    def test_instance_action_event_record_many(self):
+        uuid1 = str(stdlib_uuid.uuid4())
+        uuid2 = str(stdlib_uuid.uuid4())
+        action1 = db.action_start(self.ctxt,
+                                  self._create_action_values(uuid1))
+        action2 = db.action_start(self.ctxt,
+                                  self._create_action_values(uuid2))
+        db.action_event_start(self.ctxt, self._create_event_values(uuid1))
+
+        finish = {'finish_time': timeutils.utcnow(), 'result': 'Error'}
+        db.action_event_record_many(self.ctxt, [
+            ('finish', self._create_event_values(uuid1, extra=finish)),
+            ('start', self._create_event_values(uuid2, event='build')),
+            ('finish', self._create_event_values(uuid2, event='build',
+                                                 extra=finish))])
+
+        for action, event in ((action1, 'schedule'), (action2, 'build')):
+            events = db.action_events_get(self.ctxt, action['id'])
+            self.assertEqual(1, len(events))
+            self.assertEqual(event, events[0]['event'])
+            self.assertEqual('Error', events[0]['result'])
+            action = db.action_get_by_request_id(self.ctxt,
+                                                 action['instance_uuid'],
+                                                 self.ctxt.request_id)
+            self.assertEqual('Error', action['message'])
+
+    def test_instance_action_event_record_many_finishes_latest(self):
+        uuid = str(stdlib_uuid.uuid4())
+        action = db.action_start(self.ctxt, self._create_action_values(uuid))
+        first = db.action_event_start(self.ctxt,
+                                      self._create_event_values(uuid))
+        second = db.action_event_start(self.ctxt,
+                                       self._create_event_values(uuid))
+        finish = {'finish_time': timeutils.utcnow(), 'result': 'Success'}
+        db.action_event_record_many(self.ctxt, [
+            ('finish', self._create_event_values(uuid, extra=finish))])
+
+        events = dict((event['id'], event)
+                      for event in db.action_events_get(self.ctxt,
+                                                        action['id']))
+        self.assertIsNone(events[first['id']]['finish_time'])
+        self.assertEqual('Success', events[second['id']]['result'])
+
+    def test_instance_action_event_record_many_latest_action(self):
+        uuid = str(stdlib_uuid.uuid4())
+        values = self._create_action_values(uuid)
+        db.action_start(self.ctxt, values)
+        latest = db.action_start(self.ctxt, dict(values, action='reboot'))
+        db.action_event_record_many(self.ctxt, [
+            ('start', self._create_event_values(uuid))])
+        events = db.action_events_get(self.ctxt, latest['id'])
+        self.assertEqual(['schedule'], [event['event'] for event in events])
+
+    def test_instance_action_event_record_many_action_not_found(self):
+        uuid = str(stdlib_uuid.uuid4())
+        action = db.action_start(self.ctxt, self._create_action_values(uuid))
+        self.assertRaises(exception.InstanceActionNotFound,
+                          db.action_event_record_many, self.ctxt, [
+                              ('start', self._create_event_values(uuid)),
+                              ('start', self._create_event_values(
+                                  'missing-uuid'))])
+        # None of the events are recorded
+        self.assertEqual([], db.action_events_get(self.ctxt, action['id']))
+
+    def test_instance_action_event_record_many_event_not_found(self):
+        uuid = str(stdlib_uuid.uuid4())
+        db.action_start(self.ctxt, self._create_action_values(uuid))
+        finish = {'finish_time': timeutils.utcnow(), 'result': 'Success'}
+        self.assertRaises(exception.InstanceActionEventNotFound,
+                          db.action_event_record_many, self.ctxt, [
+                              ('finish', self._create_event_values(
+                                  uuid, extra=finish))])
+
     def test_instance_action_event_finish_error(self):
         """Finish an instance action event with an error."""
         uuid = str(stdlib_uuid.uuid4())
@@ -2486,6 +2707,22 @@ class InstanceFaultTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(1, len(faults[uuid]))
         self._assertEqualObjects(fault, faults[uuid][0])
 
+    def test_instance_fault_create_many(self):
+        uuids = [str(stdlib_uuid.uuid4()), str(stdlib_uuid.uuid4())]
+        values_list = []
+        for uuid in uuids:
+            db.instance_create(self.ctxt, {'uuid': uuid})
+            values_list.append(self._create_fault_values(uuid))
+        faults = db.instance_fault_create_many(self.ctxt, values_list,
+                                               update_cells=False)
+
+        ignored_keys = ['deleted', 'created_at', 'updated_at',
+                        'deleted_at', 'id']
+        self._assertEqualListsOfObjects(values_list, faults, ignored_keys)
+        saved = db.instance_fault_get_by_instance_uuids(self.ctxt, uuids)
+        for uuid, fault in zip(uuids, faults):
+            self.assertEqual([fault], saved[uuid])
+
     def test_instance_fault_get_by_instance(self):
         """Ensure we can retrieve faults for instance."""
         uuids = [str(stdlib_uuid.uuid4()), str(stdlib_uuid.uuid4())]
@@ -2852,6 +3089,12 @@ class InstanceTypeExtraSpecsTestCase(BaseInstanceTypeTestCase):
             real_specs = db.flavor_extra_specs_get(self.ctxt, it['flavorid'])
             self._assertEqualObjects(current_specs, real_specs)
 
+    def test_flavor_generation_get(self):
+        generation = db.flavor_generation_get(self.ctxt)
+        self.assertEqual(generation, db.flavor_generation_get(self.ctxt))
+        db.flavor_extra_specs_delete(self.ctxt, 'f1', 'a')
+        self.assertNotEqual(generation, db.flavor_generation_get(self.ctxt))
+
     def test_flavor_extra_specs_update_or_create_flavor_not_found(self):
         self.assertRaises(exception.FlavorNotFound,
                           db.flavor_extra_specs_update_or_create,
@@ -5124,6 +5367,49 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
             resources_names.remove(reservation.resource)
         self.assertEqual(len(resources_names), 0)
 
+    def _stub_reservable_resource(self):
+        def sync(elevated, project_id, user_id, session):
+            return {'res': 0}
+        self.stubs.Set(sqlalchemy_api, 'QUOTA_SYNC_FUNCTIONS',
+                       {'_sync_res': sync})
+        return {'res': quota.ReservableResource('res', '_sync_res')}
+
+    def _assert_usage(self, in_use, reserved):
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'res', user_id='u1')
+        self.assertEqual((in_use, reserved), (usage.in_use, usage.reserved))
+
+    def test_quota_reserve_counted(self):
+        resources = self._stub_reservable_resource()
+        limits = {'res': 5}
+        # The usage does not exist yet, so it is created by the locking path
+        first = db.quota_reserve_counted(self.ctxt, resources, limits, limits,
+                                         {'res': 1}, timeutils.utcnow(),
+                                         0, 0, 'p1', 'u1')
+        self._assert_usage(0, 1)
+        second = db.quota_reserve_counted(self.ctxt, resources, limits,
+                                          limits, {'res': 2},
+                                          timeutils.utcnow(), 0, 0,
+                                          'p1', 'u1')
+        self.assertEqual(1, len(second))
+        self._assert_usage(0, 3)
+        db.reservation_commit_counted(self.ctxt, first, 'p1', 'u1')
+        self._assert_usage(1, 2)
+        db.reservation_rollback_counted(self.ctxt, second, 'p1', 'u1')
+        self._assert_usage(1, 0)
+        self.assertRaises(exception.ReservationNotFound,
+                          _reservation_get, self.ctxt, second[0])
+
+    def test_quota_reserve_counted_over_quota(self):
+        resources = self._stub_reservable_resource()
+        limits = {'res': 5}
+        db.quota_reserve_counted(self.ctxt, resources, limits, limits,
+                                 {'res': 2}, timeutils.utcnow(), 0, 0,
+                                 'p1', 'u1')
+        self.assertRaises(exception.OverQuota, db.quota_reserve_counted,
+                          self.ctxt, resources, limits, limits,
+                          {'res': 4}, timeutils.utcnow(), 0, 0, 'p1', 'u1')
+        self._assert_usage(0, 2)
+
     def test_quota_destroy_all_by_project(self):
         reservations = _quota_reserve(self.ctxt, 'project1', 'user1')
         db.quota_destroy_all_by_project(self.ctxt, 'project1')
@@ -5201,6 +5487,53 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
         for key, value in expected.iteritems():
             self.assertEqual(value, quota_usage[key])
 
+    def test_quota_usage_refresh_all(self):
+        for i in range(2):
+            db.instance_create(self.ctxt, {'project_id': 'p1',
+                                           'user_id': 'u1', 'vcpus': 2,
+                                           'memory_mb': 512})
+        db.security_group_create(self.ctxt, {'project_id': 'p1',
+                                             'user_id': 'u1',
+                                             'name': 'sg'})
+        expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        for project_id, user_id, resource, in_use, delta in (
+                ('p1', 'u1', 'instances', 5, None),
+                ('p1', 'u1', 'cores', 4, None),
+                ('p1', 'u1', 'security_groups', 0, None),
+                ('p1', None, 'fixed_ips', 3, None),
+                ('p1', None, 'ram', 2048, None),
+                ('p1', 'u2', 'instances', 3, 1),
+                ('p1', 'u2', 'cores', 2, -2),
+                ('p2', 'u1', 'ram', 1024, None)):
+            usage = sqlalchemy_api._quota_usage_create(
+                self.ctxt, project_id, user_id, resource, in_use,
+                max(delta, 0), None)
+            if delta is not None:
+                sqlalchemy_api._reservation_create(
+                    self.ctxt, str(stdlib_uuid.uuid4()), usage, project_id,
+                    user_id, resource, delta, expire)
+
+        self.assertEqual(4, db.quota_usage_refresh_all(self.ctxt))
+
+        usages = db.quota_usage_get_all_by_project_and_user(self.ctxt,
+                                                            'p1', 'u1')
+        self.assertEqual({'reserved': 0, 'in_use': 2}, usages['instances'])
+        self.assertEqual({'reserved': 0, 'in_use': 4}, usages['cores'])
+        self.assertEqual({'reserved': 0, 'in_use': 1},
+                         usages['security_groups'])
+        self.assertEqual({'reserved': 0, 'in_use': 0}, usages['fixed_ips'])
+        # Usages with reservations in flight are left alone, also when
+        # they release resources
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'instances', 'u2')
+        self.assertEqual(3, usage.in_use)
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'cores', 'u2')
+        self.assertEqual(2, usage.in_use)
+        # Per-user usages of no user cannot be counted
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'ram')
+        self.assertEqual(2048, usage.in_use)
+        usage = db.quota_usage_get(self.ctxt, 'p2', 'ram', 'u1')
+        self.assertEqual(0, usage.in_use)
+
     def test_quota_create_exists(self):
         db.quota_create(self.ctxt, 'project1', 'resource1', 41)
         self.assertRaises(exception.QuotaExists, db.quota_create, self.ctxt,
@@ -5301,7 +5634,8 @@ class S3ImageTestCase(test.TestCase):
 
 class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
-    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at']
+    _ignored_keys = ['id', 'deleted', 'deleted_at', 'created_at', 'updated_at',
+                     'compact_stats']
 
     def setUp(self):
         super(ComputeNodeTestCase, self).setUp()
@@ -5538,6 +5872,82 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(num_instance_stat['key'], stat['key'])
         self.assertEqual(1, int(stat['value']))
 
+    def _stat_rows(self, compute_node_id):
+        return sqlalchemy_api.model_query(self.ctxt, models.ComputeNodeStat,
+                                          read_deleted='no').\
+                    filter_by(compute_node_id=compute_node_id).all()
+
+    def test_compute_node_create_compact(self):
+        self.flags(compact_compute_node_stats=True)
+        values = dict(self.compute_node_dict, stats=self.stats,
+                      hypervisor_hostname='compact')
+        item = db.compute_node_create(self.ctxt, values)
+        self.assertEqual([], self._stat_rows(item['id']))
+        new_stats = compute_stats.from_compact(item['compact_stats'])
+        self._stats_equal(self.stats, new_stats)
+
+    def test_compute_node_update_compact_converts_rows(self):
+        self.flags(compact_compute_node_stats=True)
+        item_updated = db.compute_node_update(
+            self.ctxt, self.item['id'],
+            {'stats': {'num_instances': 8, 'num_tribbles': 1}})
+        self.assertEqual([], self._stat_rows(self.item['id']))
+        expected = dict(self.stats, num_instances=8, num_tribbles=1)
+        new_stats = compute_stats.from_compact(item_updated['compact_stats'])
+        self.assertEqual(len(expected), len(new_stats))
+        self._stats_equal(expected, new_stats)
+
+    def test_compute_node_update_compact_prune(self):
+        self.flags(compact_compute_node_stats=True)
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'stats': self.stats})
+        item_updated = db.compute_node_update(
+            self.ctxt, self.item['id'], {'stats': {'num_instances': 1}},
+            prune_stats=True)
+        self.assertEqual({'num_instances': '1'}, compute_stats.from_compact(
+            item_updated['compact_stats']))
+
+    def test_compute_node_update_compact_without_stats(self):
+        self.flags(compact_compute_node_stats=True)
+        item_updated = db.compute_node_update(self.ctxt, self.item['id'],
+                                              {'vcpus': 4})
+        self.assertEqual(4, item_updated['vcpus'])
+        self.assertIsNone(item_updated['compact_stats'])
+        self.assertEqual(len(self.stats),
+                         len(self._stat_rows(self.item['id'])))
+
+    def test_compute_node_update_rows_after_compact(self):
+        self.flags(compact_compute_node_stats=True)
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'stats': self.stats})
+        self.flags(compact_compute_node_stats=False)
+        item_updated = db.compute_node_update(self.ctxt, self.item['id'],
+                                              {'vcpus': 4})
+        self.assertIsNotNone(item_updated['compact_stats'])
+        item_updated = db.compute_node_update(self.ctxt, self.item['id'],
+                                              {'stats': {'num_tribbles': 1}})
+        self.assertIsNone(item_updated['compact_stats'])
+        node = db.compute_node_get_all(self.ctxt, False)[0]
+        self.assertEqual(len(self.stats) + 1, len(node['stats']))
+        self._stats_equal(dict(self.stats, num_tribbles=1),
+                          self._stats_as_dict(node['stats']))
+
+    def test_compute_node_get_all_compact(self):
+        self.flags(compact_compute_node_stats=True)
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'stats': self.stats})
+        selected = []
+
+        def fake_select(columns, *args, **kwargs):
+            selected.append(columns[0].table.name)
+            return select(columns, *args, **kwargs)
+
+        self.stubs.Set(sqlalchemy_api, 'select', fake_select)
+        nodes = db.compute_node_get_all(self.ctxt, False)
+        self.assertNotIn('compute_node_stats', selected)
+        self.assertEqual(1, len(nodes))
+        self._stats_equal(self.stats, nodes[0]['stats'])
+
 
 class ProviderFwRuleTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
@@ -6054,6 +6464,51 @@ class BwUsageTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualObjects(bw_usage, expected_bw_usage,
                                  ignored_keys=self._ignored_keys)
 
+    def test_bw_usage_update_many(self):
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        db.bw_usage_update(self.ctxt, 'fake_uuid1', 'fake_mac1',
+                           start_period, 100, 200, 12345, 67890)
+
+        usages = [{'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+                   'start_period': start_period, 'bw_in': 200,
+                   'bw_out': 300, 'last_ctr_in': 22345,
+                   'last_ctr_out': 77890},
+                  {'uuid': 'fake_uuid1', 'mac': 'fake_mac2',
+                   'start_period': start_period, 'bw_in': 1, 'bw_out': 2,
+                   'last_ctr_in': 3, 'last_ctr_out': 4},
+                  {'uuid': 'fake_uuid2', 'mac': 'fake_mac3',
+                   'start_period': start_period, 'bw_in': 5, 'bw_out': 6,
+                   'last_ctr_in': 7, 'last_ctr_out': 8}]
+        db.bw_usage_update_many(self.ctxt, usages, update_cells=False)
+
+        bw_usages = db.bw_usage_get_by_uuids(self.ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        self.assertEqual(3, len(bw_usages))
+        for usage in usages:
+            bw_usage = db.bw_usage_get(self.ctxt, usage['uuid'],
+                                       start_period, usage['mac'])
+            self._assertEqualObjects(dict(usage, last_refreshed=now),
+                                     bw_usage,
+                                     ignored_keys=self._ignored_keys)
+
+    def test_bw_usage_update_many_duplicate_fallback(self):
+        start_period = timeutils.utcnow()
+        usage = {'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+                 'start_period': start_period, 'bw_in': 1, 'bw_out': 2,
+                 'last_ctr_in': 3, 'last_ctr_out': 4}
+        def fake_execute(*args, **kwargs):
+            raise db_exc.DBDuplicateEntry()
+
+        self.stubs.Set(db_session.Session, 'execute', fake_execute)
+        self.mox.StubOutWithMock(sqlalchemy_api, 'bw_usage_update')
+        sqlalchemy_api.bw_usage_update(self.ctxt, 'fake_uuid1', 'fake_mac1',
+                                       start_period, 1, 2, 3, 4,
+                                       last_refreshed=1)
+        self.mox.ReplayAll()
+        db.bw_usage_update_many(self.ctxt, [usage], last_refreshed=1,
+                                update_cells=False)
+
 
 class Ec2TestCase(test.TestCase):
 
@@ -6151,6 +6606,118 @@ class Ec2TestCase(test.TestCase):
                           self.ctxt, 100500)
 
 
+class ReadRoutingTestCase(test.TestCase):
+    def setUp(self):
+        super(ReadRoutingTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.flags(slave_read_routing=True, slave_max_lag=30)
+        self.flags(slave_connection='sqlite://', group='database')
+        self.stubs.Set(sqlalchemy_api, '_ROUTING', threading.local())
+        self.stubs.Set(sqlalchemy_api, '_READ_ROUTING_STATS',
+                       collections.defaultdict(collections.Counter))
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_LAG',
+                       {'checked_at': None, 'lag': None})
+        self.lag = 0
+        self.real_slave_lag = sqlalchemy_api._slave_lag
+        self.stubs.Set(sqlalchemy_api, '_slave_lag', lambda: self.lag)
+
+    def _read(self):
+        return sqlalchemy_api._reading_from_slave()
+
+    def test_read_from_slave(self):
+        self.assertTrue(sqlalchemy_api.route_read('fake', self._read))
+        self.assertFalse(self._read())
+        self.assertEqual({'fake': {'slave': 1}}, db.read_routing_stats())
+
+    def test_read_opt_in_from_slave_when_allowed(self):
+        self.assertFalse(sqlalchemy_api.route_read_opt_in('fake', self._read))
+        with db.stale_reads_allowed():
+            self.assertTrue(sqlalchemy_api.route_read_opt_in('fake',
+                                                             self._read))
+        self.assertFalse(sqlalchemy_api.route_read_opt_in('fake', self._read))
+        self.assertEqual({'fake': {'slave': 1}}, db.read_routing_stats())
+
+    def test_read_from_primary_when_disabled(self):
+        self.flags(slave_read_routing=False)
+        self.assertFalse(sqlalchemy_api.route_read('fake', self._read))
+        self.assertEqual({'fake': {'primary': 1}}, db.read_routing_stats())
+
+    def test_read_from_primary_when_lagging(self):
+        self.lag = 31
+        self.assertFalse(sqlalchemy_api.route_read('fake', self._read))
+        self.lag = None
+        self.assertFalse(sqlalchemy_api.route_read('fake', self._read))
+        self.assertEqual({'fake': {'primary_lag': 2}},
+                         db.read_routing_stats())
+
+    def test_read_your_writes(self):
+        # Also the writes made before the first routing decision
+        db.instance_create(self.ctxt, {})
+        self.assertFalse(sqlalchemy_api.route_read('fake', self._read))
+        self.assertEqual({'fake': {'primary_recent_write': 1}},
+                         db.read_routing_stats())
+
+    def test_fall_back_to_primary_on_slave_error(self):
+        def read():
+            if sqlalchemy_api._reading_from_slave():
+                raise exc.OperationalError('SELECT', {}, 'gone away')
+            return 'primary'
+
+        self.assertEqual('primary', sqlalchemy_api.route_read('fake', read))
+        self.assertEqual({'fake': {'slave': 1, 'primary_slave_error': 1}},
+                         db.read_routing_stats())
+        self.assertIsNone(sqlalchemy_api._SLAVE_LAG['lag'])
+
+    def test_model_query_uses_slave_session(self):
+        sessions = []
+
+        def fake_get_session(**kwargs):
+            sessions.append(kwargs)
+            raise test.TestingException()
+
+        self.stubs.Set(db_session, 'get_session', fake_get_session)
+        self.assertRaises(test.TestingException, sqlalchemy_api.route_read,
+                          'fake', sqlalchemy_api.model_query, self.ctxt,
+                          models.Instance)
+        self.assertRaises(test.TestingException, sqlalchemy_api.route_read,
+                          'fake', sqlalchemy_api.get_session)
+        self.assertEqual([{'slave_session': True}, {'slave_session': True}],
+                         sessions)
+
+    def test_slave_lag(self):
+        engine = self.mox.CreateMockAnything()
+        engine.name = 'mysql'
+        self.mox.StubOutWithMock(sqlalchemy_api, 'get_engine')
+        sqlalchemy_api.get_engine(slave_engine=True).AndReturn(engine)
+        result = self.mox.CreateMockAnything()
+        engine.execute('SHOW SLAVE STATUS').AndReturn(result)
+        result.first().AndReturn({'Seconds_Behind_Master': 3})
+        self.mox.ReplayAll()
+        self.assertEqual(3, self.real_slave_lag())
+        # Cached until the next check
+        self.assertEqual(3, self.real_slave_lag())
+
+    def test_read_only_api_is_routed(self):
+        self.flags(slave_read_routing=False)
+        instance = db.instance_create(self.ctxt, {})
+        db.flavor_get_all(self.ctxt)
+        # Compute hosts list their own instances with it
+        db.instance_get_all_by_filters(self.ctxt, {'host': 'foo'})
+        with db.stale_reads_allowed():
+            db.instance_get_all_by_filters(self.ctxt, {})
+        db.instance_update(self.ctxt, instance['uuid'], {'host': 'foo'})
+        # Another service may just have written the instance
+        db.instance_get_by_uuid(self.ctxt, instance['uuid'])
+        # Read to update the counters of the instance
+        db.bw_usage_get_by_uuids(self.ctxt, [instance['uuid']], 0)
+        stats = db.read_routing_stats()
+        self.assertEqual({'primary': 1}, stats['flavor_get_all'])
+        self.assertEqual({'primary': 1}, stats['instance_get_all_by_filters'])
+        self.assertNotIn('instance_update', stats)
+        self.assertNotIn('instance_get_by_uuid', stats)
+        self.assertNotIn('bw_usage_get_by_uuids', stats)
+
+
 class ArchiveTestCase(test.TestCase):
 
     def setUp(self):
@@ -6455,6 +7022,140 @@ class ArchiveTestCase(test.TestCase):
         si_rows = self.conn.execute(qsi).fetchall()
         self.assertEqual(len(siim_rows) + len(si_rows), 8)
 
+    def test_archive_deleted_rows_chunk(self):
+        # Add 6 rows to table and set 4 to deleted
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr)
+            self.conn.execute(ins_stmt)
+        update_statement = self.instance_id_mappings.update().\
+                where(self.instance_id_mappings.c.uuid.in_(self.uuidstrs[:4]))\
+                .values(deleted=1)
+        self.conn.execute(update_statement)
+        qiim = select([self.instance_id_mappings]).where(self.
+                                instance_id_mappings.c.uuid.in_(self.uuidstrs))
+        qsiim = select([self.shadow_instance_id_mappings]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                                self.uuidstrs))
+        num, marker = db.archive_deleted_rows_chunk(
+            self.context, "instance_id_mappings", 3)
+        self.assertEqual(num, 3)
+        self.assertEqual(len(self.conn.execute(qiim).fetchall()), 3)
+        self.assertEqual(len(self.conn.execute(qsiim).fetchall()), 3)
+        # The next chunk starts after the marker
+        num, marker = db.archive_deleted_rows_chunk(
+            self.context, "instance_id_mappings", 3, marker=marker)
+        self.assertEqual(num, 1)
+        self.assertEqual(len(self.conn.execute(qiim).fetchall()), 2)
+        self.assertEqual(len(self.conn.execute(qsiim).fetchall()), 4)
+        # No deleted rows left after the marker
+        num, marker = db.archive_deleted_rows_chunk(
+            self.context, "instance_id_mappings", 3, marker=marker)
+        self.assertEqual(num, 0)
+        self.assertIsNone(marker)
+
+    def test_archive_deleted_rows_chunk_skips_rows_before_marker(self):
+        ins_stmt = self.instance_id_mappings.insert().values(
+            uuid=self.uuidstrs[0], deleted=1)
+        id1 = self.conn.execute(ins_stmt).inserted_primary_key[0]
+        num, marker = db.archive_deleted_rows_chunk(
+            self.context, "instance_id_mappings", 10, marker=id1)
+        self.assertEqual(num, 0)
+        self.assertIsNone(marker)
+        qiim = select([self.instance_id_mappings]).where(
+            self.instance_id_mappings.c.id == id1)
+        self.assertEqual(len(self.conn.execute(qiim).fetchall()), 1)
+
+    def test_archive_deleted_rows_chunk_no_id_column(self):
+        ins_stmt = self.dns_domains.insert().values(domain=self.uuidstrs[0],
+                                                    deleted=True)
+        self.conn.execute(ins_stmt)
+        num, marker = db.archive_deleted_rows_chunk(self.context,
+                                                    "dns_domains", 10)
+        self.assertEqual(num, 1)
+        self.assertEqual(marker, self.uuidstrs[0])
+
+    def test_archive_deleted_rows_chunk_fk_constraint(self):
+        dialect = self.engine.url.get_dialect()
+        if dialect == sqlite.dialect:
+            import sqlite3
+            tup = sqlite3.sqlite_version_info
+            if tup[0] < 3 or (tup[0] == 3 and tup[1] < 7):
+                self.skipTest(
+                    'sqlite version too old for reliable SQLA foreign_keys')
+            self.conn.execute("PRAGMA foreign_keys = ON")
+        ins_stmt = self.console_pools.insert().values(deleted=1)
+        id1 = self.conn.execute(ins_stmt).inserted_primary_key[0]
+        self.ids.append(id1)
+        ins_stmt = self.consoles.insert().values(deleted=1, pool_id=id1)
+        id2 = self.conn.execute(ins_stmt).inserted_primary_key[0]
+        self.ids.append(id2)
+        # The chunk is skipped, but the marker moves past it.
+        num, marker = db.archive_deleted_rows_chunk(self.context,
+                                                    "console_pools", 10)
+        self.assertEqual(num, 0)
+        self.assertEqual(marker, id1)
+
+    def test_archive_deleted_rows_chunk_lock_wait(self):
+        ins_stmt = self.instance_id_mappings.insert().values(
+            uuid=self.uuidstrs[0], deleted=1)
+        self.conn.execute(ins_stmt)
+        real_connect = self.engine.connect
+
+        def fake_connect():
+            # Let the select of the chunk through, then fail the insert
+            # the way a locked database does.
+            conn = real_connect()
+            real_execute = conn.execute
+            executed = []
+
+            def fake_execute(statement, *args, **kwargs):
+                executed.append(statement)
+                if len(executed) > 1:
+                    raise exc.OperationalError('INSERT', {},
+                                               'database is locked')
+                return real_execute(statement, *args, **kwargs)
+
+            conn.execute = fake_execute
+            return conn
+
+        self.stubs.Set(self.engine, 'connect', fake_connect)
+        self.assertRaises(db_exc.DBDeadlock, db.archive_deleted_rows_chunk,
+                          self.context, "instance_id_mappings", 10)
+
+    def test_archive_deleted_rows_chunk_reflects_once(self):
+        self.stubs.Set(sqlalchemy_api, '_ARCHIVE_TABLES', {})
+        reflected = []
+        connections = []
+        real_table = sqlalchemy_api.Table
+        real_connect = self.engine.connect
+
+        def fake_table(name, *args, **kwargs):
+            reflected.append(name)
+            return real_table(name, *args, **kwargs)
+
+        def fake_connect():
+            connections.append(real_connect())
+            return connections[-1]
+
+        self.stubs.Set(sqlalchemy_api, 'Table', fake_table)
+        self.stubs.Set(self.engine, 'connect', fake_connect)
+        for i in range(2):
+            db.archive_deleted_rows_chunk(self.context,
+                                          "instance_id_mappings", 10)
+        self.assertEqual(['instance_id_mappings',
+                          'shadow_instance_id_mappings'], reflected)
+        self.assertTrue(connections)
+        self.assertTrue(all(conn.closed for conn in connections))
+
+    def test_archive_tablenames(self):
+        tablenames = db.archive_tablenames(self.context)
+        self.assertIn('instances', tablenames)
+        self.assertIn('dns_domains', tablenames)
+        self.assertNotIn('shadow_instances', tablenames)
+        # Children come before the tables they reference
+        self.assertTrue(tablenames.index('consoles') <
+                        tablenames.index('console_pools'))
+
 
 class InstanceGroupDBApiTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
@@ -2687,6 +2687,41 @@ class TestNovaMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
     def _post_downgrade_229(self, engine):
         self.assertColumnNotExists(engine, 'compute_nodes', 'extra_resources')
 
+    def _check_230(self, engine, data):
+        for table in ('compute_nodes', 'shadow_compute_nodes'):
+            self.assertColumnExists(engine, table, 'compact_stats')
+            compute_nodes = db_utils.get_table(engine, table)
+            self.assertTrue(isinstance(compute_nodes.c.compact_stats.type,
+                                       sqlalchemy.types.Text))
+
+    def _post_downgrade_230(self, engine):
+        for table in ('compute_nodes', 'shadow_compute_nodes'):
+            self.assertColumnNotExists(engine, table, 'compact_stats')
+
+    def _check_231(self, engine, data):
+        self.assertIndexMembers(engine, 'migrations',
+                                'migrations_source_compute_source_node_'
+                                'deleted_idx',
+                                ['source_compute', 'source_node', 'deleted'])
+        self.assertIndexMembers(engine, 'migrations',
+                                'migrations_dest_compute_dest_node_'
+                                'deleted_idx',
+                                ['dest_compute', 'dest_node', 'deleted'])
+        self.assertIndexMembers(engine, 'reservations',
+                                'reservations_deleted_expire_idx',
+                                ['deleted', 'expire'])
+
+    def _post_downgrade_231(self, engine):
+        t = db_utils.get_table(engine, 'migrations')
+        index_names = [idx.name for idx in t.indexes]
+        self.assertNotIn('migrations_source_compute_source_node_deleted_idx',
+                         index_names)
+        self.assertNotIn('migrations_dest_compute_dest_node_deleted_idx',
+                         index_names)
+        t = db_utils.get_table(engine, 'reservations')
+        index_names = [idx.name for idx in t.indexes]
+        self.assertNotIn('reservations_deleted_expire_idx', index_names)
+
 
 class TestBaremetalMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
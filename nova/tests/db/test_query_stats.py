@@ -0,0 +1,110 @@
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the accounting of DB queries."""
+
+import mock
+
+from nova import context
+from nova import db
+from nova.db import query_stats
+from nova import manager
+from nova.openstack.common import periodic_task
+from nova import test
+
+
+class FakeManager(manager.Manager):
+    @periodic_task.periodic_task
+    def _list_services(self, context):
+        db.service_get_all(context)
+
+
+class QueryStatsTestCase(test.TestCase):
+    def setUp(self):
+        super(QueryStatsTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(db_query_stats_sample_rate=1.0,
+                   db_query_stats_repeat_threshold=2)
+        query_stats._TOTALS.clear()
+        self.addCleanup(query_stats._TOTALS.clear)
+
+    def test_scope_counts_queries(self):
+        with query_stats.scope('api GET /servers/%s' % ('a' * 36)):
+            db.service_get_all(self.context)
+            db.service_get_all(self.context)
+        totals = query_stats.summary()['api GET /servers/*']
+        self.assertEqual(1, totals['calls'])
+        self.assertEqual(2, totals['queries'])
+        self.assertTrue(totals['time'] > 0)
+
+    def test_nested_scope_counts_to_outermost(self):
+        with query_stats.scope('outer'):
+            with query_stats.scope('inner'):
+                db.service_get_all(self.context)
+        self.assertEqual(['outer'], query_stats.summary().keys())
+        self.assertEqual(1, query_stats.summary()['outer']['queries'])
+
+    def test_unsampled_scope(self):
+        self.flags(db_query_stats_sample_rate=0.5)
+        with mock.patch('random.random', return_value=0.7):
+            with query_stats.scope('outer'):
+                db.service_get_all(self.context)
+        self.assertEqual({}, query_stats.summary())
+
+    def test_no_scope(self):
+        db.service_get_all(self.context)
+        self.assertEqual({}, query_stats.summary())
+
+    def test_repeated_query_warns(self):
+        with mock.patch.object(query_stats.LOG, 'warn') as warn:
+            with query_stats.scope('n plus one'):
+                for i in range(3):
+                    db.service_get_all(self.context)
+        self.assertEqual(1, warn.call_count)
+        self.assertEqual(3, warn.call_args[0][1]['count'])
+
+    def test_summary_logged_after_interval(self):
+        self.flags(db_query_stats_summary_interval=0)
+        with mock.patch.object(query_stats.LOG, 'info') as info:
+            with query_stats.scope('scope'):
+                db.service_get_all(self.context)
+        self.assertEqual(2, info.call_count)
+        self.assertEqual('scope', info.call_args[0][1]['name'])
+        self.assertEqual({}, query_stats.summary())
+
+    def test_slow_query_hook(self):
+        self.flags(db_query_stats_sample_rate=0, db_slow_query_time=1e-9)
+        slow = []
+        self.stubs.Set(query_stats, '_SLOW_QUERY_HOOKS', [])
+        query_stats.register_slow_query_hook(
+            lambda statement, elapsed, scope: slow.append(scope))
+        with mock.patch.object(query_stats.LOG, 'warn') as warn:
+            with query_stats.scope('slow'):
+                db.service_get_all(self.context)
+        self.assertEqual(['slow'], slow)
+        self.assertEqual(1, warn.call_count)
+
+    def test_periodic_task_scope(self):
+        FakeManager().periodic_tasks(self.context)
+        totals = query_stats.summary()['periodic FakeManager._list_services']
+        self.assertEqual(1, totals['queries'])
+
+    def test_rpc_dispatch_scope(self):
+        dispatcher = FakeManager().create_rpc_dispatcher()
+        with mock.patch('nova.openstack.common.rpc.dispatcher.'
+                        'RpcDispatcher.dispatch') as dispatch:
+            dispatch.side_effect = lambda *args, **kwargs: (
+                db.service_get_all(self.context))
+            dispatcher.dispatch(self.context, '1.0', 'ping', None)
+        self.assertEqual(1, query_stats.summary()['rpc ping']['queries'])
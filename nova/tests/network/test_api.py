@@ -289,6 +289,24 @@ class ApiTestCase(test.TestCase):
         self.network_api.associate(self.context, FAKE_UUID, project=None)
 
 
+    def test_get_instances_nw_info(self):
+        instances = [{'uuid': 'fake-uuid1'}, {'uuid': 'fake-uuid2'}]
+        nw_info = network_model.NetworkInfo([])
+        self.mox.StubOutWithMock(self.network_api, '_get_instance_nw_info')
+        self.mox.StubOutWithMock(api, 'update_instances_cache_with_nw_info')
+        self.network_api._get_instance_nw_info(
+            self.context, instances[0]).AndReturn(nw_info)
+        self.network_api._get_instance_nw_info(
+            self.context, instances[1]).AndRaise(
+                exception.InstanceNotFound(instance_id='fake-uuid2'))
+        api.update_instances_cache_with_nw_info(self.context,
+                                                {'fake-uuid1': nw_info})
+        self.mox.ReplayAll()
+        self.assertEqual({'fake-uuid1': nw_info},
+                         self.network_api.get_instances_nw_info(self.context,
+                                                                instances))
+
+
 class TestUpdateInstanceCache(test.TestCase):
     def setUp(self):
         super(TestUpdateInstanceCache, self).setUp()
@@ -326,6 +344,19 @@ class TestUpdateInstanceCache(test.TestCase):
                                                self.instance,
                                                network_model.NetworkInfo([]))
 
+    def test_update_instances_cache(self):
+        self.mox.StubOutWithMock(db, 'instance_info_cache_update_many')
+        db.instance_info_cache_update_many(self.context, mox.Func(
+            lambda values: 'super_vif' in values[FAKE_UUID]['network_info']))
+        self.mox.ReplayAll()
+        api.update_instances_cache_with_nw_info(self.context,
+                                                {FAKE_UUID: self.nw_info})
+
+    def test_update_instances_cache_nothing(self):
+        self.mox.StubOutWithMock(db, 'instance_info_cache_update_many')
+        self.mox.ReplayAll()
+        api.update_instances_cache_with_nw_info(self.context, {})
+
     def test_decorator_return_object(self):
         @api.refresh_cache
         def func(self, context, instance):
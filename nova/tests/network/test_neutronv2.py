@@ -1700,6 +1700,45 @@ class TestNeutronv2(TestNeutronv2Base):
         self.assertEqual(networks, [])
 
 
+class TestNeutronv2InstancesNwInfo(TestNeutronv2Base):
+
+    def test_get_instances_nw_info(self):
+        api = neutronapi.API()
+        self.stubs.Set(neutronapi, 'PORT_LISTING_BATCH_SIZE', 1)
+        self.mox.StubOutWithMock(api, '_build_network_info_model')
+        self.mox.StubOutWithMock(neutronapi, 'update_instances_info_cache')
+        port = {'device_id': self.instance['uuid'],
+                'tenant_id': self.instance['project_id']}
+        other_tenant_port = {'device_id': self.instance['uuid'],
+                             'tenant_id': 'other-tenant'}
+        port2 = {'device_id': self.instance2['uuid'],
+                 'tenant_id': self.instance2['project_id']}
+        self.moxed_client.list_ports(
+            device_id=[self.instance['uuid']]).AndReturn(
+                {'ports': [port, other_tenant_port]})
+        self.moxed_client.list_ports(
+            device_id=[self.instance2['uuid']]).AndReturn(
+                {'ports': [port2]})
+        api._build_network_info_model(
+            self.context, self.instance, ports=[port]).AndReturn(
+                model.NetworkInfo([model.VIF(id='vif')]))
+        api._build_network_info_model(
+            self.context, self.instance2, ports=[port2]).AndRaise(
+                exceptions.NeutronClientException())
+        neutronapi.update_instances_info_cache(
+            self.context,
+            {self.instance['uuid']: model.NetworkInfo([model.VIF(id='vif')])})
+        neutronv2.get_client(mox.IgnoreArg(),
+                             admin=True).MultipleTimes().AndReturn(
+            self.moxed_client)
+        self.mox.ReplayAll()
+
+        nw_infos = api.get_instances_nw_info(self.context,
+                                             [self.instance, self.instance2])
+        self.assertEqual([self.instance['uuid']], nw_infos.keys())
+        self.assertEqual('vif', nw_infos[self.instance['uuid']][0]['id'])
+
+
 class TestNeutronv2ModuleMethods(test.TestCase):
     def test_ensure_requested_network_ordering_no_preference_ids(self):
         l = [1, 2, 3]
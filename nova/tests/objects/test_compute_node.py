@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from nova.compute import stats as compute_stats
 from nova import db
 from nova.objects import compute_node
 from nova.objects import service
@@ -43,6 +44,7 @@ fake_compute_node = {
     'disk_available_least': 256,
     'metrics': '',
     'extra_resources': '',
+    'stats': {'num_instances': '2013'},
 }
 
 
@@ -62,6 +64,32 @@ class _TestComputeNodeObject(object):
         compute = compute_node.ComputeNode.get_by_service_id(self.context, 456)
         self.compare_obj(compute, fake_compute_node)
 
+    def test_get_by_id_compact_stats(self):
+        db_compute = dict(fake_compute_node, stats=[],
+                          compact_stats=compute_stats.to_compact(
+                              {'num_instances': 2013}))
+        self.mox.StubOutWithMock(db, 'compute_node_get')
+        db.compute_node_get(self.context, 123).AndReturn(db_compute)
+        self.mox.ReplayAll()
+        compute = compute_node.ComputeNode.get_by_id(self.context, 123)
+        self.compare_obj(compute, fake_compute_node)
+
+    def test_get_by_id_stat_rows(self):
+        db_compute = dict(fake_compute_node,
+                          stats=[{'key': 'num_instances', 'value': '2013'}])
+        self.mox.StubOutWithMock(db, 'compute_node_get')
+        db.compute_node_get(self.context, 123).AndReturn(db_compute)
+        self.mox.ReplayAll()
+        compute = compute_node.ComputeNode.get_by_id(self.context, 123)
+        self.compare_obj(compute, fake_compute_node)
+
+    def test_obj_make_compatible(self):
+        compute = compute_node.ComputeNode()
+        compute.stats = {'num_instances': '1'}
+        primitive = compute.obj_to_primitive()['nova_object.data']
+        compute.obj_make_compatible(primitive, '1.2')
+        self.assertNotIn('stats', primitive)
+
     def test_create(self):
         self.mox.StubOutWithMock(db, 'compute_node_create')
         db.compute_node_create(self.context, {'service_id': 456}).AndReturn(
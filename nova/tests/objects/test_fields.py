@@ -15,6 +15,7 @@
 import datetime
 import iso8601
 
+import mock
 import netaddr
 
 from nova.network import model as network_model
@@ -82,11 +83,19 @@ class TestInteger(TestField):
     def setUp(self):
         super(TestField, self).setUp()
         self.field = fields.IntegerField()
-        self.coerce_good_values = [(1, 1), ('1', 1)]
+        self.coerce_good_values = [(1, 1), ('1', 1), (True, 1)]
         self.coerce_bad_values = ['foo', None]
         self.to_primitive_values = self.coerce_good_values[0:1]
         self.from_primitive_values = self.coerce_good_values[0:1]
 
+    def test_coerce_skipped_for_coerced_type(self):
+        with mock.patch.object(fields.Integer, 'coerce') as coerce:
+            self.assertEqual(1, self.field.coerce('obj', 'attr', 1))
+            self.assertFalse(coerce.called)
+            # A bool is an int, but not of exactly that type
+            self.field.coerce('obj', 'attr', True)
+            coerce.assert_called_once_with('obj', 'attr', True)
+
 
 class TestFloat(TestField):
     def setUp(self):
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import datetime
 
 import iso8601
@@ -240,6 +241,8 @@ class _TestInstanceObject(object):
             self.flags(enable=True, cell_type=cell_type, group='cells')
         else:
             self.flags(enable=False, group='cells')
+        # The old and new instance are only read for the notification.
+        self.flags(notify_on_state_change='vm_and_task_state')
 
         old_ref = dict(self.fake_instance, host='oldhost', user_data='old',
                        vm_state='old', task_state='old')
@@ -333,6 +336,7 @@ class _TestInstanceObject(object):
         # Tests that simply changing the 'display_name' on the instance
         # will send a notification.
         self.flags(enable=False, group='cells')
+        self.flags(notify_on_state_change='vm_and_task_state')
         old_ref = dict(self.fake_instance, display_name='hello')
         fake_uuid = old_ref['uuid']
         expected_updates = dict(display_name='goodbye')
@@ -363,6 +367,58 @@ class _TestInstanceObject(object):
         self.assertEqual('goodbye', inst.display_name)
         self.assertEqual(set([]), inst.obj_what_changed())
 
+    def test_save_columns_only(self):
+        self.flags(enable=False, group='cells')
+        self.flags(notify_on_state_change=None)
+        fake_uuid = self.fake_instance['uuid']
+        now = timeutils.utcnow().replace(microsecond=0)
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        self.mox.StubOutWithMock(db, 'instance_update_columns')
+        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(notifications, 'send_update')
+        db.instance_get_by_uuid(self.context, fake_uuid,
+                                columns_to_join=['info_cache',
+                                                 'security_groups'],
+                                use_slave=False
+                                ).AndReturn(self.fake_instance)
+        db.instance_update_columns(
+                self.context, fake_uuid,
+                {'task_state': 'wuff', 'expected_task_state': [None]}
+                ).AndReturn({'task_state': 'wuff', 'updated_at': now})
+        self.mox.ReplayAll()
+
+        inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
+        inst.task_state = 'wuff'
+        inst.save(expected_task_state=[None])
+        self.assertEqual('wuff', inst.task_state)
+        self.assertEqual(now, inst.updated_at.replace(tzinfo=None))
+        self.assertEqual(set([]), inst.obj_what_changed())
+
+    def test_save_metadata_reads_instance(self):
+        self.flags(enable=False, group='cells')
+        self.flags(notify_on_state_change=None)
+        fake_uuid = self.fake_instance['uuid']
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        self.mox.StubOutWithMock(db, 'instance_update_columns')
+        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        db.instance_get_by_uuid(self.context, fake_uuid,
+                                columns_to_join=['info_cache',
+                                                 'security_groups'],
+                                use_slave=False
+                                ).AndReturn(self.fake_instance)
+        new_ref = dict(self.fake_instance, metadata=[])
+        db.instance_update_and_get_original(
+                self.context, fake_uuid, {'metadata': {'foo': 'bar'}},
+                update_cells=False,
+                columns_to_join=['metadata', 'info_cache',
+                                 'security_groups', 'system_metadata']
+                ).AndReturn((self.fake_instance, new_ref))
+        self.mox.ReplayAll()
+
+        inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
+        inst.metadata = {'foo': 'bar'}
+        inst.save()
+
     def test_get_deleted(self):
         fake_inst = dict(self.fake_instance, id=123, deleted=123)
         fake_uuid = fake_inst['uuid']
@@ -703,6 +759,25 @@ class _TestInstanceObject(object):
         self.assertEqual('foo-%s' % db_inst['uuid'], inst.name)
         self.assertFalse(inst.obj_attr_is_set('fault'))
 
+    def test_unset_column_not_lazy_loaded_unless_projected(self):
+        inst = instance.Instance(context=self.context, id=1, uuid='fake-uuid')
+        self.assertRaises(exception.ObjectActionError, getattr, inst, 'host')
+
+    def test_projected_flag_survives_serialization(self):
+        db_inst = fake_instance.fake_db_instance()
+        inst = instance.Instance._from_db_object(
+            self.context, instance.Instance(), db_inst, columns=['vm_state'])
+        self.assertTrue(inst._projected)
+        primitive = inst.obj_to_primitive()
+        self.assertTrue(instance.Instance.obj_from_primitive(
+            primitive)._projected)
+        self.assertTrue(copy.deepcopy(inst)._projected)
+
+        inst = instance.Instance._from_db_object(
+            self.context, instance.Instance(), db_inst)
+        self.assertFalse(instance.Instance.obj_from_primitive(
+            inst.obj_to_primitive())._projected)
+
     def test_from_db_object_not_overwrite_info_cache(self):
         info_cache = instance_info_cache.InstanceInfoCache()
         inst = instance.Instance(context=self.context,
@@ -837,7 +912,8 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
         db.instance_get_all_by_filters(self.context, {'foo': 'bar'}, 'uuid',
                                        'asc', limit=None, marker=None,
-                                       columns_to_join=['metadata']).AndReturn(
+                                       columns_to_join=['metadata'],
+                                       columns=None).AndReturn(
                                            fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -858,7 +934,8 @@ class _TestInstanceListObject(object):
         db.instance_get_all_by_filters(self.context,
                                        {'deleted': True, 'cleaned': False},
                                        'uuid', 'asc', limit=None, marker=None,
-                                       columns_to_join=['metadata']).AndReturn(
+                                       columns_to_join=['metadata'],
+                                       columns=None).AndReturn(
                                            [fakes[1]])
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -876,7 +953,8 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
         db.instance_get_all_by_host(self.context, 'foo',
                                     columns_to_join=None,
-                                    use_slave=False).AndReturn(fakes)
+                                    use_slave=False,
+                                    columns=None).AndReturn(fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_host(self.context, 'foo')
         for i in range(0, len(fakes)):
@@ -886,6 +964,54 @@ class _TestInstanceListObject(object):
         self.assertEqual(inst_list.obj_what_changed(), set())
         self.assertRemotes()
 
+    def test_get_by_host_with_columns(self):
+        fakes = [{'id': 1, 'uuid': 'fake-uuid1', 'vm_state': 'active',
+                  'system_metadata': []},
+                 {'id': 2, 'uuid': 'fake-uuid2', 'vm_state': 'stopped',
+                  'system_metadata': []}]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(self.context, 'foo',
+                                    columns_to_join=['system_metadata',
+                                                     'info_cache'],
+                                    use_slave=False,
+                                    columns=['vm_state']).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(
+            self.context, 'foo',
+            expected_attrs=['system_metadata', 'info_cache'],
+            columns=['vm_state'])
+        for i in range(0, len(fakes)):
+            inst = inst_list.objects[i]
+            self.assertEqual(fakes[i]['uuid'], inst.uuid)
+            self.assertEqual(fakes[i]['vm_state'], inst.vm_state)
+            self.assertEqual({}, inst.system_metadata)
+            self.assertFalse(inst.obj_attr_is_set('host'))
+            self.assertFalse(inst.obj_attr_is_set('info_cache'))
+        self.assertEqual(inst_list.obj_what_changed(), set())
+        self.assertRemotes()
+
+    def test_get_by_filters_with_columns_lazy_loads(self):
+        db_inst = db.instance_create(self.context,
+                                     {'user_id': self.context.user_id,
+                                      'project_id': self.context.project_id,
+                                      'host': 'foo-host',
+                                      'vm_state': 'active',
+                                      'memory_mb': 512})
+        inst_list = instance.InstanceList.get_by_filters(
+            self.context, {'uuid': db_inst['uuid']},
+            columns=['vm_state'])
+        self.assertEqual(1, len(inst_list))
+        inst = inst_list[0]
+        self.assertEqual('active', inst.vm_state)
+        self.assertFalse(inst.obj_attr_is_set('host'))
+        self.assertFalse(inst.obj_attr_is_set('memory_mb'))
+        # Touching one missing column loads all of them, without marking
+        # them as changed.
+        self.assertEqual('foo-host', inst.host)
+        self.assertTrue(inst.obj_attr_is_set('memory_mb'))
+        self.assertEqual(512, inst.memory_mb)
+        self.assertEqual(set(), inst.obj_what_changed())
+
     def test_get_by_host_and_node(self):
         fakes = [self.fake_instance(1),
                  self.fake_instance(2)]
@@ -940,7 +1066,8 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_fault_get_by_instance_uuids')
         db.instance_get_all_by_host(self.context, 'host',
                                     columns_to_join=[],
-                                    use_slave=False
+                                    use_slave=False,
+                                    columns=None
                                     ).AndReturn(fake_insts)
         db.instance_fault_get_by_instance_uuids(
             self.context, [x['uuid'] for x in fake_insts]
@@ -96,6 +96,51 @@ class _TestInstanceInfoCacheObject(object):
     def test_save_without_update_cells(self):
         self._save_helper(None, False)
 
+    def test_update_many(self):
+        self.mox.StubOutWithMock(db, 'instance_info_cache_update_many')
+        self.mox.StubOutWithMock(cells_opts, 'get_cell_type')
+        cells_opts.get_cell_type().AndReturn(None)
+        db.instance_info_cache_update_many(
+            self.context, {'fake-uuid1': {'network_info': '[]'},
+                           'fake-uuid2': {'network_info': '[{}]'}})
+        self.mox.ReplayAll()
+        instance_info_cache.InstanceInfoCache.update_many(
+            self.context, {'fake-uuid1': '[]', 'fake-uuid2': '[{}]'})
+        self.assertRemotes()
+
+    def test_update_many_compute_cell(self):
+        cells_api = cells_rpcapi.CellsAPI()
+        self.mox.StubOutWithMock(db, 'instance_info_cache_update')
+        self.mox.StubOutWithMock(cells_opts, 'get_cell_type')
+        self.mox.StubOutWithMock(cells_rpcapi, 'CellsAPI',
+                                 use_mock_anything=True)
+        self.mox.StubOutWithMock(cells_api,
+                                 'instance_info_cache_update_at_top')
+        cells_opts.get_cell_type().AndReturn('compute')
+        db.instance_info_cache_update(
+            self.context, 'fake-uuid1',
+            {'network_info': '[]'}).AndReturn('foo')
+        cells_opts.get_cell_type().AndReturn('compute')
+        cells_rpcapi.CellsAPI().AndReturn(cells_api)
+        cells_api.instance_info_cache_update_at_top(self.context, 'foo')
+        self.mox.ReplayAll()
+        instance_info_cache.InstanceInfoCache.update_many(
+            self.context, {'fake-uuid1': '[]'})
+        self.assertRemotes()
+
+    def test_update_many_compute_cell_deleted(self):
+        self.mox.StubOutWithMock(db, 'instance_info_cache_update')
+        self.mox.StubOutWithMock(cells_opts, 'get_cell_type')
+        cells_opts.get_cell_type().AndReturn('compute')
+        db.instance_info_cache_update(
+            self.context, 'fake-uuid1', {'network_info': '[]'}).AndRaise(
+                exception.InstanceInfoCacheNotFound(
+                    instance_uuid='fake-uuid1'))
+        self.mox.ReplayAll()
+        instance_info_cache.InstanceInfoCache.update_many(
+            self.context, {'fake-uuid1': '[]'})
+        self.assertRemotes()
+
 
 class TestInstanceInfoCacheObject(test_objects._LocalTest,
                                   _TestInstanceInfoCacheObject):
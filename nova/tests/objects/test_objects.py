@@ -27,6 +27,7 @@ from nova import exception
 from nova.objects import base
 from nova.objects import fields
 from nova.objects import utils
+from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova import test
 
@@ -691,6 +692,159 @@ class TestRemoteObject(_RemoteTest, _TestObject):
         obj = MyObj2.query(self.context)
         self.assertEqual('oldbar', obj.bar)
 
+    def _sent_fields(self):
+        sent = []
+        manager = self.conductor_service.manager
+        orig_object_delta_action = manager.object_delta_action
+
+        def fake_object_delta_action(context, objinst, objbase, *args,
+                                     **kwargs):
+            sent.append((objbase, set(name for name in objinst.fields
+                                      if objinst.obj_attr_is_set(name))))
+            return orig_object_delta_action(context, objinst, objbase,
+                                            *args, **kwargs)
+        self.stubs.Set(manager, 'object_delta_action',
+                       fake_object_delta_action)
+        self.stubs.Set(MyObj, 'obj_identity_fields', ['foo'])
+        self.flags(send_object_changes=True, group='conductor')
+        return sent
+
+    def test_send_object_changes(self):
+        sent = self._sent_fields()
+        obj = MyObj.query(self.context)
+        obj.missing = 'set'
+        obj.save()
+        obj._update_test()
+        self.assertEqual('updated', obj.bar)
+        self.assertEqual('set', obj.missing)
+        self.assertEqual([(None, set(['foo', 'bar', 'missing'])),
+                          (mock.ANY, set(['foo']))], sent)
+        self.assertIsNotNone(sent[1][0])
+
+    def test_send_object_changes_base_not_found(self):
+        sent = self._sent_fields()
+        obj = MyObj.query(self.context)
+        obj.marco()
+        self.conductor_service.manager.object_bases = (
+            base.ObjectBaseCache(10))
+        self.assertEqual('polo', obj.marco())
+        self.assertEqual([None, mock.ANY, None],
+                         [objbase for objbase, fields in sent])
+        self.assertEqual(set(['foo', 'bar']), sent[2][1])
+
+
+class TestObjectDeltas(test.TestCase):
+    def setUp(self):
+        super(TestObjectDeltas, self).setUp()
+        self.stubs.Set(MyObj, 'obj_identity_fields', ['foo'])
+
+    def _obj_with_base(self):
+        obj = MyObj(foo=1, bar='bar')
+        obj.obj_reset_changes()
+        obj._obj_base = ('fake-base', set(['foo', 'bar']))
+        return obj
+
+    def test_obj_to_delta_primitive_without_base(self):
+        obj = MyObj(foo=1, bar='bar')
+        self.assertIsNone(obj.obj_to_delta_primitive())
+        obj._obj_base = ('fake-base', set(['foo', 'bar']))
+        self.stubs.Set(MyObj, 'obj_identity_fields', [])
+        self.assertIsNone(obj.obj_to_delta_primitive())
+
+    def test_obj_to_delta_primitive(self):
+        obj = self._obj_with_base()
+        base_id, primitive = obj.obj_to_delta_primitive()
+        self.assertEqual('fake-base', base_id)
+        self.assertEqual({'foo': 1}, primitive['nova_object.data'])
+        self.assertNotIn('nova_object.changes', primitive)
+
+        obj.missing = 'set'
+        obj.obj_reset_changes(['missing'])
+        obj.bar = 'changed'
+        base_id, primitive = obj.obj_to_delta_primitive()
+        self.assertEqual({'foo': 1, 'bar': 'changed', 'missing': 'set'},
+                         primitive['nova_object.data'])
+        self.assertEqual(['bar'], primitive['nova_object.changes'])
+
+    def test_obj_reset_changes_of_fields_sends_them(self):
+        obj = self._obj_with_base()
+        obj.bar = 'changed'
+        obj.obj_reset_changes(['bar'])
+        base_id, primitive = obj.obj_to_delta_primitive()
+        self.assertEqual({'foo': 1, 'bar': 'changed'},
+                         primitive['nova_object.data'])
+        obj.obj_reset_changes()
+        self.assertIsNone(obj.obj_to_delta_primitive())
+
+    def test_obj_has_changes(self):
+        class Bar(base.NovaObject):
+            fields = {'foo': fields.IntegerField()}
+
+        class BarList(base.ObjectListBase, base.NovaObject):
+            fields = {'objects': fields.ListOfObjectsField('Bar')}
+
+        bar = Bar(foo=1)
+        bars = BarList(objects=[bar])
+        bars.obj_reset_changes()
+        self.assertTrue(base._obj_has_changes(bars))
+        bar.obj_reset_changes()
+        self.assertFalse(base._obj_has_changes(bars))
+        self.assertFalse(base._obj_has_changes('foo'))
+
+    def test_base_cache(self):
+        cache = base.ObjectBaseCache(10)
+        obj = MyObj(foo=1, bar='bar')
+        obj.obj_reset_changes()
+        base_id = cache.add(obj)
+
+        delta = MyObj(foo=1, missing='set')
+        cache.apply(delta, base_id)
+        self.assertEqual('bar', delta.bar)
+        self.assertEqual('set', delta.missing)
+        self.assertEqual(set(['foo', 'missing']), delta.obj_what_changed())
+        # Used up
+        self.assertRaises(exception.ObjectBaseNotFound,
+                          cache.apply, MyObj(foo=1), base_id)
+
+    def test_base_cache_only_last_base(self):
+        cache = base.ObjectBaseCache(10)
+        obj = MyObj(foo=1)
+        old_base = cache.add(obj)
+        cache.add(obj)
+        self.assertRaises(exception.ObjectBaseNotFound,
+                          cache.apply, MyObj(foo=1), old_base)
+
+    def test_base_cache_size(self):
+        cache = base.ObjectBaseCache(2)
+        bases = [cache.add(MyObj(foo=i)) for i in range(3)]
+        self.assertRaises(exception.ObjectBaseNotFound,
+                          cache.apply, MyObj(foo=0), bases[0])
+        cache.apply(MyObj(foo=2), bases[2])
+
+    def test_base_cache_memcached(self):
+        self.flags(memcached_servers=['fake-server'])
+        mc = memorycache.Client()
+        self.stubs.Set(memorycache, 'get_client', lambda: mc)
+        worker1 = base.ObjectBaseCache(1)
+        worker2 = base.ObjectBaseCache(1)
+        bases = [worker1.add(MyObj(foo=i, bar='bar')) for i in range(2)]
+        old_base = worker2.add(MyObj(foo=2))
+        worker2.add(MyObj(foo=2))
+
+        delta = MyObj(foo=0)
+        worker2.apply(delta, bases[0])
+        self.assertEqual('bar', delta.bar)
+        worker2.apply(MyObj(foo=1), bases[1])
+        self.assertRaises(exception.ObjectBaseNotFound,
+                          worker1.apply, MyObj(foo=0), bases[0])
+        self.assertRaises(exception.ObjectBaseNotFound,
+                          worker1.apply, MyObj(foo=2), old_base)
+
+    def test_base_cache_disabled(self):
+        self.assertIsNone(base.ObjectBaseCache(0).add(MyObj(foo=1)))
+        self.stubs.Set(MyObj, 'obj_identity_fields', [])
+        self.assertIsNone(base.ObjectBaseCache(10).add(MyObj(foo=1)))
+
 
 class TestObjectListBase(test.TestCase):
     def test_list_like_operations(self):
@@ -14,6 +14,7 @@
 
 from nova import db
 from nova import exception
+from nova.objects import compute_node
 from nova.objects import service
 from nova.openstack.common import timeutils
 from nova.tests.objects import test_compute_node
@@ -166,6 +167,17 @@ class _TestServiceObject(object):
         # Make sure it doesn't re-fetch this
         service_obj.compute_node
 
+    def test_obj_make_compatible_compute_node(self):
+        service_obj = service.Service()
+        service_obj.compute_node = compute_node.ComputeNode(
+            stats={'num_instances': '1'})
+        primitive = service_obj.obj_to_primitive()['nova_object.data']
+        service_obj.obj_make_compatible(primitive, '1.2')
+        self.assertEqual('1.2',
+                         primitive['compute_node']['nova_object.version'])
+        self.assertNotIn('stats',
+                         primitive['compute_node']['nova_object.data'])
+
     def test_load_when_orphaned(self):
         service_obj = service.Service()
         service_obj.id = 123
@@ -436,6 +436,7 @@ class HostStateTestCase(test.NoDBTestCase):
             dict(key='num_os_type_linux', value='4'),
             dict(key='num_os_type_windoze', value='1'),
             dict(key='io_workload', value='42'),
+            dict(key='num_builds_queued', value='3'),
         ]
         hyper_ver_int = utils.convert_version_to_int('6.0.0')
         compute = dict(stats=stats, memory_mb=1, free_disk_gb=0, local_gb=0,
@@ -459,7 +460,8 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertEqual(4, host.num_instances_by_os_type['linux'])
         self.assertEqual(1, host.num_instances_by_os_type['windoze'])
         self.assertEqual(42, host.num_io_ops)
-        self.assertEqual(10, len(host.stats))
+        self.assertEqual(3, host.num_builds_queued)
+        self.assertEqual(11, len(host.stats))
 
         self.assertEqual('127.0.0.1', host.host_ip)
         self.assertEqual('htype', host.hypervisor_type)
@@ -492,6 +494,21 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertIsNone(host.pci_stats)
         self.assertEqual(hyper_ver_int, host.hypervisor_version)
 
+    def test_stat_consumption_from_compute_node_compact_stats(self):
+        stats = {'num_instances': '5', 'num_proj_12345': '3',
+                 'io_workload': '42'}
+        compute = dict(stats=stats, memory_mb=0, free_disk_gb=0, local_gb=0,
+                       local_gb_used=0, free_ram_mb=0, vcpus=0, vcpus_used=0,
+                       updated_at=None, host_ip='127.0.0.1',
+                       hypervisor_version=1)
+
+        host = host_manager.HostState("fakehost", "fakenode")
+        host.update_from_compute_node(compute)
+        self.assertEqual(5, host.num_instances)
+        self.assertEqual(3, host.num_instances_by_project['12345'])
+        self.assertEqual(42, host.num_io_ops)
+        self.assertEqual(stats, host.stats)
+
     def test_stat_consumption_from_instance(self):
         host = host_manager.HostState("fakehost", "fakenode")
 
@@ -18,6 +18,8 @@ Unit Tests for flavors code
 import sys
 import time
 
+import mock
+
 from nova.compute import flavors
 from nova import context
 from nova import db
@@ -25,6 +27,7 @@ from nova.db.sqlalchemy import models
 from nova import exception
 from nova.openstack.common.db.sqlalchemy import session as sql_session
 from nova import test
+from nova.tests import fake_notifier
 
 
 DEFAULT_FLAVORS = [
@@ -349,6 +352,123 @@ class InstanceTypeToolsTest(test.TestCase):
         self.assertEqual(metadata, {})
 
 
+class FlavorCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(FlavorCacheTestCase, self).setUp()
+        self.flags(flavor_cache_ttl=60)
+        self.ctxt = context.get_admin_context()
+        self.addCleanup(flavors._CACHE.__init__)
+        flavors._CACHE.__init__()
+        fake_notifier.stub_notifier(self.stubs)
+        self.addCleanup(fake_notifier.reset)
+        self.calls = []
+        real_flavor_get_by_flavor_id = db.flavor_get_by_flavor_id
+
+        def counting_get(*args, **kwargs):
+            self.calls.append(args)
+            return real_flavor_get_by_flavor_id(*args, **kwargs)
+
+        self.stubs.Set(db, 'flavor_get_by_flavor_id', counting_get)
+
+    def test_cache_disabled(self):
+        self.flags(flavor_cache_ttl=0)
+        flavors.get_flavor_by_flavor_id('1', self.ctxt)
+        flavors.get_flavor_by_flavor_id('1', self.ctxt)
+        self.assertEqual(2, len(self.calls))
+        self.assertEqual(0, flavors.cache_stats()['misses'])
+
+    def test_cache_hit(self):
+        flavor = flavors.get_flavor_by_flavor_id('1', self.ctxt)
+        flavor['extra_specs']['foo'] = 'bar'
+        cached = flavors.get_flavor_by_flavor_id('1', self.ctxt)
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual('m1.tiny', cached['name'])
+        # Callers get their own copy
+        self.assertEqual({}, cached['extra_specs'])
+        stats = flavors.cache_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['entries'])
+
+    def test_cache_per_project(self):
+        flavors.get_flavor_by_flavor_id('1', self.ctxt)
+        user_ctxt = context.RequestContext('fake', 'fake')
+        flavors.get_flavor_by_flavor_id('1', user_ctxt)
+        self.assertEqual(2, len(self.calls))
+
+    def test_cache_expires(self):
+        with mock.patch.object(flavors.time, 'time') as fake_time:
+            fake_time.return_value = 1000
+            flavors.get_flavor_by_flavor_id('1', self.ctxt)
+            fake_time.return_value = 1061
+            flavors.get_flavor_by_flavor_id('1', self.ctxt)
+        self.assertEqual(2, len(self.calls))
+
+    def test_not_found_not_cached(self):
+        for i in range(2):
+            self.assertRaises(exception.FlavorNotFound,
+                              flavors.get_flavor_by_flavor_id, 'nope',
+                              self.ctxt)
+        self.assertEqual(2, len(self.calls))
+
+    def test_change_invalidates_and_notifies(self):
+        flavors.create('cached', 256, 1, 120, flavorid='cached',
+                       is_public=False)
+        self.assertEqual([], flavors.get_flavor_access_by_flavor_id(
+            'cached', self.ctxt))
+        flavors.add_flavor_access('cached', 'fake', self.ctxt)
+        projects = flavors.get_flavor_access_by_flavor_id('cached',
+                                                          self.ctxt)
+        self.assertEqual(['fake'], [x['project_id'] for x in projects])
+        self.assertEqual(2, flavors.cache_stats()['invalidations'])
+        self.assertEqual(['flavor.create', 'flavor.access.add'],
+                         [msg.event_type
+                          for msg in fake_notifier.NOTIFICATIONS])
+        self.assertEqual({'flavorid': 'cached', 'project_id': 'fake'},
+                         fake_notifier.NOTIFICATIONS[1].payload)
+
+    def test_extra_specs(self):
+        with mock.patch.object(flavors.time, 'time') as fake_time:
+            fake_time.return_value = 1000
+            self.assertEqual({}, flavors.get_flavor_extra_specs('1',
+                                                                self.ctxt))
+            # Changed by another process, which is seen through the flavor
+            # generation once it is checked again
+            db.flavor_extra_specs_update_or_create(self.ctxt, '1',
+                                                   {'a': 'b'})
+            fake_time.return_value = 1001
+            self.assertEqual({}, flavors.get_flavor_extra_specs('1',
+                                                                self.ctxt))
+            fake_time.return_value = 1005
+            self.assertEqual({'a': 'b'},
+                             flavors.get_flavor_extra_specs('1', self.ctxt))
+        self.assertEqual(1, flavors.cache_stats()['invalidations'])
+
+    def test_generation_checked_once_per_interval(self):
+        with mock.patch.object(flavors.time, 'time') as fake_time:
+            with mock.patch.object(db, 'flavor_generation_get',
+                                   return_value=1) as generation_get:
+                fake_time.return_value = 1000
+                for i in range(3):
+                    flavors.get_flavor_by_flavor_id('1', self.ctxt)
+                self.assertEqual(1, generation_get.call_count)
+                fake_time.return_value = 1005
+                flavors.get_flavor_by_flavor_id('1', self.ctxt)
+                self.assertEqual(2, generation_get.call_count)
+        self.assertEqual(1, len(self.calls))
+
+    def test_expired_entries_pruned(self):
+        with mock.patch.object(flavors.time, 'time') as fake_time:
+            fake_time.return_value = 1000
+            flavors.get_flavor_by_flavor_id('1', self.ctxt)
+            fake_time.return_value = 1030
+            flavors.get_flavor_by_flavor_id('2', self.ctxt)
+            self.assertEqual(2, flavors.cache_stats()['entries'])
+            fake_time.return_value = 1070
+            flavors.get_flavor_by_flavor_id('2', self.ctxt)
+        self.assertEqual(1, flavors.cache_stats()['entries'])
+
+
 class InstanceTypeFilteringTest(test.TestCase):
     """Test cases for the filter option available for instance_type_get_all."""
     def setUp(self):
@@ -18,8 +18,34 @@
 Unit Tests for nova.manager
 """
 
+import datetime
+import time
+
+import mock
+
+from nova import context
 from nova import manager
+from nova.openstack.common import periodic_task
+from nova.openstack.common import timeutils
 from nova import test
+from nova import utils
+
+
+def _fake_manager():
+    class FakeManager(manager.Manager):
+        @periodic_task.periodic_task
+        def _task(self, context):
+            self.ran = True
+
+        @periodic_task.periodic_task(spacing=60, run_immediately=True)
+        def _spaced_task(self, context):
+            pass
+
+        @periodic_task.periodic_task
+        def _slow_task(self, context):
+            time.sleep(0.01)
+
+    return FakeManager()
 
 
 class ManagerTestCase(test.NoDBTestCase):
@@ -33,3 +59,58 @@ class ManagerTestCase(test.NoDBTestCase):
 
         self.assertEqual(len(dispatch.callbacks), 3)
         self.assertIn(api, dispatch.callbacks)
+
+    def test_periodic_task_stats(self):
+        m = _fake_manager()
+        m.periodic_tasks(context.get_admin_context())
+        self.assertTrue(m.ran)
+        stats = m.periodic_task_stats['_task']
+        self.assertEqual(1, stats['runs'])
+        self.assertEqual(0, stats['overruns'])
+        self.assertFalse(stats['running'])
+        self.assertIsNotNone(stats['last_duration'])
+
+    def test_periodic_task_over_budget(self):
+        self.flags(periodic_task_budget=60,
+                   periodic_task_budgets=['_task:60', '_slow_task:0.001'])
+        m = _fake_manager()
+        m.periodic_tasks(context.get_admin_context())
+        self.assertEqual(1, m.periodic_task_stats['_slow_task']['overruns'])
+        self.assertEqual(0, m.periodic_task_stats['_task']['overruns'])
+
+    def test_periodic_tasks_concurrently(self):
+        self.flags(run_periodic_tasks_concurrently=True)
+        m = _fake_manager()
+        ctxt = context.get_admin_context()
+        spawned = []
+
+        def fake_spawn_n(func, *args, **kwargs):
+            spawned.append((func, args))
+        self.stubs.Set(utils, 'spawn_n', fake_spawn_n)
+
+        m.periodic_tasks(ctxt)
+        self.assertEqual(3, len(spawned))
+        self.assertTrue(m.periodic_task_stats['_task']['running'])
+
+        # Still running, so skipped
+        m.periodic_tasks(ctxt)
+        self.assertEqual(3, len(spawned))
+        self.assertEqual(1, m.periodic_task_stats['_task']['skipped'])
+
+        for func, args in spawned:
+            func(*args)
+        self.assertTrue(m.ran)
+        self.assertFalse(m.periodic_task_stats['_task']['running'])
+        self.assertEqual(1, m.periodic_task_stats['_task']['runs'])
+
+    def test_periodic_task_jitter(self):
+        self.flags(periodic_task_jitter=10)
+        m = _fake_manager()
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        with mock.patch('random.randint', return_value=10):
+            m.periodic_tasks(context.get_admin_context())
+        self.assertEqual(now + datetime.timedelta(seconds=10),
+                         m._periodic_last_run['_spaced_task'])
+        self.assertIsNone(m._periodic_spacing['_task'])
@@ -22,6 +22,7 @@ import sys
 from nova.cmd import manage
 from nova import context
 from nova import db
+from nova.db import archiver as db_archiver
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova import test
@@ -392,6 +393,17 @@ class DBCommandsTestCase(test.TestCase):
     def test_archive_deleted_rows_negative(self):
         self.assertEqual(1, self.commands.archive_deleted_rows(-1))
 
+    def test_online_archive_negative(self):
+        self.assertEqual(1, self.commands.online_archive(rows_per_second=-1))
+        self.assertEqual(1, self.commands.online_archive(chunk_size=0))
+
+    def test_online_archive_once(self):
+        self.mox.StubOutWithMock(db_archiver.OnlineArchiver, 'run_once')
+        db_archiver.OnlineArchiver.run_once()
+        self.mox.ReplayAll()
+        self.commands.online_archive(rows_per_second='10', chunk_size='5',
+                                     once=True)
+
 
 class ServiceCommandsTestCase(test.TestCase):
     def setUp(self):
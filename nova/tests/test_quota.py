@@ -18,6 +18,7 @@
 
 import datetime
 
+import mox
 from oslo.config import cfg
 
 from nova import compute
@@ -321,6 +322,10 @@ class FakeDriver(object):
     def usage_reset(self, context, resources):
         self.called.append(('usage_reset', context, resources))
 
+    def usage_refresh_all(self, context):
+        self.called.append(('usage_refresh_all', context))
+        return 2
+
     def destroy_all_by_project_and_user(self, context, project_id, user_id):
         self.called.append(('destroy_all_by_project_and_user', context,
                             project_id, user_id))
@@ -714,6 +719,16 @@ class QuotaEngineTestCase(test.TestCase):
                 ('usage_reset', context, ['res1', 'res2', 'res3']),
                 ])
 
+    def test_usage_refresh_all(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        self.assertEqual(2, quota_obj.usage_refresh_all(context))
+
+        self.assertEqual(driver.called, [
+                ('usage_refresh_all', context),
+                ])
+
     def test_destroy_all_by_project_and_user(self):
         context = FakeContext(None, None)
         driver = FakeDriver()
@@ -1979,6 +1994,51 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(calls, exemplar)
 
 
+class CounterQuotaDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(CounterQuotaDriverTestCase, self).setUp()
+        self.driver = quota.CounterQuotaDriver()
+        self.context = FakeContext('test_project', 'test_class')
+        self.useFixture(test.TimeOverride())
+
+        def fake_get_project_quotas(context, resources, project_id,
+                                    quota_class=None, defaults=True,
+                                    usages=True, remains=False):
+            return dict((k, dict(limit=v.default))
+                        for k, v in resources.items())
+        self.stubs.Set(self.driver, 'get_project_quotas',
+                       fake_get_project_quotas)
+
+    def test_reserve(self):
+        self.mox.StubOutWithMock(db, 'quota_reserve_counted')
+        expire = timeutils.utcnow() + datetime.timedelta(seconds=60)
+        db.quota_reserve_counted(self.context, quota.QUOTAS._resources,
+                                 mox.IgnoreArg(), mox.IgnoreArg(),
+                                 dict(instances=2), expire, 0, 0,
+                                 project_id='test_project',
+                                 user_id='fake_user').AndReturn(['resv-1'])
+        self.mox.ReplayAll()
+        result = self.driver.reserve(self.context, quota.QUOTAS._resources,
+                                     dict(instances=2), expire=60)
+        self.assertEqual(['resv-1'], result)
+
+    def test_commit(self):
+        self.mox.StubOutWithMock(db, 'reservation_commit_counted')
+        db.reservation_commit_counted(self.context, ['resv-1'],
+                                      project_id='test_project',
+                                      user_id='fake_user')
+        self.mox.ReplayAll()
+        self.driver.commit(self.context, ['resv-1'])
+
+    def test_rollback(self):
+        self.mox.StubOutWithMock(db, 'reservation_rollback_counted')
+        db.reservation_rollback_counted(self.context, ['resv-1'],
+                                        project_id='test_project',
+                                        user_id='fake_user')
+        self.mox.ReplayAll()
+        self.driver.rollback(self.context, ['resv-1'])
+
+
 class FakeSession(object):
     def begin(self):
         return self
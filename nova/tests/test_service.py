@@ -183,6 +183,7 @@ class ServiceTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.manager_mock, 'pre_start_hook')
         self.mox.StubOutWithMock(self.manager_mock, 'create_rpc_dispatcher')
         self.mox.StubOutWithMock(self.manager_mock, 'post_start_hook')
+        self.mox.StubOutWithMock(self.manager_mock, 'cleanup_host')
 
         self.mox.StubOutWithMock(_service.Service, 'stop')
 
@@ -198,6 +199,8 @@ class ServiceTestCase(test.TestCase):
         # post_start_hook is called after RPC consumer is created.
         self.manager_mock.post_start_hook()
 
+        # cleanup_host is called when the service stops
+        self.manager_mock.cleanup_host()
         _service.Service.stop()
 
         self.mox.ReplayAll()
@@ -626,6 +626,10 @@ class MetadataToDictTestCase(test.NoDBTestCase):
     def test_metadata_to_dict_empty(self):
         self.assertEqual(utils.metadata_to_dict([]), {})
 
+    def test_metadata_to_dict_already_decoded(self):
+        metadata = {'foo1': 'bar'}
+        self.assertIs(utils.metadata_to_dict(metadata), metadata)
+
     def test_dict_to_metadata(self):
         expected = [{'key': 'foo1', 'value': 'bar1'},
                     {'key': 'foo2', 'value': 'bar2'}]
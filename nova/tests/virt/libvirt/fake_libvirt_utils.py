@@ -23,6 +23,7 @@ from nova.virt.libvirt import utils as libvirt_utils
 files = {'console.log': True}
 disk_sizes = {}
 disk_backing_files = {}
+qcow2_headers = {}
 disk_type = "qcow2"
 
 
@@ -96,6 +97,10 @@ def get_disk_backing_file(path):
     return disk_backing_files.get(path, None)
 
 
+def get_qcow2_header(path):
+    return qcow2_headers.get(path)
+
+
 def get_disk_type(path):
     return disk_type
 
@@ -25,6 +25,7 @@ import mox
 import os
 import re
 import shutil
+import struct
 import tempfile
 
 from eventlet import greenthread
@@ -71,6 +72,7 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import driver as libvirt_driver
 from nova.virt.libvirt import firewall
 from nova.virt.libvirt import imagebackend
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt import netutils
 
@@ -138,6 +140,10 @@ _fake_NodeDevXml = \
     </device>"""}
 
 
+def fake_stat(size, mtime=0):
+    return os.stat_result((0, 1, 0, 1, 0, 0, size, 0, mtime, 0))
+
+
 def _concurrency(signal, wait, done, target, is_block_dev=False):
     signal.send()
     wait.wait()
@@ -1749,6 +1755,82 @@ class LibvirtConnTestCase(test.TestCase):
         # None should be listed, since we fake deleted the last one
         self.assertEqual(len(instances), 0)
 
+    def _fake_power_state_domain(self, domain_id, uuidstr, state):
+        domain = mock.Mock()
+        domain.ID.return_value = domain_id
+        domain.UUIDString.return_value = uuidstr
+        domain.info.return_value = [state, 2048, 2048, 1, 0]
+        return domain
+
+    def test_get_power_states(self):
+        running = self._fake_power_state_domain(
+            1, 'running-uuid', libvirt_driver.VIR_DOMAIN_RUNNING)
+        defined = self._fake_power_state_domain(
+            -1, 'defined-uuid', libvirt_driver.VIR_DOMAIN_SHUTOFF)
+        deleted = self._fake_power_state_domain(
+            2, 'deleted-uuid', libvirt_driver.VIR_DOMAIN_RUNNING)
+        deleted.info.side_effect = libvirt.libvirtError('deleted')
+        hypervisor = self._fake_power_state_domain(
+            0, 'hypervisor-uuid', libvirt_driver.VIR_DOMAIN_RUNNING)
+        fake_conn = mock.Mock(spec=['listAllDomains'])
+        fake_conn.listAllDomains.return_value = [hypervisor, running,
+                                                 defined, deleted]
+        self.stubs.Set(libvirt_driver.LibvirtDriver, '_conn', fake_conn)
+
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.assertEqual({'running-uuid': power_state.RUNNING,
+                          'defined-uuid': power_state.SHUTDOWN},
+                         conn.get_power_states())
+        fake_conn.listAllDomains.assert_called_once_with(0)
+
+    def test_get_power_states_without_list_all_domains(self):
+        running = self._fake_power_state_domain(
+            1, 'running-uuid', libvirt_driver.VIR_DOMAIN_RUNNING)
+        defined = self._fake_power_state_domain(
+            -1, 'defined-uuid', libvirt_driver.VIR_DOMAIN_SHUTOFF)
+        fake_conn = mock.Mock(spec=['numOfDomains', 'listDomainsID',
+                                    'listDefinedDomains'])
+        fake_conn.numOfDomains.return_value = 1
+        fake_conn.listDomainsID.return_value = [1]
+        fake_conn.listDefinedDomains.return_value = ['defined']
+        self.stubs.Set(libvirt_driver.LibvirtDriver, '_conn', fake_conn)
+
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with contextlib.nested(
+            mock.patch.object(conn, '_lookup_by_id', return_value=running),
+            mock.patch.object(conn, '_lookup_by_name', return_value=defined)
+        ) as (lookup_by_id, lookup_by_name):
+            self.assertEqual({'running-uuid': power_state.RUNNING,
+                              'defined-uuid': power_state.SHUTDOWN},
+                             conn.get_power_states())
+            lookup_by_id.assert_called_once_with(1)
+            lookup_by_name.assert_called_once_with('defined')
+
+    def test_prefetch_image(self):
+        instance = {'image_ref': 'fake-image', 'user_id': 'fake-user',
+                    'project_id': 'fake-project', 'root_gb': 1}
+        base = os.path.join(CONF.instances_path,
+                            CONF.image_cache_subdirectory_name,
+                            imagecache.get_cache_fname(
+                                {'image_id': 'fake-image'}, 'image_id'))
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with mock.patch.object(libvirt_driver.libvirt_utils,
+                               'fetch_image') as fetch_image:
+            conn.prefetch_image(self.context, instance, {})
+            fetch_image.assert_called_once_with(
+                self.context, base, 'fake-image', 'fake-user', 'fake-project',
+                max_size=unit.Gi)
+
+            # Already cached
+            fetch_image.reset_mock()
+            open(base, 'w').close()
+            conn.prefetch_image(self.context, instance, {})
+            self.assertFalse(fetch_image.called)
+
+            # Booted from volume
+            conn.prefetch_image(self.context, {'image_ref': None}, {})
+            self.assertFalse(fetch_image.called)
+
     def test_list_instances_throws_nova_exception(self):
         def fake_lookup(instance_name):
             raise libvirt.libvirtError("we deleted an instance!")
@@ -3411,6 +3493,49 @@ class LibvirtConnTestCase(test.TestCase):
         conn.pre_live_migration(self.context, instance, block_device_info=None,
                                 network_info=[], disk_info={})
 
+    def test_get_instance_disk_info_caches_qcow2_info(self):
+        dummyxml = ("<domain type='kvm'><name>instance-0000000a</name>"
+                    "<devices>"
+                    "<disk type='file'><driver name='qemu' type='qcow2'/>"
+                    "<source file='/test/disk.local'/>"
+                    "<target dev='vdb' bus='virtio'/></disk>"
+                    "</devices></domain>")
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+
+        with contextlib.nested(
+                mock.patch.object(os, 'stat'),
+                mock.patch.object(libvirt_driver.libvirt_utils,
+                                  'get_qcow2_header'),
+                mock.patch.object(libvirt_driver.libvirt_utils,
+                                  'get_disk_backing_file',
+                                  return_value='file'),
+                mock.patch.object(libvirt_driver.disk, 'get_disk_size',
+                                  return_value=20 * unit.Gi)
+        ) as (mock_stat, mock_header, mock_backing_file, mock_disk_size):
+            mock_stat.return_value = fake_stat(3328599655)
+            mock_header.return_value = ('/base/file', 20 * unit.Gi)
+            for i in range(2):
+                info = jsonutils.loads(conn.get_instance_disk_info(
+                    'instance-0000000a', xml=dummyxml))
+                self.assertEqual(20 * unit.Gi, info[0]['virt_disk_size'])
+                self.assertEqual('file', info[0]['backing_file'])
+            # Written to by the guest
+            mock_stat.return_value = fake_stat(3328599656, mtime=1)
+            conn.get_instance_disk_info('instance-0000000a', xml=dummyxml)
+            self.assertEqual(1, mock_disk_size.call_count)
+            self.assertEqual(1, mock_backing_file.call_count)
+
+            # Resized
+            mock_header.return_value = ('/base/file', 30 * unit.Gi)
+            conn.get_instance_disk_info('instance-0000000a', xml=dummyxml)
+            self.assertEqual(2, mock_disk_size.call_count)
+
+            # Replaced by another file
+            mock_stat.return_value = os.stat_result(
+                (0, 2, 0, 1, 0, 0, 3328599656, 0, 1, 0))
+            conn.get_instance_disk_info('instance-0000000a', xml=dummyxml)
+            self.assertEqual(3, mock_disk_size.call_count)
+
     def test_get_instance_disk_info_works_correctly(self):
         # Test data
         instance_ref = db.instance_create(self.context, self.test_instance)
@@ -3438,9 +3563,9 @@ class LibvirtConnTestCase(test.TestCase):
         fake_libvirt_utils.disk_sizes['/test/disk.local'] = 20 * unit.Gi
         fake_libvirt_utils.disk_backing_files['/test/disk.local'] = 'file'
 
-        self.mox.StubOutWithMock(os.path, "getsize")
-        os.path.getsize('/test/disk').AndReturn((10737418240))
-        os.path.getsize('/test/disk.local').AndReturn((3328599655))
+        self.mox.StubOutWithMock(os, "stat")
+        os.stat('/test/disk').AndReturn(fake_stat(10737418240))
+        os.stat('/test/disk.local').AndReturn(fake_stat(3328599655))
 
         ret = ("image: /test/disk\n"
                "file format: raw\n"
@@ -3531,9 +3656,9 @@ class LibvirtConnTestCase(test.TestCase):
         fake_libvirt_utils.disk_sizes['/test/disk.local'] = 20 * unit.Gi
         fake_libvirt_utils.disk_backing_files['/test/disk.local'] = 'file'
 
-        self.mox.StubOutWithMock(os.path, "getsize")
-        os.path.getsize('/test/disk').AndReturn((10737418240))
-        os.path.getsize('/test/disk.local').AndReturn((3328599655))
+        self.mox.StubOutWithMock(os, "stat")
+        os.stat('/test/disk').AndReturn(fake_stat(10737418240))
+        os.stat('/test/disk.local').AndReturn(fake_stat(3328599655))
 
         ret = ("image: /test/disk\n"
                "file format: raw\n"
@@ -4857,6 +4982,8 @@ class LibvirtConnTestCase(test.TestCase):
     def test_disk_over_committed_size_total(self):
         # Ensure destroy calls managedSaveRemove for saved instance.
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        conn._qcow2_disk_info = {'/somepath/disk1': 'info',
+                                 '/gone/disk': 'info'}
 
         def list_instances():
             return ['fake1', 'fake2']
@@ -4879,6 +5006,7 @@ class LibvirtConnTestCase(test.TestCase):
 
         result = conn.get_disk_over_committed_size_total()
         self.assertEqual(result, 10653532160)
+        self.assertEqual(['/somepath/disk1'], conn._qcow2_disk_info.keys())
 
     def test_cpu_info(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
@@ -6966,6 +7094,21 @@ disk size: 4.4M''', ''))
 
         del self.executes
 
+    def test_get_qcow2_header(self):
+        backing_file = '/base/file'
+        header = ('QFI\xfb' + struct.pack('>IQIIQ', 2, 72, len(backing_file),
+                                          16, 20 * unit.Gi))
+        header = header.ljust(72, '\0') + backing_file
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            with open(path, 'wb') as f:
+                f.write(header)
+            self.assertEqual((backing_file, 20 * unit.Gi),
+                             libvirt_utils.get_qcow2_header(path))
+            with open(path, 'wb') as f:
+                f.write('raw data' * 10)
+            self.assertIsNone(libvirt_utils.get_qcow2_header(path))
+
     def test_get_disk_backing_file(self):
         with_actual_path = False
 
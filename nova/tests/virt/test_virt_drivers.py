@@ -24,6 +24,7 @@ import netaddr
 import six
 
 from nova.compute import manager
+from nova.compute import power_state
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -237,6 +238,13 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
         num_instances = self.connection.get_num_instances()
         self.assertEqual(1, num_instances)
 
+    @catch_notimplementederror
+    def test_get_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        power_states = self.connection.get_power_states()
+        self.assertEqual(power_state.RUNNING,
+                         power_states[instance_ref['uuid']])
+
     @catch_notimplementederror
     def test_snapshot_not_running(self):
         instance_ref = test_utils.get_test_instance()
@@ -871,6 +871,9 @@ def last_bytes(file_like_object, num):
 
 
 def metadata_to_dict(metadata):
+    if isinstance(metadata, dict):
+        # NOTE: Already decoded, e.g. by the DB API's manual joins
+        return metadata
     result = {}
     for item in metadata:
         if not item.get('deleted'):
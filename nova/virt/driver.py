@@ -155,6 +155,16 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self):
+        """Return the power states of all the instances on the hypervisor.
+
+        Returns a dict mapping the uuid of every instance known to the
+        virtualization layer to its power_state code, fetched with as few
+        calls to the hypervisor as it allows.  Instances missing from it
+        are not on the hypervisor.
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
@@ -241,6 +251,21 @@ class ComputeDriver(object):
         """
         raise NotImplementedError()
 
+    def prefetch_image(self, context, instance, image_meta):
+        """Fetch the image an instance is going to be spawned from.
+
+        This is called by the compute manager while the networks and block
+        devices of the instance are set up, so that spawn() finds the image
+        in the image cache of the host.  Drivers without an image cache can
+        use the default implementation which does nothing.
+
+        :param context: security context
+        :param instance: Instance object as returned by DB layer.
+        :param image_meta: image object returned by nova.image.glance that
+                           defines the image from which to boot this instance
+        """
+        pass
+
     def destroy(self, context, instance, network_info, block_device_info=None,
                 destroy_disks=True):
         """Destroy (shutdown and delete) the specified instance.
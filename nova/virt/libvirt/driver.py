@@ -378,6 +378,9 @@ class LibvirtDriver(driver.ComputeDriver):
         self._event_queue = None
 
         self._disk_cachemode = None
+        # path: ((inode, qcow2 header), (backing file, virtual size)) of
+        # the qcow2 disks of the instances on this host
+        self._qcow2_disk_info = {}
         self.image_cache_manager = imagecache.ImageCacheManager()
         self.image_backend = imagebackend.Backend(CONF.use_cow_images)
 
@@ -803,6 +806,37 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return list(uuids)
 
+    def get_power_states(self):
+        """Efficient override of base get_power_states method."""
+        if hasattr(self._conn, 'listAllDomains'):
+            # NOTE: Both the running and the defined domains, in one call.
+            domains = self._conn.listAllDomains(0)
+        else:
+            domains = []
+            for domain_id in self.list_instance_ids():
+                try:
+                    domains.append(self._lookup_by_id(domain_id))
+                except exception.InstanceNotFound:
+                    continue
+            for domain_name in self._conn.listDefinedDomains():
+                try:
+                    domains.append(self._lookup_by_name(domain_name))
+                except exception.InstanceNotFound:
+                    continue
+
+        states = {}
+        for domain in domains:
+            try:
+                # We skip domains with ID 0 (hypervisors).
+                if domain.ID() == 0:
+                    continue
+                states[domain.UUIDString()] = (
+                    LIBVIRT_POWER_STATE[domain.info()[0]])
+            except libvirt.libvirtError:
+                # Ignore deleted instance while listing
+                continue
+        return states
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for vif in network_info:
@@ -2152,6 +2186,31 @@ class LibvirtDriver(driver.ComputeDriver):
                           run_as_root=True,
                           check_exit_code=[0, 1])
 
+    def prefetch_image(self, context, instance, image_meta):
+        if not instance['image_ref']:
+            return
+
+        # NOTE: spawn caches the root disk in the same base file, under the
+        # same lock, through the image backend, and finds it fetched.
+        filename = imagecache.get_cache_fname(
+            {'image_id': instance['image_ref']}, 'image_id')
+        base_dir = os.path.join(CONF.instances_path,
+                                CONF.image_cache_subdirectory_name)
+        base = os.path.join(base_dir, filename)
+        lock_path = os.path.join(CONF.instances_path, 'locks')
+
+        @utils.synchronized(filename, external=True, lock_path=lock_path)
+        def fetch_image_sync():
+            if os.path.exists(base):
+                return
+            fileutils.ensure_tree(base_dir)
+            libvirt_utils.fetch_image(context, base, instance['image_ref'],
+                                      instance['user_id'],
+                                      instance['project_id'],
+                                      max_size=instance['root_gb'] * unit.Gi)
+
+        fetch_image_sync()
+
     # NOTE(ilyaalekseyev): Implementation like in multinics
     # for xenapi(tr3buchet)
     def spawn(self, context, instance, image_meta, injected_files,
@@ -4530,12 +4589,13 @@ class LibvirtDriver(driver.ComputeDriver):
 
             # get the real disk size or
             # raise a localized error if image is unavailable
-            dk_size = int(os.path.getsize(path))
+            disk_stat = os.stat(path)
+            dk_size = int(disk_stat.st_size)
 
             disk_type = driver_nodes[cnt].get('type')
             if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+                backing_file, virt_size = self._get_qcow2_disk_info(
+                    path, disk_stat)
                 over_commit_size = int(virt_size) - dk_size
             else:
                 backing_file = ""
@@ -4550,16 +4610,36 @@ class LibvirtDriver(driver.ComputeDriver):
                               'over_committed_disk_size': over_commit_size})
         return jsonutils.dumps(disk_info)
 
+    def _get_qcow2_disk_info(self, path, disk_stat):
+        """Return the backing file and virtual size of a qcow2 disk.
+
+        They are looked up with qemu-img once per path and inode, and again
+        when the qcow2 header shows that the disk was resized or rebased.
+        Guest writes change neither.
+        """
+        header = libvirt_utils.get_qcow2_header(path)
+        stamp = (disk_stat.st_ino, header)
+        cached = self._qcow2_disk_info.get(path)
+        if header is not None and cached is not None and cached[0] == stamp:
+            return cached[1]
+        info = (libvirt_utils.get_disk_backing_file(path),
+                disk.get_disk_size(path))
+        if header is not None:
+            self._qcow2_disk_info[path] = (stamp, info)
+        return info
+
     def get_disk_over_committed_size_total(self):
         """Return total over committed disk size for all instances."""
         # Disk size that all instance uses : virtual_size - disk_size
         instances_name = self.list_instances()
         disk_over_committed_size = 0
+        paths = set()
         for i_name in instances_name:
             try:
                 disk_infos = jsonutils.loads(
                         self.get_instance_disk_info(i_name))
                 for info in disk_infos:
+                    paths.add(info['path'])
                     disk_over_committed_size += int(
                         info['over_committed_disk_size'])
             except OSError as e:
@@ -4573,6 +4653,9 @@ class LibvirtDriver(driver.ComputeDriver):
                 pass
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
+        # Forget about the disks of the instances which are gone
+        for path in set(self._qcow2_disk_info) - paths:
+            del self._qcow2_disk_info[path]
         return disk_over_committed_size
 
     def unfilter_instance(self, instance, network_info):
@@ -22,6 +22,7 @@
 
 import errno
 import os
+import struct
 
 from lxml import etree
 from oslo.config import cfg
@@ -446,6 +447,27 @@ def get_disk_backing_file(path, basename=True):
     return backing_file
 
 
+def get_qcow2_header(path):
+    """Read the backing file and virtual size from the header of a qcow2
+    disk image, without running qemu-img.
+
+    :param path: Path to the disk image
+    :returns: (backing file as stored in the image or None, virtual size),
+              or None if the image is not qcow2
+    """
+    with open(path, 'rb') as f:
+        header = f.read(32)
+        if len(header) < 32 or header[:4] != 'QFI\xfb':
+            return None
+        backing_offset, backing_size, cluster_bits, size = struct.unpack(
+            '>QIIQ', header[8:32])
+        backing_file = None
+        if backing_offset:
+            f.seek(backing_offset)
+            backing_file = f.read(backing_size)
+    return backing_file, size
+
+
 def copy_image(src, dest, host=None):
     """Copy a disk image to an existing directory
 
@@ -223,6 +223,12 @@ class XenAPIDriver(driver.ComputeDriver):
         """
         return self._vmops.list_instance_uuids()
 
+    def get_power_states(self):
+        """Get the power states of the nova instances found on the
+        hypervisor.
+        """
+        return self._vmops.get_power_states()
+
     def spawn(self, context, instance, image_meta, injected_files,
               admin_password, network_info=None, block_device_info=None):
         """Create VM instance."""
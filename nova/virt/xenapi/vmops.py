@@ -211,6 +211,18 @@ class VMOps(object):
                 nova_uuids.append(nova_uuid)
         return nova_uuids
 
+    def get_power_states(self):
+        """Get the power states of the nova instances found on the
+        hypervisor, from a single listing of the VM records.
+        """
+        states = {}
+        for vm_ref, vm_rec in vm_utils.list_vms(self._session):
+            nova_uuid = vm_rec['other_config'].get('nova_uuid')
+            if nova_uuid:
+                states[nova_uuid] = vm_utils.XENAPI_POWER_STATE[
+                    vm_rec['power_state']]
+        return states
+
     def confirm_migration(self, migration, instance, network_info):
         self._destroy_orig_vm(instance, network_info)
 
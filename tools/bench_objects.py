@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for creating objects and accessing their fields.
+
+Compares the field properties of NovaObject with the previous ones, which
+built the storage attribute name and coerced the value on every access, on
+the shape of the resource tracker and API view loops: create many Instance
+objects from values of the types the DB API returns, then read the fields
+used to account for them.
+
+Run like:
+
+    ./tools/bench_objects.py --instances 10000
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+import uuid
+
+from nova.objects import base
+from nova.objects import instance as instance_obj
+
+
+VALUES = {'id': 1, 'host': u'bench-host', 'node': u'bench-node',
+          'vm_state': u'active', 'task_state': None, 'power_state': 1,
+          'memory_mb': 2048, 'vcpus': 2, 'root_gb': 20, 'ephemeral_gb': 0,
+          'instance_type_id': 1, 'project_id': u'bench-project',
+          'user_id': u'bench-user', 'display_name': u'bench',
+          'launched_on': u'bench-host', 'locked': False,
+          'cleaned': False}
+
+ACCOUNTED = ['uuid', 'host', 'node', 'vm_state', 'task_state',
+             'memory_mb', 'vcpus', 'root_gb', 'ephemeral_gb',
+             'instance_type_id', 'project_id']
+
+
+class LegacyInstance(instance_obj.Instance):
+    """Instance with the field properties as they were."""
+
+    def obj_attr_is_set(self, attrname):
+        if attrname not in self.obj_fields:
+            raise AttributeError(attrname)
+        return hasattr(self, base.get_attrname(attrname))
+
+
+def _legacy_properties(cls):
+    for name, field in cls.fields.iteritems():
+
+        def getter(self, name=name):
+            attrname = base.get_attrname(name)
+            if not hasattr(self, attrname):
+                self.obj_load_attr(name)
+            return getattr(self, attrname)
+
+        def setter(self, value, name=name, field=field):
+            self._changed_fields.add(name)
+            if value is None:
+                value = field._null(self, name)
+            else:
+                value = field._type.coerce(self, name, value)
+            return setattr(self, base.get_attrname(name), value)
+
+        setattr(cls, name, property(getter, setter))
+
+
+_legacy_properties(LegacyInstance)
+
+
+def run(cls, uuids):
+    start = time.time()
+    objs = []
+    for inst_uuid in uuids:
+        obj = cls()
+        obj.uuid = inst_uuid
+        for name, value in VALUES.iteritems():
+            obj[name] = value
+        obj.obj_reset_changes()
+        objs.append(obj)
+    created = time.time() - start
+
+    start = time.time()
+    for obj in objs:
+        for name in ACCOUNTED:
+            if obj.obj_attr_is_set(name):
+                obj[name]
+    accessed = time.time() - start
+    return created, accessed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--instances', type=int, default=10000)
+    args = parser.parse_args()
+
+    uuids = [str(uuid.uuid4()) for i in xrange(args.instances)]
+    for name, cls in (('previous', LegacyInstance),
+                      ('current', instance_obj.Instance)):
+        created, accessed = run(cls, uuids)
+        print('%-9s create %8.3fs  access %8.3fs' % (name, created,
+                                                     accessed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for decoding instance metadata on large instance listings.
+
+Compares the legacy shape of the manually-joined metadata (one ORM row per
+metadata item, turned into a dict again by every consumer) with the
+key/value dicts built once by _instances_fill_metadata.  For each mode it
+reports the wall time of the listing plus conversion to Instance objects,
+and the number of objects tracked by the garbage collector that the listing
+keeps alive.
+
+Run like:
+
+    ./tools/db/bench_instance_metadata.py --instances 10000 --sys-meta 12
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import gc
+import time
+import uuid
+
+from oslo.config import cfg
+
+from nova import context
+from nova.db import migration
+from nova.db.sqlalchemy import api as db_api
+from nova.db.sqlalchemy import models
+from nova.objects import instance as instance_obj
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova import utils
+
+
+CONF = cfg.CONF
+
+
+def populate(num_instances, num_sys_meta):
+    migration.db_sync()
+    engine = db_session.get_engine()
+    instances = []
+    sys_meta = []
+    for i in xrange(num_instances):
+        inst_uuid = str(uuid.uuid4())
+        instances.append({'uuid': inst_uuid, 'host': 'bench-host',
+                          'deleted': 0})
+        for n in xrange(num_sys_meta):
+            sys_meta.append({'instance_uuid': inst_uuid,
+                             'key': 'instance_type_key%d' % n,
+                             'value': 'value%d' % n, 'deleted': 0})
+    engine.execute(models.Instance.__table__.insert(), instances)
+    engine.execute(models.InstanceSystemMetadata.__table__.insert(),
+                   sys_meta)
+
+
+def legacy_fill(ctxt, instances):
+    """The previous _instances_fill_metadata: full rows per item."""
+    uuids = [inst['uuid'] for inst in instances]
+    sys_meta = collections.defaultdict(list)
+    rows = db_api.model_query(ctxt, models.InstanceSystemMetadata).\
+        filter(models.InstanceSystemMetadata.instance_uuid.in_(uuids))
+    for row in rows:
+        sys_meta[row['instance_uuid']].append(row)
+    filled = []
+    for inst in instances:
+        inst = dict(inst.iteritems())
+        inst['system_metadata'] = sys_meta[inst['uuid']]
+        inst['metadata'] = []
+        filled.append(inst)
+    return filled
+
+
+def compact_fill(ctxt, instances):
+    return db_api._instances_fill_metadata(ctxt, instances,
+                                           manual_joins=['system_metadata'])
+
+
+def run(ctxt, fill):
+    instances = db_api.model_query(ctxt, models.Instance).\
+        filter_by(host='bench-host').all()
+    gc.collect()
+    before = len(gc.get_objects())
+    start = time.time()
+    db_instances = fill(ctxt, instances)
+    dicts = [utils.instance_sys_meta(inst) for inst in db_instances]
+    objs = [instance_obj.Instance._from_db_object(
+                ctxt, instance_obj.Instance(), inst,
+                expected_attrs=['system_metadata'])
+            for inst in db_instances]
+    elapsed = time.time() - start
+    gc.collect()
+    live = len(gc.get_objects()) - before
+    del dicts, objs, db_instances
+    return elapsed, live
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--instances', type=int, default=10000)
+    parser.add_argument('--sys-meta', type=int, default=12,
+                        help='system_metadata items per instance')
+    args = parser.parse_args()
+
+    CONF([], project='nova')
+    CONF.set_override('connection', 'sqlite://', group='database')
+    populate(args.instances, args.sys_meta)
+    ctxt = context.get_admin_context()
+
+    for name, fill in (('legacy rows', legacy_fill),
+                       ('compact dicts', compact_fill)):
+        elapsed, live = run(ctxt, fill)
+        print('%-14s %8.3fs  %9d live objects' % (name, elapsed, live))
+
+
+if __name__ == '__main__':
+    main()